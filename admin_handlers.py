@@ -1,16 +1,40 @@
 # admin_handlers.py
+import html
+import logging
+import re
 from datetime import datetime, timedelta
-from aiogram import Router, F, Bot
+from typing import List, Optional, Tuple
+from aiogram import Router
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
+from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, BufferedInputFile
 
 from config import BARBER_CHAT_ID
-from database import BookingDAO, BarberDayOffDAO
-from keyboards import get_admin_keyboard, get_dayoff_dates_keyboard
+from config import BOOKING_DAYS_AHEAD, PROFILE_MAX_SECONDS
+from database import BookingDAO, BarberDayOffDAO, BarberDayOffRuleDAO, ScheduleDAO, StatsDAO, WaitlistDAO, SearchDAO
+from diagnostics import profile, watchdog
+from middlewares import UserSerialMiddleware
+from dayoffs import day_offs, DayOffIndex, DATE_FORMAT, WEEKDAY_NAMES, describe_rule, parse_date
+from keyboards import get_admin_keyboard, get_dayoff_calendar, get_dayoff_dates_keyboard
+import schedule
+from callbacks import (
+    CallbackTable,
+    DayOffSelectCB,
+    DayOffMonthCB,
+    DayOffRemoveCB,
+    RuleRemoveCB,
+    WeekdayCB,
+    day_to_date,
+)
 
 router = Router()
+callbacks = CallbackTable()
+logger = logging.getLogger(__name__)
+
+# Код услуги уходит в callback_data (ServiceCB, RepeatCB, WaitlistBookCB):
+# без разделителя ":" и достаточно короткий для лимита в 64 байта
+SERVICE_CODE_RE = re.compile(r"[a-z0-9_]{1,20}")
 
 
 # Проверка, является ли пользователь барбером
@@ -41,7 +65,267 @@ async def cmd_admin(message: Message):
     )
 
 
-@router.callback_query(F.data == "admin_back")
+# Идет ли сейчас /profile (семплировать два раза одновременно бессмысленно)
+_profiling = False
+
+
+@router.message(Command("profile"))
+async def cmd_profile(message: Message, user_serial: Optional[UserSerialMiddleware] = None):
+    """Профиль работающего бота: /profile [секунд]"""
+    if not is_barber(message.from_user.id):
+        await message.answer("⛔ У вас нет доступа к этой команде.")
+        return
+    
+    parts = message.text.split()
+    seconds = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 10
+    seconds = max(1, min(seconds, PROFILE_MAX_SECONDS))
+    
+    global _profiling
+    if _profiling:
+        await message.answer("⏳ Профилирование уже идет, дождитесь отчета.")
+        return
+    
+    _profiling = True
+    try:
+        await message.answer(f"⏱ Профилирую {seconds} с...")
+        report = await profile(seconds, watchdog, user_serial.stats if user_serial else None)
+    finally:
+        _profiling = False
+    
+    await message.answer_document(
+        BufferedInputFile(report.encode("utf-8"), filename=f"profile_{datetime.now():%Y%m%d_%H%M%S}.txt"),
+        caption=f"📈 Профиль за {seconds} с"
+    )
+
+
+async def build_report(days: int = 0) -> str:
+    """Отчет по выручке и загрузке из сводных таблиц (days=0 - текущая неделя)"""
+    today = datetime.now()
+    if days > 0:
+        start, end = today - timedelta(days=days - 1), today
+    else:
+        start = today - timedelta(days=today.weekday())
+        end = start + timedelta(days=6)
+    
+    start_iso, end_iso = start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+    daily = await StatsDAO.get_daily(start_iso, end_iso)
+    hourly = await StatsDAO.get_hourly(start_iso, end_iso)
+    
+    title = f"📊 <b>Отчет за {start.strftime('%d.%m')}–{end.strftime('%d.%m.%Y')}</b>\n\n"
+    if not daily:
+        return title + "Записей за период нет."
+    
+    by_day, by_service = {}, {}
+    for row in daily:
+        day = by_day.setdefault(row.stat_date, [0, 0])
+        day[0] += row.bookings_count
+        day[1] += row.revenue
+        service = by_service.setdefault(row.service_type, [0, 0])
+        service[0] += row.bookings_count
+        service[1] += row.revenue
+    
+    total_count = sum(row.bookings_count for row in daily)
+    total_revenue = sum(row.revenue for row in daily)
+    total_minutes = sum(row.occupied_minutes for row in daily)
+    
+    text = title
+    text += f"💰 <b>Выручка:</b> {total_revenue}₽\n"
+    text += f"📋 <b>Записей:</b> {total_count}\n"
+    text += f"⏱ <b>Занято:</b> {total_minutes // 60} ч {total_minutes % 60} мин\n\n"
+    
+    text += "<b>По дням:</b>\n"
+    for stat_date, (count, revenue) in by_day.items():
+        year, month, day = stat_date.split("-")
+        text += f"📅 {day}.{month} — {count} зап., {revenue}₽\n"
+    
+    text += "\n<b>По услугам:</b>\n"
+    for service_type, (count, revenue) in sorted(by_service.items(), key=lambda item: -item[1][1]):
+        service = schedule.get_service(service_type)
+        name = f"{service.emoji} {service.name}" if service else service_type
+        text += f"{name} — {count} зап., {revenue}₽\n"
+    
+    busiest = sorted((row for row in hourly if row[1] > 0), key=lambda row: -row[1])[:5]
+    if busiest:
+        text += "\n<b>🔥 Самые загруженные часы:</b>\n"
+        for hour, count, minutes in busiest:
+            text += f"🕐 {hour:02d}:00 — {count} зап., {minutes} мин\n"
+    
+    return text
+
+
+@router.message(Command("report"))
+async def cmd_report(message: Message):
+    """Отчет по выручке и загрузке: /report [дней]"""
+    if not is_barber(message.from_user.id):
+        await message.answer("⛔ У вас нет доступа к этой команде.")
+        return
+    
+    parts = message.text.split()
+    days = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0
+    
+    await message.answer(await build_report(days), parse_mode='HTML')
+
+
+@router.message(Command("rebuild_stats"))
+async def cmd_rebuild_stats(message: Message):
+    """Пересчитать сводную статистику по истории записей"""
+    if not is_barber(message.from_user.id):
+        await message.answer("⛔ У вас нет доступа к этой команде.")
+        return
+    
+    processed = await StatsDAO.rebuild()
+    
+    await message.answer(
+        f"✅ <b>Статистика пересчитана</b>\n\nОбработано записей: {processed}",
+        parse_mode='HTML'
+    )
+
+
+@router.message(Command("export"))
+async def cmd_export(message: Message):
+    """Выгрузка всех записей: /export [csv|json] [gz]"""
+    if not is_barber(message.from_user.id):
+        await message.answer("⛔ У вас нет доступа к этой команде.")
+        return
+    
+    args = message.text.split()[1:]
+    fmt = "json" if "json" in args else "csv"
+    compress = "gz" in args or "gzip" in args
+    
+    from export import export_bookings  # Нужен редко, не грузим при старте
+    
+    document = await export_bookings(fmt, compress)
+    try:
+        await message.answer_document(document, caption=f"📤 Выгрузка записей ({fmt.upper()})")
+    finally:
+        document.close()
+
+
+WEEKDAY_SHORT = ["пн", "вт", "ср", "чт", "пт", "сб", "вс"]
+
+
+def parse_weekday(value: str) -> Optional[int]:
+    """Номер дня недели из 1-7 или пн..вс"""
+    value = value.lower()
+    if value in WEEKDAY_SHORT:
+        return WEEKDAY_SHORT.index(value)
+    if value.isdigit() and 1 <= int(value) <= 7:
+        return int(value) - 1
+    return None
+
+
+def build_schedule_text() -> str:
+    """Текущий график и услуги"""
+    current = schedule.current()
+    
+    text = "🕐 <b>График работы:</b>\n\n"
+    for weekday, slots in enumerate(current.slots):
+        hours = f"{slots[0]}–{slots[-1]}, слотов: {len(slots)}" if slots else "выходной"
+        text += f"<b>{WEEKDAY_SHORT[weekday]}</b>: {hours}\n"
+    
+    text += "\n💈 <b>Услуги:</b>\n\n"
+    for service in current.services.values():
+        text += f"{service.emoji} <code>{service.code}</code> {service.name} — {service.price}₽, {service.duration} мин\n"
+    
+    text += (
+        "\n<b>Изменить:</b>\n"
+        "<code>/hours пн 10:00 19:00 [шаг]</code> или <code>/hours пн off</code>\n"
+        "<code>/service код цена минут эмодзи Название</code> или <code>/service код off</code>"
+    )
+    return text
+
+
+@callbacks.route("admin_schedule")
+async def admin_schedule(callback: CallbackQuery):
+    """Просмотр графика и услуг"""
+    if not is_barber(callback.from_user.id):
+        await callback.answer("⛔ Нет доступа", show_alert=True)
+        return
+    
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data="admin_back")]
+    ])
+    
+    await callback.message.edit_text(build_schedule_text(), reply_markup=keyboard, parse_mode='HTML')
+    await callback.answer()
+
+
+@router.message(Command("hours"))
+async def cmd_hours(message: Message):
+    """Рабочие часы: /hours пн 10:00 19:00 [шаг] или /hours пн off"""
+    if not is_barber(message.from_user.id):
+        await message.answer("⛔ У вас нет доступа к этой команде.")
+        return
+    
+    args = message.text.split()[1:]
+    weekday = parse_weekday(args[0]) if args else None
+    
+    if weekday is not None and len(args) == 2 and args[1].lower() == "off":
+        await ScheduleDAO.set_working_hours(weekday, "00:00", "00:00", is_working=False)
+    elif weekday is not None and len(args) in (3, 4):
+        try:
+            start, end = (datetime.strptime(value, "%H:%M").strftime("%H:%M") for value in args[1:3])
+            step = int(args[3]) if len(args) == 4 else 30
+        except ValueError:
+            start = end = None
+            step = 0
+        if start is None or end < start or not 5 <= step <= 240:
+            await message.answer("❌ Неверное время или шаг (5–240 минут).")
+            return
+        await ScheduleDAO.set_working_hours(weekday, start, end, step)
+    else:
+        await message.answer(build_schedule_text(), parse_mode='HTML')
+        return
+    
+    await schedule.reload()
+    await message.answer("✅ <b>График обновлен</b>\n\n" + build_schedule_text(), parse_mode='HTML')
+
+
+@router.message(Command("service"))
+async def cmd_service(message: Message):
+    """Услуга: /service код цена минут эмодзи Название или /service код off"""
+    if not is_barber(message.from_user.id):
+        await message.answer("⛔ У вас нет доступа к этой команде.")
+        return
+    
+    args = message.text.split(maxsplit=5)[1:]
+    
+    if len(args) == 2 and args[1].lower() == "off":
+        if not await ScheduleDAO.set_service_active(args[0], False):
+            await message.answer(f"❌ Услуга <code>{args[0]}</code> не найдена", parse_mode='HTML')
+            return
+    elif len(args) == 5 and args[1].isdigit() and args[2].isdigit():
+        if not SERVICE_CODE_RE.fullmatch(args[0]):
+            await message.answer(
+                "❌ Код услуги - до 20 символов: латинские строчные буквы, цифры и <code>_</code>",
+                parse_mode='HTML'
+            )
+            return
+        await ScheduleDAO.upsert_service(args[0], args[4], int(args[1]), int(args[2]), args[3])
+    else:
+        await message.answer(build_schedule_text(), parse_mode='HTML')
+        return
+    
+    await schedule.reload()
+    await message.answer("✅ <b>Услуги обновлены</b>\n\n" + build_schedule_text(), parse_mode='HTML')
+
+
+@callbacks.route("admin_report")
+async def admin_report(callback: CallbackQuery):
+    """Отчет за текущую неделю"""
+    if not is_barber(callback.from_user.id):
+        await callback.answer("⛔ Нет доступа", show_alert=True)
+        return
+    
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data="admin_back")]
+    ])
+    
+    await callback.message.edit_text(await build_report(), reply_markup=keyboard, parse_mode='HTML')
+    await callback.answer()
+
+
+@callbacks.route("admin_back")
 async def admin_back(callback: CallbackQuery, state: FSMContext):
     """Вернуться в главное меню админки"""
     await state.clear()
@@ -56,52 +340,58 @@ async def admin_back(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
-@router.callback_query(F.data == "admin_add_dayoff")
+@callbacks.route("admin_add_dayoff")
 async def admin_add_dayoff(callback: CallbackQuery, state: FSMContext):
     """Добавить выходной день"""
     if not is_barber(callback.from_user.id):
         await callback.answer("⛔ Нет доступа", show_alert=True)
         return
     
-    # Создаем клавиатуру с датами на 30 дней вперед
-    keyboard = []
-    today = datetime.now()
-    
-    for i in range(1, 31):  # Начинаем с завтрашнего дня
-        date = today + timedelta(days=i)
-        date_str = date.strftime("%d.%m.%Y")
-        day_name = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"][date.weekday()]
-        
-        button_text = f"{day_name} {date_str}"
-        
-        keyboard.append([
-            InlineKeyboardButton(
-                text=button_text,
-                callback_data=f"select_dayoff_date_{date_str}"
-            )
-        ])
-    
-    # Кнопка "Назад"
-    keyboard.append([
-        InlineKeyboardButton(text="⬅️ Назад", callback_data="admin_back")
-    ])
+    keyboard = await get_dayoff_calendar()
     
     await callback.message.edit_text(
-        "📅 <b>Выберите дату для выходного:</b>",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard),
+        "📅 <b>Выберите дату для выходного:</b>\n\n"
+        "<i>🔴 - все время занято (записи будут отменены), ✖ - уже выходной</i>",
+        reply_markup=keyboard,
         parse_mode='HTML'
     )
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("select_dayoff_date_"))
-async def select_dayoff_date(callback: CallbackQuery, state: FSMContext):
+@callbacks.route(DayOffMonthCB)
+async def page_dayoff_calendar(callback: CallbackQuery, callback_data: DayOffMonthCB):
+    """Листание календаря выбора выходного"""
+    if not is_barber(callback.from_user.id):
+        await callback.answer("⛔ Нет доступа", show_alert=True)
+        return
+    
+    keyboard = await get_dayoff_calendar(callback_data.month)
+    await callback.message.edit_reply_markup(reply_markup=keyboard)
+    await callback.answer()
+
+
+@callbacks.route("dayoff_already")
+async def select_dayoff_already(callback: CallbackQuery):
+    """Нажатие на день, который уже выходной, в календаре выбора выходного"""
+    await callback.answer(
+        "✖ Этот день уже выходной или нерабочий по графику. "
+        "Снять выходной можно в «Удалить выходной», график - командой /hours.",
+        show_alert=True
+    )
+
+
+@callbacks.route(DayOffSelectCB)
+async def select_dayoff_date(callback: CallbackQuery, callback_data: DayOffSelectCB, state: FSMContext):
     """Обработка выбора даты для выходного"""
-    date = callback.data.replace("select_dayoff_date_", "")
+    if not is_barber(callback.from_user.id):
+        await callback.answer("⛔ Нет доступа", show_alert=True)
+        return
+    
+    date = day_to_date(callback_data.day)
     
     # Проверяем, не является ли уже выходным
-    existing = await BarberDayOffDAO.get_by_date(date)
-    if existing:
+    await day_offs.ensure_loaded()
+    if day_offs.is_off(date):
         await callback.answer(f"❌ {date} уже отмечен как выходной", show_alert=True)
         return
     
@@ -117,31 +407,9 @@ async def select_dayoff_date(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
-@router.message(AdminStates.waiting_for_dayoff_reason)
-async def process_dayoff_reason(message: Message, state: FSMContext, bot: Bot):
-    """Обработка причины выходного"""
-    reason = message.text.strip()
-    if reason == "-":
-        reason = None
-    
-    data = await state.get_data()
-    date = data.get('dayoff_date')
-    
-    # Добавляем выходной день
-    day_off = await BarberDayOffDAO.create(date, reason)
-    
-    # Отменяем все активные записи на эту дату
-    bookings = await BookingDAO.get_by_date(date)
-    cancelled_count = 0
-    
-    for booking in bookings:
-        success = await BookingDAO.cancel(booking.id)
-        if success:
-            cancelled_count += 1
-            
-            # Уведомляем клиента об отмене
-            try:
-                client_message = f"""
+def notify_cancelled_client(booking) -> List[Tuple[int, str]]:
+    """Уведомление клиенту об отмене записи из-за выходного (отправляется через outbox)"""
+    client_message = f"""
 ❌ <b>Запись отменена!</b>
 
 Ваша запись на {booking.booking_date} в {booking.booking_time} была отменена, так как это день выходного барбера.
@@ -154,15 +422,24 @@ async def process_dayoff_reason(message: Message, state: FSMContext, bot: Bot):
 Для новой записи используйте /book
 
 Приносим извинения за неудобства! 😔
-                """
-                
-                await bot.send_message(
-                    chat_id=booking.user_telegram_id,
-                    text=client_message,
-                    parse_mode='HTML'
-                )
-            except Exception as e:
-                print(f"Ошибка отправки уведомления клиенту: {e}")
+    """
+    return [(booking.user_telegram_id, client_message)]
+
+
+@router.message(AdminStates.waiting_for_dayoff_reason)
+async def process_dayoff_reason(message: Message, state: FSMContext):
+    """Обработка причины выходного"""
+    reason = message.text.strip()
+    if reason == "-":
+        reason = None
+    
+    data = await state.get_data()
+    date = data.get('dayoff_date')
+    
+    # Добавляем выходной день и одним пакетом отменяем записи на эту дату
+    added, cancelled = await BarberDayOffDAO.create_many([date], reason, outbox=notify_cancelled_client)
+    await day_offs.load()
+    cancelled_count = len(cancelled)
     
     # Отправляем подтверждение барберу
     reason_text = f" ({reason})" if reason else ""
@@ -185,7 +462,136 @@ async def process_dayoff_reason(message: Message, state: FSMContext, bot: Bot):
     )
 
 
-@router.callback_query(F.data == "admin_remove_dayoff")
+@router.message(Command("dayoffs"))
+async def cmd_dayoffs(message: Message):
+    """Добавить несколько выходных сразу: /dayoffs DD.MM.YYYY DD.MM.YYYY ..."""
+    if not is_barber(message.from_user.id):
+        await message.answer("⛔ У вас нет доступа к этой команде.")
+        return
+    
+    try:
+        dates = sorted({parse_date(arg).strftime(DATE_FORMAT) for arg in message.text.split()[1:]},
+                       key=parse_date)
+    except ValueError:
+        dates = []
+    
+    if not dates:
+        await message.answer(
+            "Использование: <code>/dayoffs 01.11.2026 02.11.2026 ...</code>",
+            parse_mode='HTML'
+        )
+        return
+    
+    # Прошедшие даты не трогаем: их записи уже история, статистика и клиенты
+    today = datetime.now().date()
+    past = [date for date in dates if parse_date(date) < today]
+    if past:
+        await message.answer(f"❌ Эти даты уже прошли: {', '.join(past)}")
+        return
+    
+    added, cancelled = await BarberDayOffDAO.create_many(dates, outbox=notify_cancelled_client)
+    await day_offs.load()
+    
+    await message.answer(
+        f"✅ <b>Добавлено выходных:</b> {len(added)} из {len(dates)}\n"
+        f"❌ <b>Отменено записей:</b> {len(cancelled)}",
+        parse_mode='HTML'
+    )
+
+
+@router.message(Command("vacation"))
+async def cmd_vacation(message: Message):
+    """Отпуск на период: /vacation DD.MM.YYYY DD.MM.YYYY [причина]"""
+    if not is_barber(message.from_user.id):
+        await message.answer("⛔ У вас нет доступа к этой команде.")
+        return
+    
+    parts = message.text.split(maxsplit=3)
+    try:
+        start, end = parse_date(parts[1]), parse_date(parts[2])
+    except (IndexError, ValueError):
+        start = end = None
+    
+    if start is None or end < start:
+        await message.answer(
+            "Использование: <code>/vacation 01.11.2026 10.11.2026 [причина]</code>",
+            parse_mode='HTML'
+        )
+        return
+    
+    reason = parts[3] if len(parts) > 3 else None
+    cancel_dates = DayOffIndex.expand_rule(
+        datetime.now().date(), BOOKING_DAYS_AHEAD, range_start=start, range_end=end
+    )
+    rule, cancelled = await BarberDayOffRuleDAO.create(
+        "range",
+        start_date=start.strftime(DATE_FORMAT),
+        end_date=end.strftime(DATE_FORMAT),
+        reason=reason,
+        cancel_dates=cancel_dates,
+        outbox=notify_cancelled_client
+    )
+    await day_offs.load()
+    
+    await message.answer(
+        f"✅ <b>Период выходных добавлен!</b>\n\n"
+        f"📅 {rule.start_date} – {rule.end_date}" + (f" ({reason})" if reason else "") +
+        f"\n❌ <b>Отменено записей:</b> {len(cancelled)}",
+        parse_mode='HTML'
+    )
+
+
+@callbacks.route("admin_weekly_dayoff")
+async def admin_weekly_dayoff(callback: CallbackQuery):
+    """Выбор дня недели для еженедельного выходного"""
+    if not is_barber(callback.from_user.id):
+        await callback.answer("⛔ Нет доступа", show_alert=True)
+        return
+    
+    keyboard = [
+        [InlineKeyboardButton(text=name, callback_data=WeekdayCB(weekday=weekday).pack())]
+        for weekday, name in enumerate(WEEKDAY_NAMES)
+    ]
+    keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="admin_back")])
+    
+    await callback.message.edit_text(
+        "🔁 <b>Выберите день недели, который всегда будет выходным:</b>",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard),
+        parse_mode='HTML'
+    )
+    await callback.answer()
+
+
+@callbacks.route(WeekdayCB, idempotent=True)
+async def select_weekly_dayoff(callback: CallbackQuery, callback_data: WeekdayCB):
+    """Добавление еженедельного выходного"""
+    if not is_barber(callback.from_user.id):
+        await callback.answer("⛔ Нет доступа", show_alert=True)
+        return
+    
+    weekday = callback_data.weekday
+    await day_offs.ensure_loaded()
+    if day_offs.is_weekly_off(weekday):
+        await callback.answer(f"❌ {WEEKDAY_NAMES[weekday]} уже выходной", show_alert=True)
+        return
+    
+    cancel_dates = DayOffIndex.expand_rule(datetime.now().date(), BOOKING_DAYS_AHEAD, weekday=weekday)
+    rule, cancelled = await BarberDayOffRuleDAO.create(
+        "weekly", weekday=weekday, cancel_dates=cancel_dates, outbox=notify_cancelled_client
+    )
+    await day_offs.load()
+    
+    cancelled_text = f"\n\n❌ Отменено записей: {len(cancelled)}" if cancelled else ""
+    await callback.message.edit_text(
+        f"✅ <b>Еженедельный выходной добавлен!</b>\n\n"
+        f"🔁 {describe_rule(rule)}{cancelled_text}",
+        reply_markup=get_admin_keyboard(),
+        parse_mode='HTML'
+    )
+    await callback.answer()
+
+
+@callbacks.route("admin_remove_dayoff")
 async def admin_remove_dayoff(callback: CallbackQuery):
     """Удалить выходной день"""
     if not is_barber(callback.from_user.id):
@@ -202,14 +608,22 @@ async def admin_remove_dayoff(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("remove_dayoff_"))
-async def remove_dayoff(callback: CallbackQuery):
+@callbacks.route(DayOffRemoveCB, idempotent=True)
+async def remove_dayoff(callback: CallbackQuery, callback_data: DayOffRemoveCB):
     """Обработка удаления выходного дня"""
-    date = callback.data.replace("remove_dayoff_", "")
+    if not is_barber(callback.from_user.id):
+        await callback.answer("⛔ Нет доступа", show_alert=True)
+        return
+    
+    date = day_to_date(callback_data.day)
     
     success = await BarberDayOffDAO.delete(date)
     
     if success:
+        await day_offs.load()
+        # День снова рабочий - свободные слоты получают ожидающие клиенты
+        if not day_offs.is_off(date):
+            await WaitlistDAO.hold_free_slots([date])
         await callback.answer(f"✅ Выходной {date} удален", show_alert=True)
         
         # Возвращаемся к списку выходных
@@ -223,7 +637,32 @@ async def remove_dayoff(callback: CallbackQuery):
         await callback.answer(f"❌ Ошибка удаления", show_alert=True)
 
 
-@router.callback_query(F.data == "admin_view_dayoffs")
+@callbacks.route(RuleRemoveCB, idempotent=True)
+async def remove_dayoff_rule(callback: CallbackQuery, callback_data: RuleRemoveCB):
+    """Обработка удаления правила выходных"""
+    if not is_barber(callback.from_user.id):
+        await callback.answer("⛔ Нет доступа", show_alert=True)
+        return
+    
+    success = await BarberDayOffRuleDAO.delete(callback_data.rule_id)
+    
+    if success:
+        await day_offs.load()
+        freed_dates = [date for date in await WaitlistDAO.get_waiting_dates() if not day_offs.is_off(date)]
+        await WaitlistDAO.hold_free_slots(freed_dates)
+        await callback.answer("✅ Правило удалено", show_alert=True)
+        
+        keyboard = await get_dayoff_dates_keyboard()
+        await callback.message.edit_text(
+            "🗑 <b>Выберите выходной день для удаления:</b>",
+            reply_markup=keyboard,
+            parse_mode='HTML'
+        )
+    else:
+        await callback.answer("❌ Ошибка удаления", show_alert=True)
+
+
+@callbacks.route("admin_view_dayoffs")
 async def admin_view_dayoffs(callback: CallbackQuery):
     """Просмотр всех выходных дней"""
     if not is_barber(callback.from_user.id):
@@ -231,14 +670,22 @@ async def admin_view_dayoffs(callback: CallbackQuery):
         return
     
     days_off = await BarberDayOffDAO.get_upcoming(30)
+    rules = await BarberDayOffRuleDAO.get_all()
     
-    if not days_off:
+    if not days_off and not rules:
         text = "📅 <b>Выходные дни не установлены</b>"
     else:
-        text = "📅 <b>Ближайшие выходные дни:</b>\n\n"
-        for day_off in days_off:
-            reason_text = f" - {day_off.reason}" if day_off.reason else ""
-            text += f"❌ <b>{day_off.date}</b>{reason_text}\n"
+        text = ""
+        if rules:
+            text += "🔁 <b>Правила выходных:</b>\n\n"
+            for rule in rules:
+                text += f"❌ <b>{describe_rule(rule)}</b>\n"
+            text += "\n"
+        if days_off:
+            text += "📅 <b>Ближайшие выходные дни:</b>\n\n"
+            for day_off in days_off:
+                reason_text = f" - {day_off.reason}" if day_off.reason else ""
+                text += f"❌ <b>{day_off.date}</b>{reason_text}\n"
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="⬅️ Назад", callback_data="admin_back")]
@@ -248,7 +695,50 @@ async def admin_view_dayoffs(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data == "admin_view_bookings")
+STATUS_ICONS = {"active": "🟢", "completed": "✅", "cancelled": "❌"}
+
+
+@router.message(Command("find"))
+async def cmd_find(message: Message):
+    """Поиск клиента и его записей: /find имя, @username или часть телефона"""
+    if not is_barber(message.from_user.id):
+        await message.answer("⛔ У вас нет доступа к этой команде.")
+        return
+    
+    query = message.text.partition(" ")[2].strip()
+    users, bookings = await SearchDAO.search(query, limit=15)
+    
+    if not users and not bookings:
+        if len(query) < SearchDAO.MIN_QUERY_LENGTH:
+            await message.answer(
+                f"🔎 Использование: <code>/find текст</code> (от {SearchDAO.MIN_QUERY_LENGTH} символов)\n\n"
+                f"Ищет по имени, @username и любой части телефона.",
+                parse_mode='HTML'
+            )
+        else:
+            await message.answer(f"🔎 По запросу «{html.escape(query)}» ничего не найдено.")
+        return
+    
+    text = f"🔎 <b>Поиск:</b> {html.escape(query)}\n\n"
+    if users:
+        text += "<b>👥 Клиенты:</b>\n"
+        for user in users:
+            username = f" (@{html.escape(user.username)})" if user.username else ""
+            text += f"👤 {html.escape(user.full_name)}{username}\n📞 {html.escape(user.phone)} · ID <code>{user.telegram_id}</code>\n"
+        text += "\n"
+    if bookings:
+        text += "<b>📋 Записи:</b>\n"
+        for booking in bookings:
+            text += (
+                f"{STATUS_ICONS.get(booking.status, '•')} <code>{booking.id}</code> "
+                f"{booking.booking_date} в {booking.booking_time} · {html.escape(booking.user_name)}, "
+                f"{html.escape(booking.user_phone)} · {booking.service_name}\n"
+            )
+    
+    await message.answer(text, parse_mode='HTML')
+
+
+@callbacks.route("admin_view_bookings")
 async def admin_view_bookings(callback: CallbackQuery):
     """Просмотр всех активных записей"""
     if not is_barber(callback.from_user.id):
@@ -277,4 +767,8 @@ async def admin_view_bookings(callback: CallbackQuery):
     ])
     
     await callback.message.edit_text(text, reply_markup=keyboard, parse_mode='HTML')
-    await callback.answer()
\ No newline at end of file
+    await callback.answer()
+
+
+# Один обработчик callback-запросов с компактными данными для всего роутера
+callbacks.attach(router)
@@ -0,0 +1,175 @@
+# availability.py - Занятость слотов по дням и поиск ближайшего свободного времени
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from callbacks import time_to_minute
+from config import BOOKING_DAYS_AHEAD
+from database import BookingDAO, booking_change_listeners
+from dayoffs import day_offs
+import schedule
+
+
+def horizon_dates(now: Optional[datetime] = None, days: int = BOOKING_DAYS_AHEAD) -> List[str]:
+    """Даты горизонта записи начиная с сегодняшней"""
+    now = now or datetime.now()
+    return [(now + timedelta(days=i)).strftime("%d.%m.%Y") for i in range(days)]
+
+
+# Кэш битовых карт занятости по датам. Сбрасывается по датам при изменении
+# записей и целиком при смене графика (битовые карты привязаны к слотам)
+OCCUPANCY_CACHE_SIZE = 128
+
+_cache: Dict[str, int] = {}
+_cache_schedule = None
+_generation = 0
+
+
+def invalidate(dates: Optional[Iterable[str]] = None) -> None:
+    """Сбросить кэш занятости для дат (или целиком)"""
+    global _generation
+    _generation += 1
+    if dates is None:
+        _cache.clear()
+    else:
+        for date in dates:
+            _cache.pop(date, None)
+
+
+booking_change_listeners.append(invalidate)
+
+
+async def _query_occupancy(dates: List[str], current) -> Dict[str, int]:
+    occupancy = dict.fromkeys(dates, 0)
+
+    for date, time in await BookingDAO.get_busy_slots(dates):
+        index = current.slot_index[datetime.strptime(date, "%d.%m.%Y").weekday()].get(time)
+        if index is not None:
+            occupancy[date] |= 1 << index
+
+    return occupancy
+
+
+async def load_occupancy(dates: List[str]) -> Dict[str, int]:
+    """
+    Битовые карты занятости по датам: бит i установлен, если занят i-й слот
+    графика этого дня недели. Даты, которых нет в кэше, читаются одним запросом.
+    """
+    global _cache_schedule
+    current = schedule.current()
+    if _cache_schedule is not current:
+        invalidate()
+        _cache_schedule = current
+
+    occupancy = {date: _cache[date] for date in dates if date in _cache}
+    missing = [date for date in dates if date not in occupancy]
+    if missing:
+        generation = _generation
+        fresh = await _query_occupancy(missing, current)
+        # Если за время запроса записи изменились, результат в кэш не кладем
+        if generation == _generation and _cache_schedule is current:
+            if len(_cache) + len(fresh) > OCCUPANCY_CACHE_SIZE:
+                _cache.clear()
+            _cache.update(fresh)
+        occupancy.update(fresh)
+
+    return occupancy
+
+
+def past_slots_mask(slots, now: datetime) -> int:
+    """Маска слотов сегодняшнего дня, время которых уже прошло"""
+    current_time = now.strftime("%H:%M")
+    mask = 0
+    for i, time in enumerate(slots):
+        if time <= current_time:
+            mask |= 1 << i
+    return mask
+
+
+async def find_nearest(limit: int, now: Optional[datetime] = None) -> List[Tuple[str, str]]:
+    """Первые limit свободных слотов (дата, время) в горизонте записи"""
+    now = now or datetime.now()
+    current = schedule.current()
+    await day_offs.ensure_loaded()
+
+    dates = [
+        date for date in horizon_dates(now)
+        if not day_offs.is_off(date) and current.slots_for(date)
+    ]
+    occupancy = await load_occupancy(dates)
+
+    result = []
+    for date in dates:
+        slots = current.slots_for(date)
+        taken = occupancy[date]
+        if date == now.strftime("%d.%m.%Y"):
+            taken |= past_slots_mask(slots, now)
+
+        for i, time in enumerate(slots):
+            if not taken >> i & 1:
+                result.append((date, time))
+                if len(result) >= limit:
+                    return result
+
+    return result
+
+
+async def find_repeat_slot(
+    history: List[Tuple[str, str, str]],
+    now: Optional[datetime] = None
+) -> Optional[Tuple[str, str, str]]:
+    """
+    Слот для повтора записи по истории клиента (дата, время, услуга; новые
+    первыми): последняя услуга, самый частый день недели и время. Выбирается
+    ближайший день с тем же днем недели, где есть свободное время, и на нем
+    время, ближайшее к привычному; если такого дня нет - любой ближайший.
+    Возвращает (дата, время, услуга) или None.
+    """
+    if not history:
+        return None
+    now = now or datetime.now()
+    service = history[0][2]
+    # При равной частоте побеждает более свежая привычка (Counter хранит порядок вставки)
+    weekday, minute = Counter(
+        (datetime.strptime(date, "%d.%m.%Y").weekday(), time_to_minute(time)) for date, time, _ in history
+    ).most_common(1)[0][0]
+
+    current = schedule.current()
+    await day_offs.ensure_loaded()
+    dates = [
+        date for date in horizon_dates(now)
+        if not day_offs.is_off(date) and current.slots_for(date)
+    ]
+    occupancy = await load_occupancy(dates)
+
+    best, best_key = None, None
+    for order, date in enumerate(dates):
+        slots = current.slots_for(date)
+        taken = occupancy[date]
+        if date == now.strftime("%d.%m.%Y"):
+            taken |= past_slots_mask(slots, now)
+        other_weekday = datetime.strptime(date, "%d.%m.%Y").weekday() != weekday
+        for i, time in enumerate(slots):
+            if taken >> i & 1:
+                continue
+            key = (other_weekday, order, abs(time_to_minute(time) - minute))
+            if best_key is None or key < best_key:
+                best, best_key = (date, time, service), key
+    return best
+
+
+async def free_slot_counts(dates: List[str], now: Optional[datetime] = None) -> Dict[str, int]:
+    """Количество свободных слотов по датам (один запрос на все даты)"""
+    now = now or datetime.now()
+    today = now.strftime("%d.%m.%Y")
+    current = schedule.current()
+    occupancy = await load_occupancy(dates)
+
+    counts = {}
+    for date in dates:
+        slots = current.slots_for(date)
+        taken = occupancy[date]
+        if date == today:
+            taken |= past_slots_mask(slots, now)
+        counts[date] = len(slots) - (taken & ((1 << len(slots)) - 1)).bit_count()
+    return counts
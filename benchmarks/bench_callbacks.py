@@ -0,0 +1,119 @@
+# benchmarks/bench_callbacks.py - Накладные расходы маршрутизации callback-запросов
+#
+# Сравнивает старую цепочку фильтров F.data.startswith(...) с таблицей
+# префиксов CallbackTable. Обработчики пустые, поэтому измеряется только
+# стоимость разбора callback_data и выбора обработчика в Dispatcher.feed_update.
+#
+# Запуск: python benchmarks/bench_callbacks.py [количество_итераций]
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Bot, Dispatcher, F, Router
+from aiogram.types import Update
+
+from callbacks import (
+    CallbackTable,
+    DateCB,
+    TimeCB,
+    ServiceCB,
+    CancelBookingCB,
+    ConfirmCancelCB,
+    DayOffSelectCB,
+    DayOffRemoveCB,
+    date_to_day,
+)
+
+OLD_PREFIXES = [
+    "date_", "time_", "service_", "cancel_booking_",
+    "confirm_cancel_", "select_dayoff_date_", "remove_dayoff_",
+]
+STATIC = ["use_saved_data", "enter_new_data", "back_to_bookings", "admin_back",
+          "admin_add_dayoff", "admin_remove_dayoff", "admin_view_dayoffs", "admin_view_bookings"]
+
+
+async def noop(*args, **kwargs):
+    return None
+
+
+def build_old() -> Dispatcher:
+    dp = Dispatcher()
+    router = Router()
+    for data in STATIC:
+        router.callback_query.register(noop, F.data == data)
+    for prefix in OLD_PREFIXES:
+        router.callback_query.register(noop, F.data.startswith(prefix))
+    dp.include_router(router)
+    return dp
+
+
+def build_new() -> Dispatcher:
+    dp = Dispatcher()
+    router = Router()
+    table = CallbackTable()
+    for data in STATIC:
+        table.route(data)(noop)
+    for cb_class in (DateCB, TimeCB, ServiceCB, CancelBookingCB, ConfirmCancelCB, DayOffSelectCB, DayOffRemoveCB):
+        table.route(cb_class)(noop)
+    table.attach(router)
+    dp.include_router(router)
+    return dp
+
+
+def make_update(update_id: int, data: str) -> Update:
+    return Update.model_validate({
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": {"id": 1, "is_bot": False, "first_name": "Bench"},
+            "chat_instance": "1",
+            "data": data,
+            "message": {
+                "message_id": 1,
+                "date": 0,
+                "chat": {"id": 1, "type": "private"},
+                "text": "bench",
+            },
+        },
+    })
+
+
+OLD_PAYLOADS = ["date_21.10.2026", "time_14:30", "service_classic", "cancel_booking_12345",
+                "confirm_cancel_12345", "select_dayoff_date_21.10.2026", "remove_dayoff_21.10.2026"]
+DAY = date_to_day("21.10.2026")
+NEW_PAYLOADS = [DateCB(day=DAY).pack(), TimeCB(minute=870).pack(), ServiceCB(service="classic").pack(),
+                CancelBookingCB(booking_id=12345).pack(), ConfirmCancelCB(booking_id=12345).pack(),
+                DayOffSelectCB(day=DAY).pack(), DayOffRemoveCB(day=DAY).pack()]
+
+
+async def run(dp: Dispatcher, bot: Bot, payloads, iterations: int) -> float:
+    updates = [make_update(i, payloads[i % len(payloads)]) for i in range(len(payloads))]
+    for update in updates:  # прогрев
+        await dp.feed_update(bot, update)
+    started = time.perf_counter()
+    for i in range(iterations):
+        await dp.feed_update(bot, updates[i % len(updates)])
+    return (time.perf_counter() - started) / iterations
+
+
+async def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    bot = Bot(token="42:BENCHMARK")
+
+    print(f"Итераций: {iterations}")
+    print(f"Средняя длина payload: старый {sum(map(len, OLD_PAYLOADS)) / len(OLD_PAYLOADS):.1f} байт, "
+          f"новый {sum(map(len, NEW_PAYLOADS)) / len(NEW_PAYLOADS):.1f} байт")
+
+    old = await run(build_old(), bot, OLD_PAYLOADS, iterations)
+    new = await run(build_new(), bot, NEW_PAYLOADS, iterations)
+    print(f"startswith-цепочка: {old * 1e6:8.1f} мкс/callback")
+    print(f"таблица префиксов:  {new * 1e6:8.1f} мкс/callback")
+    print(f"Ускорение: x{old / new:.2f}")
+    await bot.session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
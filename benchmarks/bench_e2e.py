@@ -0,0 +1,162 @@
+# benchmarks/bench_e2e.py - Сквозная пропускная способность бота без сети
+#
+# Поднимает benchmarks/fake_bot_api.py в этом процессе, запускает bot.py
+# отдельным процессом с TELEGRAM_API_URL на него и временной БД, затем
+# проигрывает сценарий записи для N пользователей: /start, /book, имя,
+# телефон, дата, время, услуга. Каждый пользователь занимает свой слот.
+#
+# Обработка считается завершенной, когда бот подтвердил все апдейты и
+# исходящие вызовы прекратились. Результат: апдейтов в секунду, количество
+# вызовов по методам и ответов 429.
+#
+# Запуск: python benchmarks/bench_e2e.py [--users 100] [--latency 0.02]
+#         [--throttle 0.05] [--retry-after 1]
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from callbacks import DateCB, TimeCB, ServiceCB, EPOCH
+from config import WORKING_HOURS, BOOKING_DAYS_AHEAD, SERVICES
+from fake_bot_api import FakeBotAPI, start_server
+
+BARBER_CHAT_ID = 999
+FIRST_CHAT_ID = 10_000
+SLOT_STEP = 30
+
+
+def _user(chat_id: int) -> Dict[str, Any]:
+    return {"id": chat_id, "is_bot": False, "first_name": f"User{chat_id}", "username": f"user{chat_id}"}
+
+
+def message_update(chat_id: int, text: str) -> Dict[str, Any]:
+    message = {
+        "message_id": 1,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": _user(chat_id),
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"message": message}
+
+
+def callback_update(chat_id: int, data: str) -> Dict[str, Any]:
+    return {
+        "callback_query": {
+            "id": f"{chat_id}-{data}",
+            "from": _user(chat_id),
+            "chat_instance": str(chat_id),
+            "data": data,
+            "message": {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": "bench",
+            },
+        }
+    }
+
+
+def build_scenario(users: int) -> List[Dict[str, Any]]:
+    """Сценарий записи, перемешанный по пользователям шаг за шагом"""
+    first_minute = int(WORKING_HOURS[0][:2]) * 60 + int(WORKING_HOURS[0][3:])
+    slots_per_day = len(WORKING_HOURS)
+    service = next(iter(SERVICES))
+    tomorrow = (date.today() + timedelta(days=1) - EPOCH).days
+
+    flows = []
+    for i in range(users):
+        chat_id = FIRST_CHAT_ID + i
+        day = tomorrow + (i // slots_per_day) % (BOOKING_DAYS_AHEAD - 1)
+        minute = first_minute + SLOT_STEP * (i % slots_per_day)
+        flows.append([
+            message_update(chat_id, "/start"),
+            message_update(chat_id, "/book"),
+            message_update(chat_id, f"Клиент {i}"),
+            message_update(chat_id, f"+7999{i:07d}"),
+            callback_update(chat_id, DateCB(day=day).pack()),
+            callback_update(chat_id, TimeCB(minute=minute).pack()),
+            callback_update(chat_id, ServiceCB(service=service).pack()),
+        ])
+    return [flow[step] for step in range(len(flows[0])) for flow in flows]
+
+
+async def wait_idle(api: FakeBotAPI, idle: float, timeout: float) -> None:
+    """Дождаться, пока бот подтвердит все апдейты и перестанет отвечать"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        await asyncio.sleep(idle / 4)
+        if api.pending:
+            continue
+        if api.last_outbound is None or time.perf_counter() - api.last_outbound >= idle:
+            return
+    raise TimeoutError("Бот не обработал апдейты за отведенное время")
+
+
+async def run(args) -> None:
+    api = FakeBotAPI(latency=args.latency, throttle=args.throttle, retry_after=args.retry_after, seed=1)
+    runner = await start_server(api, port=args.port)
+
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    env = dict(
+        os.environ,
+        TELEGRAM_BOT_TOKEN="42:BENCH",
+        TELEGRAM_API_URL=f"http://127.0.0.1:{args.port}",
+        BARBER_CHAT_ID=str(BARBER_CHAT_ID),
+        DATABASE_URL=f"sqlite+aiosqlite:///{db_path}",
+        LOG_LEVEL="WARNING",
+    )
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(ROOT, "bot.py"), cwd=ROOT, env=env,
+        stdout=asyncio.subprocess.DEVNULL if not args.verbose else None,
+        stderr=asyncio.subprocess.DEVNULL if not args.verbose else None,
+    )
+    try:
+        # Бот готов, когда начал long polling
+        while api.first_poll is None:
+            if process.returncode is not None:
+                raise RuntimeError("bot.py завершился при запуске")
+            await asyncio.sleep(0.05)
+
+        updates = build_scenario(args.users)
+        started = time.perf_counter()
+        api.replay(updates)
+        await wait_idle(api, args.idle, args.timeout)
+        elapsed = (api.last_outbound or time.perf_counter()) - started
+    finally:
+        process.terminate()
+        await process.wait()
+        await runner.cleanup()
+
+    print(f"Пользователей: {args.users}, апдейтов: {len(updates)}")
+    print(f"Задержка API: {args.latency * 1000:.0f} мс, доля 429: {args.throttle:.0%}")
+    print(f"Время: {elapsed:.2f} с, {len(updates) / elapsed:.0f} апдейтов/с")
+    print(f"Ответов 429: {api.throttled}")
+    for method, count in sorted(api.calls.items()):
+        print(f"  {method:<22}{count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сквозной замер бота на локальном Bot API")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка ответа API, секунд")
+    parser.add_argument("--throttle", type=float, default=0.0, help="доля исходящих вызовов с ответом 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--idle", type=float, default=0.5, help="пауза без вызовов, после которой замер окончен")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--verbose", action="store_true", help="показывать вывод bot.py")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# benchmarks/bench_read_models.py - Списки записей: объекты ORM против BookingView
+#
+# Заполняет временную БД SQLite записями и сравнивает прежний путь чтения
+# (select(Booking) через сессию: полные объекты ORM в identity map) с
+# BookingDAO, который выбирает только колонки BookingView в кортежи без
+# сессии. Замеряются:
+# - get_all_active на всей таблице: время, пик памяти во время запроса и
+#   память, которую занимает результат;
+# - get_user_bookings по многим клиентам без кэша: запросов в секунду.
+#
+# Запуск: python benchmarks/bench_read_models.py [--bookings 50000] [--users 2000]
+import argparse
+import asyncio
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Awaitable, Callable, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# БД задается до импорта database: движок создается при импорте
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+
+from datetime import date, timedelta
+
+from sqlalchemy import insert, select
+
+from database import Booking, BookingDAO, async_session_maker, init_db
+from usercache import user_cache
+
+CHUNK = 5000
+
+
+async def fill(bookings: int, users: int) -> None:
+    """Записи на 48 слотов в день, по клиентам по кругу"""
+    first_day = date.today()
+    rows = []
+    for i in range(bookings):
+        day = first_day + timedelta(days=i // 48)
+        minute = 9 * 60 + (i % 48) * 15
+        rows.append({
+            "user_telegram_id": 10_000 + i % users,
+            "user_name": f"Клиент {i % users}",
+            "user_phone": f"+7999{i % users:07d}",
+            "user_username": f"@client{i % users}",
+            "booking_date": day.strftime("%d.%m.%Y"),
+            "booking_time": f"{minute // 60:02d}:{minute % 60:02d}",
+            "service_type": "classic",
+            "service_name": "Классическая стрижка",
+            "service_price": 1500,
+            "service_duration": 30,
+            "status": "active",
+            "barber_comment": None,
+        })
+    async with async_session_maker() as session:
+        for i in range(0, len(rows), CHUNK):
+            await session.execute(insert(Booking), rows[i:i + CHUNK])
+        await session.commit()
+
+
+# Прежняя реализация: полные объекты ORM через сессию
+
+async def orm_all_active() -> List[Booking]:
+    async with async_session_maker() as session:
+        result = await session.execute(
+            select(Booking).where(Booking.status == "active").order_by(Booking.booking_date, Booking.booking_time)
+        )
+        return list(result.scalars().all())
+
+
+async def orm_user_bookings(telegram_id: int) -> List[Booking]:
+    async with async_session_maker() as session:
+        result = await session.execute(
+            select(Booking).where(
+                Booking.user_telegram_id == telegram_id,
+                Booking.status == "active"
+            ).order_by(Booking.booking_date, Booking.booking_time)
+        )
+        return list(result.scalars().all())
+
+
+async def measure(call: Callable[[], Awaitable[list]], repeat: int) -> Tuple[float, int, int, int]:
+    """Лучшее время, пик памяти за вызов, память результата, длина результата"""
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        result = await call()
+        best = min(best, time.perf_counter() - started)
+        del result
+
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    result = await call()
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak - baseline, retained - baseline, len(result)
+
+
+async def user_throughput(call: Callable[[int], Awaitable[list]], users: int) -> float:
+    started = time.perf_counter()
+    for i in range(users):
+        user_cache.clear()
+        await call(10_000 + i)
+    return users / (time.perf_counter() - started)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Замер чтения списков записей")
+    parser.add_argument("--bookings", type=int, default=50_000)
+    parser.add_argument("--users", type=int, default=2_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    await init_db()
+    await fill(args.bookings, args.users)
+    print(f"Записей: {args.bookings}, клиентов: {args.users}")
+
+    print("get_all_active:")
+    for name, call in (("ORM", orm_all_active), ("BookingView", BookingDAO.get_all_active)):
+        elapsed, peak, retained, rows = await measure(call, args.repeat)
+        print(
+            f"  {name:<12}{elapsed * 1000:8.0f} мс  пик {peak / 2**20:6.1f} МБ  "
+            f"результат {retained / 2**20:6.1f} МБ ({retained / rows:.0f} байт/запись)"
+        )
+
+    print("get_user_bookings без кэша:")
+    for name, call in (("ORM", orm_user_bookings), ("BookingView", BookingDAO.get_user_bookings)):
+        print(f"  {name:<12}{await user_throughput(call, args.users):8.0f} запросов/с")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+# benchmarks/bench_session.py - Пропускная способность sendMessage/editMessageText
+#
+# Сравнивает стандартную AiohttpSession (json из стандартной библиотеки)
+# с TunedAiohttpSession из http_session.py (пул и keep-alive, orjson, если
+# установлен). Запросы идут на benchmarks/fake_bot_api.py в этом же
+# процессе; каждое сообщение несет клавиатуру выбора времени, как в боте.
+# Отдельно замеряется только JSON: сериализация клавиатуры и разбор ответа.
+#
+# Запуск: python benchmarks/bench_session.py [--calls 2000] [--concurrency 20]
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from callbacks import TimeCB
+from fake_bot_api import FakeBotAPI, start_server
+from http_session import TunedAiohttpSession, json_dumps, json_loads, orjson
+
+CHAT_ID = 10_000
+
+
+def build_markup() -> InlineKeyboardMarkup:
+    buttons = [
+        InlineKeyboardButton(text=f"{hour:02d}:{minute:02d}", callback_data=TimeCB(minute=hour * 60 + minute).pack())
+        for hour in range(10, 19) for minute in (0, 30)
+    ]
+    rows = [buttons[i:i + 4] for i in range(0, len(buttons), 4)]
+    rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_dates")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+async def send_edit(bot: Bot, calls: int, concurrency: int) -> float:
+    markup = build_markup()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            if i % 2:
+                await bot.edit_message_text("🕐 Выберите время", chat_id=CHAT_ID, message_id=i, reply_markup=markup)
+            else:
+                await bot.send_message(CHAT_ID, "🕐 Выберите время", reply_markup=markup)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    return time.perf_counter() - started
+
+
+def bench_json(iterations: int) -> None:
+    markup = build_markup().model_dump(mode="json", exclude_none=True)
+    response = json.dumps({"ok": True, "result": {
+        "message_id": 1, "date": 0, "chat": {"id": CHAT_ID, "type": "private"},
+        "text": "🕐 Выберите время", "reply_markup": markup,
+    }})
+    for name, dumps, loads in (("json", json.dumps, json.loads), ("http_session", json_dumps, json_loads)):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            dumps(markup)
+            loads(response)
+        elapsed = time.perf_counter() - started
+        print(f"  {name:<14}{elapsed / iterations * 1e6:8.1f} мкс на клавиатуру + ответ")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Замер исходящих вызовов Bot API")
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=8082)
+    args = parser.parse_args()
+
+    api = FakeBotAPI(latency=args.latency)
+    runner = await start_server(api, port=args.port)
+    server = TelegramAPIServer.from_base(f"http://127.0.0.1:{args.port}")
+    sessions = {
+        "стандартная": lambda: AiohttpSession(api=server),
+        "настроенная": lambda: TunedAiohttpSession(api=server, json_loads=json_loads, json_dumps=json_dumps),
+    }
+    print(f"orjson: {'да' if orjson is not None else 'нет (стандартный json)'}")
+    print(f"Вызовов: {args.calls}, одновременно: {args.concurrency}")
+    try:
+        for name, factory in sessions.items():
+            bot = Bot(token="42:BENCH", session=factory())
+            try:
+                await send_edit(bot, args.concurrency, args.concurrency)  # прогрев соединений
+                elapsed = await send_edit(bot, args.calls, args.concurrency)
+            finally:
+                await bot.session.close()
+            print(f"  {name:<14}{args.calls / elapsed:8.0f} вызовов/с")
+    finally:
+        await runner.cleanup()
+
+    print("Только JSON:")
+    bench_json(args.calls * 5)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,187 @@
+# benchmarks/fake_bot_api.py - Локальная замена Telegram Bot API для замеров
+#
+# aiohttp-сервер, который отвечает на методы, используемые ботом: getMe,
+# getUpdates (long polling), sendMessage, editMessageText,
+# answerCallbackQuery (остальные методы отвечают true). Умеет:
+#   - задержку ответа (имитация сети до Telegram);
+#   - ответы 429 с retry_after на заданную долю исходящих вызовов;
+#   - проигрывание апдейтов: из файла JSONL или через POST /control/updates.
+# Статистика вызовов: GET /control/stats.
+#
+# Бот подключается через TELEGRAM_API_URL=http://127.0.0.1:8081
+#
+# Запуск: python benchmarks/fake_bot_api.py [--port 8081] [--latency 0.05]
+#         [--throttle 0.1] [--retry-after 1] [--replay updates.jsonl]
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+BOT_USER = {"id": 42, "is_bot": True, "first_name": "Barbershop", "username": "barbershop_bench_bot"}
+
+# Методы, которые отправляют что-то пользователю (на них действует 429)
+OUTBOUND_METHODS = {"sendmessage", "editmessagetext", "answercallbackquery", "senddocument"}
+
+
+class FakeBotAPI:
+    """Состояние поддельного Bot API: очередь апдейтов и статистика вызовов"""
+
+    def __init__(self, latency: float = 0.0, throttle: float = 0.0, retry_after: int = 1, seed: Optional[int] = None):
+        self.latency = latency
+        self.throttle = throttle
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._updates: List[Dict[str, Any]] = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1000)
+        self._new_updates = asyncio.Event()
+        self.confirmed = 0
+        self.calls: Counter = Counter()
+        self.throttled = 0
+        self.first_poll: Optional[float] = None
+        self.last_outbound: Optional[float] = None
+
+    def replay(self, updates: List[Dict[str, Any]]) -> int:
+        """Поставить апдейты в очередь getUpdates. update_id назначается по порядку"""
+        for update in updates:
+            update = dict(update)
+            update["update_id"] = next(self._update_ids)
+            self._updates.append(update)
+        self._new_updates.set()
+        return len(updates)
+
+    @property
+    def pending(self) -> int:
+        """Апдейты, которые бот еще не забрал и не подтвердил"""
+        return len(self._updates)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": dict(self.calls),
+            "throttled": self.throttled,
+            "pending": self.pending,
+            "confirmed": self.confirmed,
+        }
+
+    # Ответы методов
+
+    def _message(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        chat_id = int(params.get("chat_id") or 0)
+        return {
+            "message_id": int(params.get("message_id") or next(self._message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": params.get("text", ""),
+        }
+
+    async def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        if self.first_poll is None:
+            self.first_poll = time.perf_counter()
+        offset = int(params.get("offset") or 0)
+        if offset:
+            # Все апдейты до offset бот подтвердил
+            while self._updates and self._updates[0]["update_id"] < offset:
+                self._updates.pop(0)
+                self.confirmed += 1
+        if not self._updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), float(params.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                return []
+        limit = int(params.get("limit") or 100)
+        return self._updates[:limit]
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        params: Dict[str, Any] = dict(await request.post()) if request.can_read_body else {}
+        params.update(request.query)
+        self.calls[method] += 1
+
+        if method == "getupdates":
+            return web.json_response({"ok": True, "result": await self._get_updates(params)})
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method in OUTBOUND_METHODS:
+            self.last_outbound = time.perf_counter()
+            if self.throttle and self._random.random() < self.throttle:
+                self.throttled += 1
+                return web.json_response({
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after},
+                }, status=429)
+
+        if method == "getme":
+            result: Any = BOT_USER
+        elif method in ("sendmessage", "editmessagetext", "senddocument"):
+            result = self._message(params)
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def handle_control_updates(self, request: web.Request) -> web.Response:
+        updates = await request.json()
+        return web.json_response({"ok": True, "queued": self.replay(updates)})
+
+    async def handle_control_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats())
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/control/updates", self.handle_control_updates)
+        app.router.add_get("/control/stats", self.handle_control_stats)
+        app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        return app
+
+
+async def start_server(api: FakeBotAPI, host: str = "127.0.0.1", port: int = 8081) -> web.AppRunner:
+    """Запустить сервер в текущем event loop (для бенчмарков)"""
+    runner = web.AppRunner(api.make_app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def load_updates(path: str) -> List[Dict[str, Any]]:
+    """Апдейты из файла JSONL (по одному объекту Update на строку)"""
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Локальная замена Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, секунд")
+    parser.add_argument("--throttle", type=float, default=0.0, help="доля исходящих вызовов с ответом 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after в ответах 429")
+    parser.add_argument("--replay", help="файл JSONL с апдейтами")
+    args = parser.parse_args()
+
+    api = FakeBotAPI(latency=args.latency, throttle=args.throttle, retry_after=args.retry_after)
+    if args.replay:
+        api.replay(load_updates(args.replay))
+    runner = await start_server(api, args.host, args.port)
+    print(f"Fake Bot API: http://{args.host}:{args.port}  (TELEGRAM_API_URL для бота)")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,271 @@
+# benchmarks/stress_bookings.py - Гонки записи, отмены и выходных
+#
+# Проверка под нагрузкой на настоящем файле SQLite. Апдейты идут через
+# Dispatcher.feed_update с теми же роутерами и middleware, что в bot.py;
+# Bot API - benchmarks/fake_bot_api.py в этом же процессе.
+#
+# Подготовка: --users клиентов проходят /book до выбора услуги, все на
+# --slots одних и тех же слотов; --cancellers клиентов заранее записаны на
+# те же даты. Затем одновременно отправляются: подтверждения всех
+# клиентов (confirm_booking), отмены заранее созданных записей и /dayoffs
+# барбера на первую дату.
+#
+# Проверяемые инварианты:
+# - не больше одной активной записи на слот;
+# - ни одной активной записи на выходной;
+# - daily_stats и client_stats совпадают с пересчетом по таблице bookings.
+#
+# Метрики: апдейтов в секунду, исходы подтверждений, конфликты
+# уникального индекса, ошибки блокировки БД, ожидание записи в БД.
+#
+# Запуск: python benchmarks/stress_bookings.py [--users 300] [--slots 4]
+#         [--cancellers 20] [--rounds 3]
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, timedelta
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BARBER_CHAT_ID = 999
+PORT = 8083
+
+# Окружение задается до импорта модулей бота: они читают его при импорте
+DB_PATH = os.path.join(tempfile.mkdtemp(), "stress.db")
+os.environ.update(
+    TELEGRAM_BOT_TOKEN="42:STRESS",
+    BARBER_CHAT_ID=str(BARBER_CHAT_ID),
+    DATABASE_URL=f"sqlite+aiosqlite:///{DB_PATH}",
+)
+
+from aiogram import Bot
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.methods import AnswerCallbackQuery
+from aiogram.types import Update
+from sqlalchemy import event, func, select, text
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from bench_e2e import callback_update, message_update
+from bot import create_dispatcher, startup
+from callbacks import DateCB, TimeCB, ServiceCB, ConfirmCancelCB, EPOCH
+from config import WORKING_HOURS, SERVICES
+from database import Booking, BookingDAO, ClientStats, DailyStats, engine, async_session_maker, to_iso_date
+from fake_bot_api import FakeBotAPI, start_server
+from http_session import TunedAiohttpSession
+
+FIRST_CHAT_ID = 10_000
+SLOT_STEP = 30
+
+
+class DatabaseProbe:
+    """Счетчики по событиям движка: ожидание записи, конфликты, блокировки"""
+
+    def __init__(self):
+        self.write_waits: List[float] = []
+        self.errors: Counter = Counter()
+        event.listen(engine.sync_engine, "before_cursor_execute", self._before)
+        event.listen(engine.sync_engine, "after_cursor_execute", self._after)
+        event.listen(engine.sync_engine, "handle_error", self._error)
+
+    @staticmethod
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info["stress_started"] = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        # Первая запись в транзакции ждет блокировку БД, поэтому время
+        # INSERT/UPDATE/DELETE почти целиком - ожидание других писателей
+        if statement.lstrip()[:6].upper() in ("INSERT", "UPDATE", "DELETE"):
+            self.write_waits.append(time.perf_counter() - conn.info.pop("stress_started"))
+
+    def _error(self, context):
+        error = context.original_exception
+        if isinstance(context.sqlalchemy_exception, IntegrityError):
+            self.errors["конфликт уникального индекса"] += 1
+        elif isinstance(context.sqlalchemy_exception, OperationalError) and "locked" in str(error):
+            self.errors["БД заблокирована"] += 1
+        else:
+            self.errors[type(error).__name__] += 1
+
+    def reset(self) -> None:
+        self.write_waits.clear()
+        self.errors.clear()
+
+
+def percentile(values: List[float], share: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * share), len(ordered) - 1)]
+
+
+_update_ids = itertools.count(1)
+
+
+async def feed_all(dp, bot: Bot, updates: List[Dict[str, Any]]) -> List[Any]:
+    """Отправить апдейты одновременно, как polling с параллельной обработкой"""
+    return await asyncio.gather(
+        *(
+            dp.feed_update(bot, Update.model_validate({"update_id": next(_update_ids), **update}, context={"bot": bot}))
+            for update in updates
+        ),
+        return_exceptions=True
+    )
+
+
+async def check_invariants() -> List[str]:
+    """Нарушения инвариантов (пустой список - все в порядке)"""
+    problems = []
+    async with async_session_maker() as session:
+        duplicates = (await session.execute(
+            select(Booking.booking_date, Booking.booking_time, func.count())
+            .where(Booking.status == "active")
+            .group_by(Booking.booking_date, Booking.booking_time)
+            .having(func.count() > 1)
+        )).all()
+        problems += [f"двойная запись: {d} {t} ({n} активных)" for d, t, n in duplicates]
+
+        on_day_off = (await session.execute(text(
+            "SELECT b.id, b.booking_date FROM bookings b JOIN barber_daysoff d ON d.date = b.booking_date "
+            "WHERE b.status = 'active'"
+        ))).all()
+        problems += [f"запись {i} на выходной {d}" for i, d in on_day_off]
+
+        bookings = (await session.scalars(select(Booking))).all()
+        daily, clients = Counter(), Counter()
+        for booking in bookings:
+            if booking.status != "cancelled":
+                daily[to_iso_date(booking.booking_date)] += 1
+                clients[booking.user_telegram_id] += 1
+        stats = (await session.execute(
+            select(DailyStats.stat_date, func.sum(DailyStats.bookings_count)).group_by(DailyStats.stat_date)
+        )).all()
+        for stat_date, count in stats:
+            if count != daily[stat_date]:
+                problems.append(f"daily_stats {stat_date}: {count}, по записям {daily[stat_date]}")
+        for row in (await session.scalars(select(ClientStats))).all():
+            if row.bookings_count != clients[row.telegram_id]:
+                problems.append(f"client_stats {row.telegram_id}: {row.bookings_count}, по записям {clients[row.telegram_id]}")
+    return problems
+
+
+class AnswerRecorder:
+    """Middleware сессии бота: тексты answerCallbackQuery (исходы подтверждений и отмен)"""
+
+    def __init__(self):
+        self.answers: Counter = Counter()
+
+    async def __call__(self, make_request, bot, method):
+        if isinstance(method, AnswerCallbackQuery) and method.text:
+            self.answers[method.text] += 1
+        return await make_request(bot, method)
+
+
+async def run_round(dp, bot: Bot, probe: DatabaseProbe, recorder: AnswerRecorder, args, round_no: int) -> bool:
+    first_minute = int(WORKING_HOURS[0][:2]) * 60 + int(WORKING_HOURS[0][3:])
+    service = next(iter(SERVICES))
+    # Каждый раунд - свои даты, чтобы выходные прошлых раундов не мешали
+    first_day = date.today() + timedelta(days=1 + round_no * 2)
+    days = [first_day, first_day + timedelta(days=1)]
+    hot_slots = [(days[i % 2], first_minute + SLOT_STEP * (i // 2)) for i in range(args.slots)]
+    chat_base = FIRST_CHAT_ID + round_no * 100_000
+
+    # Заранее созданные записи на остальные слоты тех же дней
+    cancel_ids = []
+    for i in range(args.cancellers):
+        day = days[i % 2]
+        minute = first_minute + SLOT_STEP * (args.slots // 2 + 1 + i // 2)
+        booking = await BookingDAO.create(
+            chat_base + 50_000 + i, f"Отмена {i}", "+70000000000", None,
+            day.strftime("%d.%m.%Y"), f"{minute // 60:02d}:{minute % 60:02d}", service, "stress", 1000, 30
+        )
+        cancel_ids.append((chat_base + 50_000 + i, booking.id))
+
+    # Клиенты доходят до выбора услуги на горячих слотах
+    users = [chat_base + i for i in range(args.users)]
+    steps = [
+        lambda chat_id, i: message_update(chat_id, "/book"),
+        lambda chat_id, i: message_update(chat_id, f"Клиент {i}"),
+        lambda chat_id, i: message_update(chat_id, f"+7999{i:07d}"),
+        lambda chat_id, i: callback_update(chat_id, DateCB(day=(hot_slots[i % args.slots][0] - EPOCH).days).pack()),
+        lambda chat_id, i: callback_update(chat_id, TimeCB(minute=hot_slots[i % args.slots][1]).pack()),
+    ]
+    for step in steps:
+        await feed_all(dp, bot, [step(chat_id, i) for i, chat_id in enumerate(users)])
+
+    # Одновременно: подтверждения, отмены и выходной на первую дату
+    burst = [callback_update(chat_id, ServiceCB(service=service).pack()) for chat_id in users]
+    burst += [callback_update(chat_id, ConfirmCancelCB(booking_id=booking_id).pack()) for chat_id, booking_id in cancel_ids]
+    burst.insert(len(burst) // 2, message_update(BARBER_CHAT_ID, f"/dayoffs {days[0].strftime('%d.%m.%Y')}"))
+
+    probe.reset()
+    recorder.answers.clear()
+    started = time.perf_counter()
+    results = await feed_all(dp, bot, burst)
+    elapsed = time.perf_counter() - started
+
+    failures = [result for result in results if isinstance(result, BaseException)]
+    async with async_session_maker() as session:
+        booked = await session.scalar(
+            select(func.count()).where(Booking.user_telegram_id.in_(users), Booking.status == "active")
+        )
+    problems = await check_invariants()
+
+    print(f"Раунд {round_no + 1}: {len(burst)} апдейтов за {elapsed:.2f} с, {len(burst) / elapsed:.0f} апдейтов/с")
+    print(f"  записано клиентов: {booked} из {len(users)} на {args.slots} слотов")
+    for answer, count in recorder.answers.most_common():
+        print(f"  ответ «{answer}»: {count}")
+    for name, count in sorted(probe.errors.items()):
+        print(f"  {name}: {count}")
+    waits = probe.write_waits
+    print(
+        f"  ожидание записи в БД, мс: p50 {percentile(waits, 0.5) * 1000:.1f}, "
+        f"p95 {percentile(waits, 0.95) * 1000:.1f}, макс {max(waits, default=0) * 1000:.1f} "
+        f"({len(waits)} запросов)"
+    )
+    if failures:
+        print(f"  исключений в обработчиках: {len(failures)}, первое: {failures[0]!r}")
+    for problem in problems:
+        print(f"  НАРУШЕНИЕ: {problem}")
+    return not problems and not failures
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Стресс-тест гонок записи, отмены и выходных")
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--slots", type=int, default=4)
+    parser.add_argument("--cancellers", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    # Исключения обработчиков считаются по результатам feed_update, без трассировок в консоли
+    logging.disable(logging.ERROR)
+    await startup()
+    probe = DatabaseProbe()
+    api = FakeBotAPI()
+    runner = await start_server(api, port=PORT)
+    bot = Bot(token="42:STRESS", session=TunedAiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{PORT}")))
+    recorder = AnswerRecorder()
+    bot.session.middleware(recorder)
+    dp = create_dispatcher()
+    print(f"БД: {DB_PATH}")
+    ok = True
+    try:
+        for round_no in range(args.rounds):
+            ok = await run_round(dp, bot, probe, recorder, args, round_no) and ok
+    finally:
+        await bot.session.close()
+        await runner.cleanup()
+    print("Инварианты соблюдены" if ok else "Есть нарушения")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
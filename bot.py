@@ -1,46 +1,168 @@
-# bot.py - Основной файл бота
-import asyncio
-import logging
-from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
-from admin_handlers import router as admin_router
-from config import TELEGRAM_BOT_TOKEN
-from database import init_db
-from handlers import router
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
-
-
-async def main():
-    """Запуск бота"""
-    # Инициализация базы данных
-    await init_db()
-    logger.info("База данных инициализирована")
-    
-    # Создаем бота и диспетчер
-    bot = Bot(token=TELEGRAM_BOT_TOKEN)
-    storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
-    
-    # Регистрируем роутеры
-    dp.include_router(router)
-    dp.include_router(admin_router)  # Добавить эту строку
-    
-    # Запускаем бота
-    logger.info("🤖 Бот запущен!")
-    try:
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
-    finally:
-        await bot.session.close()
-
-
-if __name__ == '__main__':
-    try:
-        asyncio.run(main())
-    except KeyboardInterrupt:
-        logger.info("Бот остановлен")
\ No newline at end of file
+# bot.py - Основной файл бота
+import time
+
+_started = time.perf_counter()
+
+import asyncio
+import logging
+from aiogram import Bot, Dispatcher
+from aiogram.fsm.storage.memory import MemoryStorage
+from admin_handlers import router as admin_router
+from availability import horizon_dates, load_occupancy
+from config import (
+    TELEGRAM_BOT_TOKEN, LOG_LEVEL, LOG_FILE, HANDLER_CONCURRENCY, HANDLER_QUEUE_FACTOR, ICS_FEED_TOKEN,
+    BARBER_CHAT_ID, BARBER_NOTIFY_WINDOW, BARBER_DIGEST_TIME
+)
+from database import init_db, pool_capacity
+from dayoffs import day_offs
+from diagnostics import watchdog
+from digest import MorningDigest
+from handlers import router
+from http_session import create_session
+from keyboards import get_admin_keyboard, get_service_keyboard
+from logging_setup import setup_logging
+from middlewares import (
+    UpdateLoggingMiddleware, HandlerNameMiddleware, UserSerialMiddleware,
+    CallbackIdempotencyMiddleware, CallbackAnswerRecorder
+)
+from outbox import OutboxWorker
+import schedule
+import waitlist
+
+_imported = time.perf_counter()
+
+logger = logging.getLogger(__name__)
+
+
+async def startup() -> None:
+    """Проверка схемы БД и прогрев кэшей до начала polling"""
+    timings = [("импорт", _imported - _started)]
+    mark = time.perf_counter()
+    
+    def phase(name: str) -> None:
+        nonlocal mark
+        now = time.perf_counter()
+        timings.append((name, now - mark))
+        mark = now
+    
+    # Схема создается и мигрирует только при смене версии
+    schema_changed = await init_db()
+    phase("схема БД" + (" (обновлена)" if schema_changed else ""))
+    
+    # График работы и услуги
+    await schedule.init(seed=schema_changed)
+    phase("график")
+    
+    # Выходные дни
+    await day_offs.load()
+    phase("выходные")
+    
+    # Занятость ближайших дней одним запросом
+    await load_occupancy(horizon_dates())
+    phase("занятость")
+    
+    # Статические клавиатуры
+    get_service_keyboard()
+    get_admin_keyboard()
+    phase("клавиатуры")
+    
+    total = sum(duration for _, duration in timings)
+    logger.info(
+        "Запуск за %.1f мс: %s", total * 1000,
+        ", ".join(f"{name} {duration * 1000:.1f} мс" for name, duration in timings)
+    )
+
+
+def create_dispatcher(concurrency: int = 0) -> Dispatcher:
+    """
+    Диспетчер с роутерами и middleware (роутеры можно подключить только один раз).
+    concurrency - сколько обработчиков выполняется одновременно (0 - по размеру пула БД)
+    """
+    storage = MemoryStorage()
+    dp = Dispatcher(storage=storage)
+    
+    # Контекст логов: апдейт, пользователь, обработчик, длительность
+    dp.update.outer_middleware(UpdateLoggingMiddleware())
+    # Апдейты одного пользователя - строго по очереди; не больше обработчиков
+    # одновременно, чем соединений в пуле БД
+    dp.update.outer_middleware(UserSerialMiddleware(concurrency or pool_capacity()))
+    for observer in (router.message, router.callback_query, admin_router.message, admin_router.callback_query):
+        observer.middleware(HandlerNameMiddleware())
+    # Повторные нажатия кнопок записи и отмены не выполняют действие второй раз
+    dp.callback_query.outer_middleware(CallbackIdempotencyMiddleware())
+    
+    # Регистрируем роутеры
+    dp.include_router(router)
+    dp.include_router(admin_router)
+    return dp
+
+
+async def main():
+    """Запуск бота"""
+    # Инициализация базы данных и прогрев кэшей
+    await startup()
+    logger.info("База данных инициализирована")
+    
+    # Создаем бота и диспетчер
+    bot = Bot(token=TELEGRAM_BOT_TOKEN, session=create_session())
+    # Ответы на нажатия запоминаются для повторных нажатий той же кнопки
+    bot.session.middleware(CallbackAnswerRecorder())
+    
+    # Предложения из листа ожидания отправляются от имени этого бота
+    await waitlist.setup(bot)
+    
+    # Замер задержки event loop и запись стеков блокирующих колбэков
+    watchdog.start()
+    
+    # Уведомления из outbox отправляются в фоне, вне обработки апдейтов;
+    # уведомления барберу копятся в окне и приходят одним сообщением
+    coalesce = {int(BARBER_CHAT_ID): BARBER_NOTIFY_WINDOW} if BARBER_CHAT_ID and BARBER_NOTIFY_WINDOW else {}
+    outbox_worker = OutboxWorker(bot, coalesce=coalesce)
+    outbox_worker.start()
+    
+    # Утренняя сводка расписания барберу (если задан BARBER_DIGEST_TIME)
+    digest = MorningDigest(int(BARBER_CHAT_ID)) if BARBER_CHAT_ID and BARBER_DIGEST_TIME else None
+    if digest is not None:
+        digest.start()
+    
+    # Расписание барбера для приложения календаря (если задан ICS_FEED_TOKEN);
+    # модуль с HTTP-сервером загружается только когда фид включен
+    ics_feed = None
+    if ICS_FEED_TOKEN:
+        from icsfeed import IcsFeed
+        ics_feed = IcsFeed()
+        await ics_feed.start()
+    
+    # Лимит одновременных обработчиков держит UserSerialMiddleware, после
+    # очереди пользователя. Лимит задач polling в HANDLER_QUEUE_FACTOR раз
+    # больше: он только ограничивает очередь, а при ее заполнении polling
+    # перестает забирать апдейты
+    concurrency = HANDLER_CONCURRENCY or pool_capacity()
+    admitted = concurrency * HANDLER_QUEUE_FACTOR
+    dp = create_dispatcher(concurrency)
+    
+    # Запускаем бота
+    logger.info("🤖 Бот запущен! Одновременных обработчиков: %d, в очереди до %d", concurrency, admitted)
+    try:
+        await dp.start_polling(
+            bot, allowed_updates=dp.resolve_used_update_types(), tasks_concurrency_limit=admitted
+        )
+    finally:
+        if ics_feed is not None:
+            await ics_feed.stop()
+        if digest is not None:
+            await digest.stop()
+        await outbox_worker.stop()
+        await watchdog.stop()
+        await bot.session.close()
+
+
+if __name__ == '__main__':
+    # Логи пишутся в фоновом потоке через очередь
+    listener = setup_logging(LOG_LEVEL, LOG_FILE or None)
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logger.info("Бот остановлен")
+    finally:
+        listener.stop()
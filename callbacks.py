@@ -0,0 +1,201 @@
+# callbacks.py - Компактные callback_data и маршрутизация по префиксу
+import inspect
+from datetime import datetime, date as date_cls, timedelta
+from typing import Any, Callable, Dict, Optional, Set, Tuple, Type, Union
+
+from aiogram import Router
+from aiogram.filters.callback_data import CallbackData
+from aiogram.fsm.state import State
+from aiogram.types import CallbackQuery
+
+
+# Точка отсчета для дат: в callback_data дата хранится как номер дня от EPOCH
+EPOCH = date_cls(2024, 1, 1)
+
+DATE_FORMAT = "%d.%m.%Y"
+
+# Префиксы действий с побочными эффектами (запись, отмена, выходные):
+# повторное нажатие той же кнопки не выполняет их второй раз, см.
+# middlewares.CallbackIdempotencyMiddleware
+IDEMPOTENT_PREFIXES: Set[str] = set()
+
+
+def date_to_day(date_str: str) -> int:
+    """DD.MM.YYYY -> номер дня от EPOCH"""
+    return (datetime.strptime(date_str, DATE_FORMAT).date() - EPOCH).days
+
+
+def day_to_date(day: int) -> str:
+    """Номер дня от EPOCH -> DD.MM.YYYY"""
+    return (EPOCH + timedelta(days=day)).strftime(DATE_FORMAT)
+
+
+def date_to_month(date: date_cls) -> int:
+    """Дата -> номер месяца от EPOCH (страница календаря)"""
+    return (date.year - EPOCH.year) * 12 + date.month - EPOCH.month
+
+
+def month_to_date(month: int) -> date_cls:
+    """Номер месяца от EPOCH -> первое число месяца"""
+    year, index = divmod(EPOCH.month - 1 + month, 12)
+    return date_cls(EPOCH.year + year, index + 1, 1)
+
+
+def time_to_minute(time_str: str) -> int:
+    """HH:MM -> минуты от полуночи"""
+    hours, minutes = time_str.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def minute_to_time(minute: int) -> str:
+    """Минуты от полуночи -> HH:MM"""
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+# Типизированные callback_data. Префикс - короткий код действия
+class DateCB(CallbackData, prefix="d"):
+    day: int
+
+
+class MonthCB(CallbackData, prefix="m"):
+    month: int
+
+
+class TimeCB(CallbackData, prefix="t"):
+    minute: int
+
+
+class BusyCB(CallbackData, prefix="b"):
+    minute: int
+
+
+class ServiceCB(CallbackData, prefix="s"):
+    service: str
+
+
+class CancelBookingCB(CallbackData, prefix="cb"):
+    booking_id: int
+
+
+class ConfirmCancelCB(CallbackData, prefix="cc"):
+    booking_id: int
+
+
+class DayOffSelectCB(CallbackData, prefix="ds"):
+    day: int
+
+
+class DayOffMonthCB(CallbackData, prefix="dm"):
+    month: int
+
+
+class DayOffRemoveCB(CallbackData, prefix="dr"):
+    day: int
+
+
+class RuleRemoveCB(CallbackData, prefix="rr"):
+    rule_id: int
+
+
+class WeekdayCB(CallbackData, prefix="wd"):
+    weekday: int
+
+
+class NearestCB(CallbackData, prefix="n"):
+    day: int
+    minute: int
+
+
+class RepeatCB(CallbackData, prefix="rp"):
+    day: int
+    minute: int
+    service: str
+
+
+class WaitlistBookCB(CallbackData, prefix="wb"):
+    entry_id: int
+    service: str
+
+
+class WaitlistDeclineCB(CallbackData, prefix="wx"):
+    entry_id: int
+
+
+class CallbackTable:
+    """
+    Таблица маршрутов callback-запросов по префиксу.
+
+    Вместо цепочки фильтров F.data.startswith(...) / F.data == ... роутер
+    получает один асинхронный фильтр, который находит маршрут в словаре по
+    коду действия, распаковывает callback_data и вызывает нужную функцию.
+    Магические фильтры aiogram синхронные и вычисляются через
+    asyncio.to_thread, поэтому цепочка из них стоит по переходу в поток на
+    каждый проверенный фильтр.
+    """
+
+    def __init__(self):
+        self._routes: Dict[str, Tuple[Optional[Type[CallbackData]], Callable, Optional[str], frozenset]] = {}
+
+    def route(
+        self,
+        key: Union[Type[CallbackData], str],
+        state: Optional[Union[State, str]] = None,
+        idempotent: bool = False
+    ):
+        """
+        Декоратор регистрации обработчика для типа callback_data или точной строки.
+        idempotent=True - повтор той же кнопки получает ответ первого нажатия
+        """
+        if isinstance(key, str):
+            prefix, cb_class = key, None
+        else:
+            prefix, cb_class = key.__prefix__, key
+        if prefix in self._routes:
+            raise ValueError(f"Префикс {prefix!r} уже зарегистрирован")
+        raw_state = state.state if isinstance(state, State) else state
+        if idempotent:
+            IDEMPOTENT_PREFIXES.add(prefix)
+
+        def decorator(handler: Callable) -> Callable:
+            params = frozenset(inspect.signature(handler).parameters)
+            self._routes[prefix] = (cb_class, handler, raw_state, params)
+            return handler
+
+        return decorator
+
+    def resolve(self, data: Optional[str], raw_state: Optional[str] = None) -> Optional[Tuple[Callable, frozenset, Optional[CallbackData]]]:
+        """Найти маршрут для строки callback_data (O(1) по префиксу)"""
+        if not data:
+            return None
+        prefix, sep, _ = data.partition(":")
+        route = self._routes.get(prefix)
+        if route is None:
+            return None
+        cb_class, handler, required_state, params = route
+        if required_state is not None and raw_state != required_state:
+            return None
+        if cb_class is None:
+            # Точное совпадение строки без полезной нагрузки
+            return (handler, params, None) if not sep else None
+        try:
+            callback_data = cb_class.unpack(data)
+        except (TypeError, ValueError):
+            return None
+        return handler, params, callback_data
+
+    async def _filter(self, callback: CallbackQuery, raw_state: Optional[str] = None) -> Union[bool, Dict[str, Any]]:
+        resolved = self.resolve(callback.data, raw_state)
+        if resolved is None:
+            return False
+        return {"callback_route": resolved}
+
+    @staticmethod
+    async def _dispatch(callback: CallbackQuery, callback_route: Tuple, **data: Any) -> Any:
+        handler, params, callback_data = callback_route
+        data["callback"] = callback
+        data["callback_data"] = callback_data
+        return await handler(**{name: data[name] for name in params if name in data})
+
+    def attach(self, router: Router) -> None:
+        """Зарегистрировать таблицу в роутере одним обработчиком"""
+        router.callback_query.register(self._dispatch, self._filter)
@@ -8,9 +8,28 @@ load_dotenv()
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
 BARBER_CHAT_ID = os.getenv("BARBER_CHAT_ID", "")
 
+# Адрес Bot API (пусто - api.telegram.org). Для замеров - benchmarks/fake_bot_api.py
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+
+# HTTP-соединения с Bot API: размер пула, сколько секунд держать простаивающее
+# соединение открытым и таймаут одного запроса
+API_POOL_SIZE = int(os.getenv("API_POOL_SIZE", "100"))
+API_KEEPALIVE = float(os.getenv("API_KEEPALIVE", "60"))
+API_TIMEOUT = float(os.getenv("API_TIMEOUT", "30"))
+
+# Логирование
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FILE = os.getenv("LOG_FILE", "")
+
 # База данных
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./barbershop.db")
 
+# Сколько апдейтов обрабатывается одновременно (0 - по размеру пула БД)
+HANDLER_CONCURRENCY = int(os.getenv("HANDLER_CONCURRENCY", "0"))
+# Сколько апдейтов на одно место обработчика polling принимает в очередь,
+# прежде чем перестать забирать новые
+HANDLER_QUEUE_FACTOR = int(os.getenv("HANDLER_QUEUE_FACTOR", "4"))
+
 # Типы стрижек и их цены
 SERVICES = {
     "classic": {"name": "Классическая стрижка", "price": 1500, "duration": 30, "emoji": "✂️"},
@@ -33,8 +52,61 @@ BARBERSHOP_INFO = {
     "phone": "+7 (999) 123-45-67",
 }
 
+# Кэш профилей и активных записей: сколько пользователей держать
+# и через сколько секунд без обращений забывать пользователя
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1000"))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "600"))
+
+# Повторные нажатия кнопок записи, отмены и выходных: сколько секунд и
+# сколько последних нажатий помнить, чтобы ответить на повтор без действия
+CALLBACK_DEDUP_TTL = int(os.getenv("CALLBACK_DEDUP_TTL", "60"))
+CALLBACK_DEDUP_SIZE = int(os.getenv("CALLBACK_DEDUP_SIZE", "1000"))
+
+# Сколько последних проверенных дат помнит индекс выходных
+DAYOFF_MEMO_SIZE = 1000
+
+# ICS-фид расписания барбера (GET /schedule.ics?token=...). Пустой токен -
+# фид выключен. Сервер слушает локальный адрес; наружу - через обратный прокси
+ICS_FEED_TOKEN = os.getenv("ICS_FEED_TOKEN", "")
+ICS_FEED_HOST = os.getenv("ICS_FEED_HOST", "127.0.0.1")
+ICS_FEED_PORT = int(os.getenv("ICS_FEED_PORT", "8080"))
+# Сколько прошедших дней оставлять в фиде
+ICS_FEED_PAST_DAYS = int(os.getenv("ICS_FEED_PAST_DAYS", "7"))
+
 # Количество дней для выбора даты
-BOOKING_DAYS_AHEAD = 14
+BOOKING_DAYS_AHEAD = int(os.getenv("BOOKING_DAYS_AHEAD", "14"))
+
+# На сколько дней вперед барбер может отметить выходной
+DAYOFF_DAYS_AHEAD = int(os.getenv("DAYOFF_DAYS_AHEAD", "90"))
+
+# Сколько ближайших свободных слотов показывать в /nearest
+NEAREST_SLOTS_COUNT = 6
+
+# Сколько последних записей клиента учитывать, подбирая слот для повтора
+REPEAT_HISTORY_SIZE = 10
+
+# На сколько минут освободившийся слот закрепляется за клиентом из листа ожидания
+WAITLIST_HOLD_MINUTES = 15
+
+# Outbox уведомлений: размер пачки, сколько раз пытаться отправить и как
+# часто (секунд) проверять отложенные повторы
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_POLL_INTERVAL = 5
+
+# Уведомления барберу о записях и отменах копятся BARBER_NOTIFY_WINDOW
+# секунд и приходят одним сообщением (0 - сразу, каждое отдельно; по умолчанию)
+BARBER_NOTIFY_WINDOW = int(os.getenv("BARBER_NOTIFY_WINDOW", "0"))
+# Утренняя сводка расписания барберу, HH:MM (пусто - не отправлять)
+BARBER_DIGEST_TIME = os.getenv("BARBER_DIGEST_TIME", "")
+
+# Диагностика: как часто (секунд) замерять задержку event loop, с какой
+# блокировки сохранять стек, шаг семплирования и длина отчета /profile
+WATCHDOG_INTERVAL = 0.1
+WATCHDOG_SLOW_THRESHOLD = 0.25
+PROFILE_SAMPLE_INTERVAL = 0.005
+PROFILE_MAX_SECONDS = 60
+PROFILE_TOP = 30
 
 # Количество кнопок времени в одном ряду
 TIME_BUTTONS_PER_ROW = 4
@@ -1,11 +1,25 @@
 # database.py
-from datetime import datetime
-from typing import Optional, List
-from sqlalchemy import String, Integer, BigInteger, DateTime, Boolean, select
+import html
+import logging
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Tuple, AsyncIterator, Sequence, Callable, Iterable, Union, NamedTuple
+from sqlalchemy import (
+    String, Text, Integer, BigInteger, DateTime, Boolean, Index, select, delete, update, insert, func, text,
+    case, or_, and_, exists, literal_column, inspect, cast, Connection
+)
+from sqlalchemy.exc import OperationalError, ProgrammingError, IntegrityError
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship, aliased
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.sql import Executable
 
-from config import DATABASE_URL
+from config import DATABASE_URL, WAITLIST_HOLD_MINUTES, BARBER_CHAT_ID
+from usercache import user_cache, MISSING
+
+logger = logging.getLogger(__name__)
 
 
 # База для моделей
@@ -53,10 +67,50 @@ class Booking(Base):
     # Комментарий барбера (опционально)
     barber_comment: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
     
+    # Статистика клиента. Не загружается: BookingDAO.create заполняет ее
+    # строкой, которую вернул UPSERT счетчиков, для уведомления барберу
+    client_stats: Mapped[Optional["ClientStats"]] = relationship(
+        primaryjoin="foreign(Booking.user_telegram_id) == ClientStats.telegram_id",
+        viewonly=True,
+        lazy="raise"
+    )
+    
+    __table_args__ = (
+        # Выборки по дате и диапазону дат (занятость, ближайшие слоты)
+        Index("ix_bookings_date_status", "booking_date", "status"),
+        # Не больше одной активной записи на слот, даже при одновременных подтверждениях
+        Index(
+            "ix_bookings_active_slot", "booking_date", "booking_time", unique=True,
+            sqlite_where=text("status = 'active'"),
+            postgresql_where=text("status = 'active'")
+        ),
+    )
+    
     def __repr__(self):
         return f"<Booking {self.user_name} - {self.booking_date} {self.booking_time}>"
 
 
+# Запись для чтения: только поля, которые показывают списки и кэш. Кортеж
+# без сессии и отслеживания изменений - в несколько раз легче объекта ORM
+class BookingView(NamedTuple):
+    id: int
+    user_telegram_id: int
+    user_name: str
+    user_phone: str
+    booking_date: str
+    booking_time: str
+    service_name: str
+    service_price: int
+    
+    @classmethod
+    def of(cls, booking: "Booking") -> "BookingView":
+        """Представление уже загруженной записи ORM"""
+        return cls(*(getattr(booking, field) for field in cls._fields))
+
+
+BOOKING_VIEW_COLUMNS = tuple(getattr(Booking, field) for field in BookingView._fields)
+
+
 # Модель для выходных дней барбера
 class BarberDayOff(Base):
     __tablename__ = "barber_daysoff"
@@ -70,15 +124,505 @@ class BarberDayOff(Base):
         return f"<BarberDayOff {self.date}>"
 
 
+# Правила выходных: период (отпуск) или еженедельный выходной
+class BarberDayOffRule(Base):
+    __tablename__ = "barber_dayoff_rules"
+    
+    id: Mapped[int] = mapped_column(primary_key=True)
+    kind: Mapped[str] = mapped_column(String(10))  # range, weekly
+    start_date: Mapped[Optional[str]] = mapped_column(String(10), nullable=True)  # DD.MM.YYYY, для range
+    end_date: Mapped[Optional[str]] = mapped_column(String(10), nullable=True)    # DD.MM.YYYY, для range
+    weekday: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)        # 0 - понедельник, для weekly
+    reason: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        if self.kind == "weekly":
+            return f"<BarberDayOffRule weekly {self.weekday}>"
+        return f"<BarberDayOffRule {self.start_date}-{self.end_date}>"
+
+
+# Лист ожидания занятых слотов. hold_until задан, когда слот освободился и
+# закреплен за клиентом до этого времени
+class WaitlistEntry(Base):
+    __tablename__ = "waitlist"
+    
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_telegram_id: Mapped[int] = mapped_column(BigInteger)
+    user_name: Mapped[str] = mapped_column(String(255))
+    user_phone: Mapped[str] = mapped_column(String(20))
+    user_username: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    slot_date: Mapped[str] = mapped_column(String(10))  # DD.MM.YYYY
+    slot_time: Mapped[str] = mapped_column(String(5))   # HH:MM
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    hold_until: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        Index("ix_waitlist_user_slot", "user_telegram_id", "slot_date", "slot_time", unique=True),
+        Index("ix_waitlist_slot", "slot_date", "slot_time"),
+        # Один слот закрепляется только за одним клиентом
+        Index(
+            "ix_waitlist_hold", "slot_date", "slot_time", unique=True,
+            sqlite_where=text("hold_until IS NOT NULL"),
+            postgresql_where=text("hold_until IS NOT NULL")
+        ),
+    )
+    
+    def __repr__(self):
+        return f"<WaitlistEntry {self.user_telegram_id} - {self.slot_date} {self.slot_time}>"
+
+
+# Исходящие уведомления (transactional outbox): пишутся в той же транзакции,
+# что и изменение записи, и отправляются фоновым воркером
+class OutboxMessage(Base):
+    __tablename__ = "outbox"
+    
+    id: Mapped[int] = mapped_column(primary_key=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger)
+    text: Mapped[str] = mapped_column(Text)
+    parse_mode: Mapped[Optional[str]] = mapped_column(String(10), nullable=True, default="HTML")
+    status: Mapped[str] = mapped_column(String(10), default="pending")  # pending, sent, failed
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    last_error: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    sent_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    
+    # Запись, о которой уведомление, и ее статус на момент уведомления:
+    # по ним OutboxWorker сокращает пары «запись + отмена» в одном окне
+    booking_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    booking_status: Mapped[Optional[str]] = mapped_column(String(20), nullable=True)
+    
+    __table_args__ = (
+        Index("ix_outbox_status_next", "status", "next_attempt_at"),
+    )
+    
+    def __repr__(self):
+        return f"<OutboxMessage {self.id} -> {self.chat_id} ({self.status})>"
+
+
+# Рабочие часы по дням недели
+class WorkingHours(Base):
+    __tablename__ = "working_hours"
+    
+    weekday: Mapped[int] = mapped_column(Integer, primary_key=True)  # 0 - понедельник
+    start_time: Mapped[str] = mapped_column(String(5))  # HH:MM, первый слот
+    end_time: Mapped[str] = mapped_column(String(5))    # HH:MM, последний слот
+    slot_step: Mapped[int] = mapped_column(Integer, default=30)  # в минутах
+    is_working: Mapped[bool] = mapped_column(Boolean, default=True)
+    
+    def __repr__(self):
+        return f"<WorkingHours {self.weekday}: {self.start_time}-{self.end_time}>"
+
+
+# Услуги барбершопа
+class Service(Base):
+    __tablename__ = "services"
+    
+    code: Mapped[str] = mapped_column(String(50), primary_key=True)
+    name: Mapped[str] = mapped_column(String(255))
+    price: Mapped[int] = mapped_column(Integer)
+    duration: Mapped[int] = mapped_column(Integer)  # в минутах
+    emoji: Mapped[str] = mapped_column(String(16), default="")
+    sort_order: Mapped[int] = mapped_column(Integer, default=0)
+    is_active: Mapped[bool] = mapped_column(Boolean, default=True)
+    
+    def __repr__(self):
+        return f"<Service {self.code}: {self.price}₽>"
+
+
+# Сводная статистика по дням и услугам (обновляется вместе с записями)
+class DailyStats(Base):
+    __tablename__ = "daily_stats"
+    
+    stat_date: Mapped[str] = mapped_column(String(10), primary_key=True)  # YYYY-MM-DD, сортируется как строка
+    service_type: Mapped[str] = mapped_column(String(50), primary_key=True)
+    bookings_count: Mapped[int] = mapped_column(Integer, default=0)
+    revenue: Mapped[int] = mapped_column(Integer, default=0)
+    occupied_minutes: Mapped[int] = mapped_column(Integer, default=0)
+    
+    def __repr__(self):
+        return f"<DailyStats {self.stat_date} {self.service_type}: {self.bookings_count}>"
+
+
+# Сводная загрузка по часам
+class HourlyStats(Base):
+    __tablename__ = "hourly_stats"
+    
+    stat_date: Mapped[str] = mapped_column(String(10), primary_key=True)  # YYYY-MM-DD
+    hour: Mapped[int] = mapped_column(Integer, primary_key=True)
+    bookings_count: Mapped[int] = mapped_column(Integer, default=0)
+    occupied_minutes: Mapped[int] = mapped_column(Integer, default=0)
+    
+    def __repr__(self):
+        return f"<HourlyStats {self.stat_date} {self.hour}:00: {self.bookings_count}>"
+
+
+# Счетчики по клиенту (обновляются вместе с записями)
+class ClientStats(Base):
+    __tablename__ = "client_stats"
+    
+    telegram_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    bookings_count: Mapped[int] = mapped_column(Integer, default=0)  # неотмененные записи
+    total_spent: Mapped[int] = mapped_column(Integer, default=0)
+    cancelled_count: Mapped[int] = mapped_column(Integer, default=0)
+    last_visit: Mapped[Optional[str]] = mapped_column(String(10), nullable=True)      # YYYY-MM-DD, самая поздняя запись
+    previous_visit: Mapped[Optional[str]] = mapped_column(String(10), nullable=True)  # YYYY-MM-DD, предыдущая дата
+    
+    def __repr__(self):
+        return f"<ClientStats {self.telegram_id}: {self.bookings_count}, {self.total_spent}₽>"
+
+
+# Модель версии схемы (одна строка)
+class SchemaVersion(Base):
+    __tablename__ = "schema_version"
+    
+    id: Mapped[int] = mapped_column(primary_key=True)
+    version: Mapped[int] = mapped_column(Integer)
+
+
 # Создание движка и сессии
 engine = create_async_engine(DATABASE_URL, echo=False)
 async_session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 
-async def init_db():
-    """Инициализация базы данных"""
+def pool_capacity(default: int = 10) -> int:
+    """Сколько соединений пул движка может выдать одновременно"""
+    pool = engine.pool
+    size = getattr(pool, "size", None)
+    if size is None:
+        return default
+    return size() + max(getattr(pool, "_max_overflow", 0), 0)
+
+
+# Версия схемы БД. Увеличивать при любом изменении моделей и добавлять
+# шаги в MIGRATIONS для уже существующих баз
+SCHEMA_VERSION = 9
+
+
+def _iso_date_sql(column):
+    """
+    SQL-выражение: DD.MM.YYYY -> YYYY-MM-DD (сравнивается как строка).
+    Аргументы - литералы, а не параметры запроса: только так выражение в
+    WHERE совпадает с выражением индекса ix_bookings_iso_date_status
+    """
+    dash = literal_column("'-'", String)
+
+    def part(start: int, length: int):
+        return func.substr(column, literal_column(str(start)), literal_column(str(length)), type_=String)
+
+    return part(7, 4) + dash + part(4, 2) + dash + part(1, 2)
+
+
+# Записи по диапазону дат (ICS-фид барбера): DD.MM.YYYY по порядку не
+# сравнивается, поэтому индекс построен по ISO-представлению даты
+ix_bookings_iso_date_status = Index(
+    "ix_bookings_iso_date_status", _iso_date_sql(Booking.booking_date), Booking.status
+)
+
+
+def _counted(booking=Booking):
+    """
+    Условие «запись учитывается в статистике»: все, кроме отмененных.
+    Общее для сводных таблиц и счетчиков клиентов, чтобы /report и история
+    клиента считали одни и те же записи (в том числе завершенные)
+    """
+    return booking.status != "cancelled"
+
+
+def _visit_dates() -> Dict:
+    """Значения last_visit и previous_visit, пересчитанные по неотмененным записям клиента"""
+    latest = aliased(Booking)
+    last_visit = select(func.max(_iso_date_sql(latest.booking_date))).where(
+        latest.user_telegram_id == ClientStats.telegram_id,
+        _counted(latest)
+    ).scalar_subquery()
+    earlier = aliased(Booking)
+    previous_visit = select(func.max(_iso_date_sql(earlier.booking_date))).where(
+        earlier.user_telegram_id == ClientStats.telegram_id,
+        _counted(earlier),
+        _iso_date_sql(earlier.booking_date) < last_visit
+    ).scalar_subquery()
+    return {"last_visit": last_visit, "previous_visit": previous_visit}
+
+
+def _stats_backfill() -> List[Executable]:
+    """Пересчитать daily_stats и hourly_stats по неотмененным записям (агрегация в БД)"""
+    active = _counted()
+    stat_date = _iso_date_sql(Booking.booking_date)
+    hour = cast(func.substr(Booking.booking_time, 1, 2), Integer)
+    return [
+        delete(DailyStats),
+        insert(DailyStats).from_select(
+            ["stat_date", "service_type", "bookings_count", "revenue", "occupied_minutes"],
+            select(
+                stat_date,
+                Booking.service_type,
+                func.count(),
+                func.sum(Booking.service_price),
+                func.sum(Booking.service_duration)
+            ).where(active).group_by(stat_date, Booking.service_type)
+        ),
+        delete(HourlyStats),
+        insert(HourlyStats).from_select(
+            ["stat_date", "hour", "bookings_count", "occupied_minutes"],
+            select(stat_date, hour, func.count(), func.sum(Booking.service_duration))
+            .where(active).group_by(stat_date, hour)
+        ),
+    ]
+
+
+def _client_stats_backfill() -> List[Executable]:
+    """Пересчитать client_stats по всей истории записей (агрегация в БД)"""
+    active = _counted()
+    return [
+        delete(ClientStats),
+        insert(ClientStats).from_select(
+            ["telegram_id", "bookings_count", "total_spent", "cancelled_count"],
+            select(
+                Booking.user_telegram_id,
+                func.sum(case((active, 1), else_=0)),
+                func.sum(case((active, Booking.service_price), else_=0)),
+                func.sum(case((Booking.status == "cancelled", 1), else_=0))
+            ).group_by(Booking.user_telegram_id)
+        ),
+        update(ClientStats).values(**_visit_dates()).execution_options(synchronize_session=False),
+    ]
+
+
+def _add_column(table: str, column: str, ddl_type: str) -> Callable[[Connection], None]:
+    """Шаг миграции: добавить колонку, если ее нет (create_all мог создать таблицу уже с ней)"""
+    def step(conn: Connection) -> None:
+        if column not in {info["name"] for info in inspect(conn).get_columns(table)}:
+            conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}")
+    return step
+
+
+def _cancel_duplicate_bookings(conn: Connection) -> None:
+    """
+    Шаг миграции: отменить активные дубли на один слот (остается самая ранняя
+    запись) и поставить в outbox уведомления клиенту и барберу
+    """
+    earliest = select(func.min(Booking.id)).where(Booking.status == "active").group_by(
+        Booking.booking_date, Booking.booking_time
+    )
+    duplicates = conn.execute(
+        select(
+            Booking.id, Booking.user_telegram_id, Booking.user_name, Booking.user_phone,
+            Booking.booking_date, Booking.booking_time, Booking.service_name
+        ).where(Booking.status == "active", Booking.id.not_in(earliest))
+    ).all()
+    if not duplicates:
+        return
+    
+    messages = []
+    for booking in duplicates:
+        logger.warning(
+            "Миграция: запись #%d (%s %s, клиент %d) отменена как дубль слота",
+            booking.id, booking.booking_date, booking.booking_time, booking.user_telegram_id
+        )
+        messages.append({"chat_id": booking.user_telegram_id, "text": (
+            f"❌ <b>Запись отменена!</b>\n\n"
+            f"На {booking.booking_date} в {booking.booking_time} оказалось две записи, "
+            f"время осталось за записью, сделанной раньше.\n\n"
+            f"🆔 <b>Номер записи:</b> <code>{booking.id}</code>\n"
+            f"💈 <b>Услуга:</b> {html.escape(booking.service_name)}\n\n"
+            f"Для новой записи используйте /book\n\n"
+            f"Приносим извинения за неудобства! 😔"
+        )})
+        if BARBER_CHAT_ID:
+            messages.append({"chat_id": int(BARBER_CHAT_ID), "text": (
+                f"❌ <b>ОТМЕНА ДУБЛЯ ЗАПИСИ</b>\n\n"
+                f"🆔 <b>Номер:</b> <code>{booking.id}</code>\n"
+                f"👤 <b>Клиент:</b> {html.escape(booking.user_name)}, {html.escape(booking.user_phone)}\n"
+                f"📅 <b>Дата:</b> {booking.booking_date}\n"
+                f"🕐 <b>Время:</b> {booking.booking_time}\n"
+                f"💈 <b>Услуга:</b> {html.escape(booking.service_name)}"
+            )})
+    
+    # booking_id/booking_status не заполняются: в старой таблице outbox их еще нет (шаг 8)
+    conn.execute(insert(OutboxMessage), messages)
+    conn.execute(
+        update(Booking).where(Booking.id.in_([booking.id for booking in duplicates]))
+        .values(status="cancelled")
+    )
+
+
+# Миграции существующих БД: версия -> SQL (строка, выражение SQLAlchemy или
+# функция, выполняемая через run_sync). Новые таблицы создает create_all,
+# здесь только то, что он не делает для уже существующих таблиц, и
+# заполнение новых таблиц по истории
+MIGRATIONS: Dict[int, List[Union[str, Executable, Callable[[Connection], None]]]] = {
+    1: [
+        "CREATE INDEX IF NOT EXISTS ix_bookings_date_status ON bookings (booking_date, status)",
+    ],
+    5: _client_stats_backfill(),
+    # Уникальность активной записи на слот. Дубли, созданные гонкой до
+    # появления индекса, отменяются с уведомлением клиента и барбера, затем
+    # пересчитываются сводная статистика и счетчики клиентов
+    6: [
+        _cancel_duplicate_bookings,
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_bookings_active_slot ON bookings (booking_date, booking_time) "
+        "WHERE status = 'active'",
+    ] + _stats_backfill() + _client_stats_backfill(),
+    7: [
+        CreateIndex(ix_bookings_iso_date_status, if_not_exists=True),
+    ],
+    8: [
+        _add_column("outbox", "booking_id", "INTEGER"),
+        _add_column("outbox", "booking_status", "VARCHAR(20)"),
+    ],
+    # Сводные таблицы в базах, где история записей появилась раньше них
+    9: _stats_backfill(),
+}
+
+
+def _phone_digits_sql(column: str) -> str:
+    """SQL-выражение: телефон без +, пробелов, скобок, дефисов и точек"""
+    expression = column
+    for char in "+ ()-.":
+        expression = f"replace({expression}, '{char}', '')"
+    return expression
+
+
+def _fts_index_sql(table: str, fts: str, columns: Dict[str, str], update_of: str) -> List[str]:
+    """Таблица FTS5 (триграммы) над table, заполнение и триггеры синхронизации"""
+    names = ", ".join(columns)
+    values = ", ".join(expression.format(row="new") for expression in columns.values())
+    source = ", ".join(expression.format(row=table) for expression in columns.values())
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({names}, tokenize='trigram')",
+        f"DELETE FROM {fts}",
+        f"INSERT INTO {fts}(rowid, {names}) SELECT {table}.id, {source} FROM {table}",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {update_of} ON {table} BEGIN "
+        f"DELETE FROM {fts} WHERE rowid = old.id; "
+        f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"DELETE FROM {fts} WHERE rowid = old.id; END",
+    ]
+
+
+# Миграции только для SQLite (FTS5): версия -> SQL
+SQLITE_MIGRATIONS: Dict[int, List[str]] = {
+    # Поиск клиентов: имя, username и телефон (только цифры). Триграммы
+    # позволяют искать по любому фрагменту от 3 символов. Записи
+    # переиндексируются только при изменении данных клиента, а не статуса
+    4: _fts_index_sql("users", "users_fts", {
+        "full_name": "{row}.full_name",
+        "username": "coalesce({row}.username, '')",
+        "phone": _phone_digits_sql("{row}.phone"),
+    }, "full_name, username, phone") + _fts_index_sql("bookings", "bookings_fts", {
+        "user_name": "{row}.user_name",
+        "user_username": "coalesce({row}.user_username, '')",
+        "phone": _phone_digits_sql("{row}.user_phone"),
+    }, "user_name, user_username, user_phone"),
+}
+
+
+async def get_schema_version() -> int:
+    """Текущая версия схемы в БД (0, если БД новая или создана до версионирования)"""
+    try:
+        async with engine.connect() as conn:
+            version = await conn.scalar(select(SchemaVersion.version).where(SchemaVersion.id == 1))
+            return version or 0
+    except (OperationalError, ProgrammingError):
+        return 0
+
+
+async def init_db() -> bool:
+    """
+    Инициализация базы данных. Если версия схемы совпадает, ничего не
+    создается и не проверяется. Возвращает True, если схема обновлялась.
+    """
+    stored_version = await get_schema_version()
+    if stored_version == SCHEMA_VERSION:
+        return False
+    
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        migrations = [MIGRATIONS]
+        if engine.dialect.name == "sqlite":
+            migrations.append(SQLITE_MIGRATIONS)
+        for version in range(stored_version + 1, SCHEMA_VERSION + 1):
+            for steps in migrations:
+                for statement in steps.get(version, []):
+                    if isinstance(statement, str):
+                        await conn.execute(text(statement))
+                    elif isinstance(statement, Executable):
+                        await conn.execute(statement)
+                    else:
+                        await conn.run_sync(statement)
+        
+        stmt = _insert(SchemaVersion).values(id=1, version=SCHEMA_VERSION)
+        await conn.execute(stmt.on_conflict_do_update(
+            index_elements=[SchemaVersion.id],
+            set_={"version": stmt.excluded.version}
+        ))
+    return True
+
+
+# Подписчики на изменения записей: вызываются после коммита с датами,
+# на которых изменилась занятость (кэши в памяти сбрасывают эти даты)
+booking_change_listeners: List[Callable[[Iterable[str]], None]] = []
+
+
+def _notify_booking_change(dates: Iterable[str]) -> None:
+    dates = set(dates)
+    if not dates:
+        return
+    for listener in booking_change_listeners:
+        listener(dates)
+
+
+# Подписчики на закрепление освободившихся слотов за клиентами из листа
+# ожидания: вызываются после коммита со списком закрепленных записей
+slot_hold_listeners: List[Callable[[List["WaitlistEntry"]], None]] = []
+
+
+def _notify_holds(entries: List["WaitlistEntry"]) -> None:
+    if not entries:
+        return
+    for listener in slot_hold_listeners:
+        listener(entries)
+
+
+# Подписчики на новые уведомления в outbox: вызываются после коммита
+outbox_listeners: List[Callable[[], None]] = []
+
+# Задержка отправки уведомлений по чатам, секунд: уведомления в такой чат
+# копятся и уходят одним сообщением (задает outbox.OutboxWorker)
+outbox_delays: Dict[int, float] = {}
+
+# Уведомления для записи: функция получает запись (уже с id) и возвращает
+# пары (chat_id, текст), которые попадут в outbox в той же транзакции
+OutboxFactory = Callable[["Booking"], Iterable[Tuple[int, str]]]
+
+
+def _enqueue(session: AsyncSession, bookings: Iterable["Booking"], outbox: Optional[OutboxFactory]) -> int:
+    """Добавить уведомления по записям в outbox текущей транзакции"""
+    if outbox is None:
+        return 0
+    now = datetime.utcnow()
+    messages = [
+        OutboxMessage(
+            chat_id=chat_id, text=text, created_at=now,
+            next_attempt_at=now + timedelta(seconds=outbox_delays.get(chat_id, 0)),
+            booking_id=booking.id, booking_status=booking.status
+        )
+        for booking in bookings
+        for chat_id, text in outbox(booking)
+    ]
+    session.add_all(messages)
+    return len(messages)
+
+
+def _notify_outbox(count: int) -> None:
+    if not count:
+        return
+    for listener in outbox_listeners:
+        listener()
 
 
 async def get_session() -> AsyncSession:
@@ -87,6 +631,232 @@ async def get_session() -> AsyncSession:
         return session
 
 
+async def _read_views(stmt) -> List[BookingView]:
+    """Выполнить SELECT колонок BOOKING_VIEW_COLUMNS на соединении, без сессии ORM"""
+    async with engine.connect() as conn:
+        result = await conn.execute(stmt)
+        return [BookingView._make(row) for row in result]
+
+
+def to_iso_date(date_str: str) -> str:
+    """DD.MM.YYYY -> YYYY-MM-DD"""
+    day, month, year = date_str.split(".")
+    return f"{year}-{month}-{day}"
+
+
+def _insert(model):
+    """INSERT с поддержкой ON CONFLICT для диалекта текущей БД"""
+    if engine.dialect.name == "postgresql":
+        return pg_insert(model)
+    return sqlite_insert(model)
+
+
+def _accumulate_stats(bookings, sign: int, daily: Dict, hourly: Dict) -> None:
+    """Сложить вклад записей в сводные счетчики (sign = 1 создание, -1 отмена)"""
+    for booking in bookings:
+        stat_date = to_iso_date(booking.booking_date)
+        
+        counters = daily.setdefault((stat_date, booking.service_type), [0, 0, 0])
+        counters[0] += sign
+        counters[1] += sign * booking.service_price
+        counters[2] += sign * booking.service_duration
+        
+        counters = hourly.setdefault((stat_date, int(booking.booking_time[:2])), [0, 0])
+        counters[0] += sign
+        counters[1] += sign * booking.service_duration
+
+
+# Максимум строк в одном INSERT (SQLite ограничивает число параметров запроса)
+STATS_INSERT_CHUNK = 500
+
+
+async def _upsert_stats(session: AsyncSession, daily: Dict, hourly: Dict) -> None:
+    """Прибавить счетчики к сводным таблицам пакетными INSERT ... ON CONFLICT"""
+    daily_rows = [
+        {
+            "stat_date": stat_date,
+            "service_type": service_type,
+            "bookings_count": count,
+            "revenue": revenue,
+            "occupied_minutes": minutes,
+        }
+        for (stat_date, service_type), (count, revenue, minutes) in daily.items()
+    ]
+    for i in range(0, len(daily_rows), STATS_INSERT_CHUNK):
+        stmt = _insert(DailyStats).values(daily_rows[i:i + STATS_INSERT_CHUNK])
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=[DailyStats.stat_date, DailyStats.service_type],
+            set_={
+                "bookings_count": DailyStats.bookings_count + stmt.excluded.bookings_count,
+                "revenue": DailyStats.revenue + stmt.excluded.revenue,
+                "occupied_minutes": DailyStats.occupied_minutes + stmt.excluded.occupied_minutes,
+            }
+        ))
+    
+    hourly_rows = [
+        {"stat_date": stat_date, "hour": hour, "bookings_count": count, "occupied_minutes": minutes}
+        for (stat_date, hour), (count, minutes) in hourly.items()
+    ]
+    for i in range(0, len(hourly_rows), STATS_INSERT_CHUNK):
+        stmt = _insert(HourlyStats).values(hourly_rows[i:i + STATS_INSERT_CHUNK])
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=[HourlyStats.stat_date, HourlyStats.hour],
+            set_={
+                "bookings_count": HourlyStats.bookings_count + stmt.excluded.bookings_count,
+                "occupied_minutes": HourlyStats.occupied_minutes + stmt.excluded.occupied_minutes,
+            }
+        ))
+
+
+async def _apply_booking_stats(session: AsyncSession, bookings, sign: int) -> None:
+    """Учесть создание/отмену записей в сводной статистике в текущей транзакции"""
+    daily, hourly = {}, {}
+    _accumulate_stats(bookings, sign, daily, hourly)
+    await _upsert_stats(session, daily, hourly)
+
+
+async def _apply_client_booking(session: AsyncSession, booking: Booking) -> ClientStats:
+    """Учесть новую запись в счетчиках клиента одним UPSERT; возвращает обновленную строку"""
+    stmt = _insert(ClientStats).values(
+        telegram_id=booking.user_telegram_id,
+        bookings_count=1,
+        total_spent=booking.service_price,
+        cancelled_count=0,
+        last_visit=to_iso_date(booking.booking_date)
+    )
+    visit = stmt.excluded.last_visit
+    later = or_(ClientStats.last_visit.is_(None), visit > ClientStats.last_visit)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ClientStats.telegram_id],
+        set_={
+            "bookings_count": ClientStats.bookings_count + 1,
+            "total_spent": ClientStats.total_spent + stmt.excluded.total_spent,
+            "last_visit": case((later, visit), else_=ClientStats.last_visit),
+            # Дата между предыдущей и последней становится предыдущей
+            "previous_visit": case(
+                (later, ClientStats.last_visit),
+                (and_(
+                    visit < ClientStats.last_visit,
+                    or_(ClientStats.previous_visit.is_(None), visit > ClientStats.previous_visit)
+                ), visit),
+                else_=ClientStats.previous_visit
+            ),
+        }
+    )
+    return await session.scalar(stmt.returning(ClientStats), execution_options={"populate_existing": True})
+
+
+async def _apply_client_cancellations(session: AsyncSession, bookings) -> None:
+    """Учесть отмену записей в счетчиках клиентов (статус уже записан в текущей транзакции)"""
+    totals: Dict[int, List[int]] = {}
+    for booking in bookings:
+        counters = totals.setdefault(booking.user_telegram_id, [0, 0])
+        counters[0] += 1
+        counters[1] += booking.service_price
+    for telegram_id, (count, spent) in totals.items():
+        await session.execute(
+            update(ClientStats)
+            .where(ClientStats.telegram_id == telegram_id)
+            .values(
+                bookings_count=ClientStats.bookings_count - count,
+                total_spent=ClientStats.total_spent - spent,
+                cancelled_count=ClientStats.cancelled_count + count,
+                **_visit_dates()
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+
+async def _is_slot_blocked(session: AsyncSession, booking: Booking) -> bool:
+    """
+    Нельзя записаться: дата - выходной (отдельный день, еженедельное правило
+    или период) или слот закреплен за другим клиентом из листа ожидания
+    """
+    day = datetime.strptime(booking.booking_date, "%d.%m.%Y")
+    iso_date = day.strftime("%Y-%m-%d")
+    return bool(await session.scalar(select(or_(
+        exists().where(BarberDayOff.date == booking.booking_date),
+        exists().where(BarberDayOffRule.kind == "weekly", BarberDayOffRule.weekday == day.weekday()),
+        exists().where(
+            BarberDayOffRule.kind == "range",
+            _iso_date_sql(BarberDayOffRule.start_date) <= iso_date,
+            _iso_date_sql(BarberDayOffRule.end_date) >= iso_date
+        ),
+        exists().where(
+            WaitlistEntry.slot_date == booking.booking_date,
+            WaitlistEntry.slot_time == booking.booking_time,
+            WaitlistEntry.hold_until > datetime.utcnow(),
+            WaitlistEntry.user_telegram_id != booking.user_telegram_id
+        ),
+    ))))
+
+
+async def _cancel_on_dates(session: AsyncSession, dates: List[str]) -> List[Booking]:
+    """Отменить все активные записи на даты одним UPDATE в текущей транзакции"""
+    if not dates:
+        return []
+    result = await session.scalars(
+        update(Booking)
+        .where(Booking.booking_date.in_(dates), Booking.status == "active")
+        .values(status="cancelled")
+        .returning(Booking)
+    )
+    bookings = list(result.all())
+    await _apply_booking_stats(session, bookings, -1)
+    await _apply_client_cancellations(session, bookings)
+    return bookings
+
+
+async def _hold_free_slots(session: AsyncSession, dates: Iterable[str]) -> List[WaitlistEntry]:
+    """
+    Закрепить свободные слоты на даты за первыми в листе ожидания в текущей
+    транзакции. Истекшие закрепления на этих датах снимаются.
+    """
+    # Прошедшие даты предлагать бессмысленно
+    today = datetime.now().strftime("%Y-%m-%d")
+    dates = [date for date in set(dates) if to_iso_date(date) >= today]
+    if not dates:
+        return []
+    now = datetime.utcnow()
+    await session.execute(
+        delete(WaitlistEntry).where(
+            WaitlistEntry.slot_date.in_(dates),
+            WaitlistEntry.hold_until <= now
+        )
+    )
+    entries = (await session.scalars(
+        select(WaitlistEntry)
+        .where(WaitlistEntry.slot_date.in_(dates))
+        .order_by(WaitlistEntry.id)
+    )).all()
+    if not entries:
+        return []
+    
+    taken = {(entry.slot_date, entry.slot_time) for entry in entries if entry.hold_until is not None}
+    taken.update(tuple(row) for row in await session.execute(
+        select(Booking.booking_date, Booking.booking_time).where(
+            Booking.booking_date.in_(dates),
+            Booking.status == "active"
+        )
+    ))
+    chosen = []
+    for entry in entries:
+        slot = (entry.slot_date, entry.slot_time)
+        if slot not in taken:
+            taken.add(slot)
+            chosen.append(entry.id)
+    if not chosen:
+        return []
+    
+    result = await session.scalars(
+        update(WaitlistEntry)
+        .where(WaitlistEntry.id.in_(chosen), WaitlistEntry.hold_until.is_(None))
+        .values(hold_until=now + timedelta(minutes=WAITLIST_HOLD_MINUTES))
+        .returning(WaitlistEntry)
+    )
+    return list(result.all())
+
+
 # CRUD операции для пользователей
 class UserDAO:
     @staticmethod
@@ -121,16 +891,23 @@ class UserDAO:
             
             await session.commit()
             await session.refresh(user)
+            user_cache.set_user(telegram_id, user)
             return user
     
     @staticmethod
     async def get_by_telegram_id(telegram_id: int) -> Optional[User]:
-        """Получить пользователя по telegram_id"""
+        """Получить пользователя по telegram_id (сначала из кэша)"""
+        user = user_cache.get_user(telegram_id)
+        if user is not MISSING:
+            return user
+        version = user_cache.version()
         async with async_session_maker() as session:
             result = await session.execute(
                 select(User).where(User.telegram_id == telegram_id)
             )
-            return result.scalar_one_or_none()
+            user = result.scalar_one_or_none()
+        user_cache.put_user(telegram_id, user, version)
+        return user
 
 
 # CRUD операции для записей
@@ -146,9 +923,16 @@ class BookingDAO:
         service_type: str,
         service_name: str,
         service_price: int,
-        service_duration: int
-    ) -> Booking:
-        """Создать запись"""
+        service_duration: int,
+        outbox: Optional[OutboxFactory] = None
+    ) -> Optional[Booking]:
+        """
+        Создать запись (и уведомления о ней в той же транзакции). None, если
+        слот уже занят, закреплен за другим клиентом или дата стала выходным.
+        Проверки в обработчиках - быстрый путь, а окончательно решают
+        уникальный индекс и проверка после INSERT, когда транзакция уже
+        держит блокировку записи и не пропустит параллельный выходной
+        """
         async with async_session_maker() as session:
             booking = Booking(
                 user_telegram_id=user_telegram_id,
@@ -163,8 +947,34 @@ class BookingDAO:
                 service_duration=service_duration
             )
             session.add(booking)
+            try:
+                await session.flush()
+            except IntegrityError:
+                await session.rollback()
+                return None
+            if await _is_slot_blocked(session, booking):
+                await session.rollback()
+                return None
+            await _apply_booking_stats(session, [booking], 1)
+            stats = await _apply_client_booking(session, booking)
+            # Клиент записался на слот, которого ждал - убираем его из листа ожидания
+            await session.execute(
+                delete(WaitlistEntry).where(
+                    WaitlistEntry.user_telegram_id == user_telegram_id,
+                    WaitlistEntry.slot_date == booking_date,
+                    WaitlistEntry.slot_time == booking_time
+                )
+            )
+            await session.flush()
+            set_committed_value(booking, "client_stats", stats)
+            queued = _enqueue(session, [booking], outbox)
             await session.commit()
+            _notify_booking_change([booking_date])
+            _notify_outbox(queued)
             await session.refresh(booking)
+            # refresh сбрасывает связи - счетчики клиента прикрепляются заново
+            set_committed_value(booking, "client_stats", stats)
+            user_cache.add_booking(BookingView.of(booking))
             return booking
     
     @staticmethod
@@ -181,63 +991,145 @@ class BookingDAO:
             return result.scalar_one_or_none()
     
     @staticmethod
-    async def get_by_date(booking_date: str) -> List[Booking]:
+    async def get_by_date(booking_date: str) -> List[BookingView]:
         """Получить все записи на определенную дату"""
+        return await _read_views(
+            select(*BOOKING_VIEW_COLUMNS).where(
+                Booking.booking_date == booking_date,
+                Booking.status == "active"
+            ).order_by(Booking.booking_time)
+        )
+    
+    @staticmethod
+    async def get_busy_slots(dates: List[str]) -> List[Tuple[str, str]]:
+        """
+        Занятые слоты (дата, время) на несколько дат одним запросом: активные
+        записи и слоты, закрепленные за клиентами из листа ожидания
+        """
+        if not dates:
+            return []
         async with async_session_maker() as session:
             result = await session.execute(
-                select(Booking).where(
-                    Booking.booking_date == booking_date,
+                select(Booking.booking_date, Booking.booking_time).where(
+                    Booking.booking_date.in_(dates),
                     Booking.status == "active"
-                ).order_by(Booking.booking_time)
+                ).union_all(
+                    select(WaitlistEntry.slot_date, WaitlistEntry.slot_time).where(
+                        WaitlistEntry.slot_date.in_(dates),
+                        WaitlistEntry.hold_until > datetime.utcnow()
+                    )
+                )
             )
-            return list(result.scalars().all())
+            return [tuple(row) for row in result.all()]
     
     @staticmethod
-    async def get_user_bookings(telegram_id: int, status: str = "active") -> List[Booking]:
-        """Получить записи пользователя"""
+    async def get_user_bookings(telegram_id: int, status: str = "active") -> List[BookingView]:
+        """Получить записи пользователя (активные - из кэша)"""
+        if status == "active":
+            bookings = user_cache.get_bookings(telegram_id)
+            if bookings is not MISSING:
+                return list(bookings)
+        version = user_cache.version()
+        bookings = await _read_views(
+            select(*BOOKING_VIEW_COLUMNS).where(
+                Booking.user_telegram_id == telegram_id,
+                Booking.status == status
+            ).order_by(Booking.booking_date, Booking.booking_time)
+        )
+        if status == "active":
+            user_cache.put_bookings(telegram_id, bookings, version)
+        return bookings
+    
+    @staticmethod
+    async def get_history(telegram_id: int, limit: int) -> List[Tuple[str, str, str]]:
+        """Последние неотмененные записи клиента (дата, время, услуга), новые первыми"""
         async with async_session_maker() as session:
             result = await session.execute(
-                select(Booking).where(
+                select(Booking.booking_date, Booking.booking_time, Booking.service_type).where(
                     Booking.user_telegram_id == telegram_id,
-                    Booking.status == status
-                ).order_by(Booking.booking_date, Booking.booking_time)
+                    Booking.status != "cancelled"
+                ).order_by(Booking.id.desc()).limit(limit)
             )
-            return list(result.scalars().all())
+            return [tuple(row) for row in result.all()]
     
     @staticmethod
-    async def get_by_id(booking_id: int) -> Optional[Booking]:
-        """Получить запись по ID"""
-        async with async_session_maker() as session:
-            result = await session.execute(
-                select(Booking).where(Booking.id == booking_id)
-            )
-            return result.scalar_one_or_none()
+    async def get_by_id(booking_id: int) -> Optional[BookingView]:
+        """Получить запись по ID (активную - из кэша, если он загружен)"""
+        booking = user_cache.get_booking(booking_id)
+        if booking is not MISSING:
+            return booking
+        bookings = await _read_views(select(*BOOKING_VIEW_COLUMNS).where(Booking.id == booking_id))
+        return bookings[0] if bookings else None
     
     @staticmethod
-    async def cancel(booking_id: int) -> bool:
-        """Отменить запись"""
+    async def cancel(booking_id: int, outbox: Optional[OutboxFactory] = None) -> bool:
+        """
+        Отменить запись (и поставить уведомления об отмене в outbox).
+        Статус меняется одним условным UPDATE, поэтому одновременные отмены
+        (клиентом, барбером, выходным) учитываются в счетчиках только один раз
+        """
         async with async_session_maker() as session:
-            result = await session.execute(
-                select(Booking).where(Booking.id == booking_id)
+            result = await session.scalars(
+                update(Booking)
+                .where(Booking.id == booking_id, Booking.status == "active")
+                .values(status="cancelled")
+                .returning(Booking)
             )
-            booking = result.scalar_one_or_none()
+            booking = result.one_or_none()
+            if booking is None:
+                # Записи нет или она уже отменена
+                return await session.get(Booking, booking_id) is not None
             
-            if booking:
-                booking.status = "cancelled"
-                await session.commit()
-                return True
-            return False
+            await _apply_booking_stats(session, [booking], -1)
+            await _apply_client_cancellations(session, [booking])
+            # Освободившийся слот сразу закрепляется за первым в листе ожидания
+            held = await _hold_free_slots(session, [booking.booking_date])
+            queued = _enqueue(session, [booking], outbox)
+            await session.commit()
+            _notify_booking_change([booking.booking_date])
+            user_cache.remove_bookings([booking])
+            _notify_holds(held)
+            _notify_outbox(queued)
+            return True
     
     @staticmethod
-    async def get_all_active() -> List[Booking]:
-        """Получить все активные записи"""
+    async def stream_rows(columns: Sequence, batch_size: int = 1000) -> AsyncIterator[Sequence]:
+        """Потоково выдать строки записей (только указанные колонки) пачками по batch_size"""
         async with async_session_maker() as session:
-            result = await session.execute(
-                select(Booking).where(
+            result = await session.stream(
+                select(*columns).order_by(Booking.id).execution_options(yield_per=batch_size)
+            )
+            async for partition in result.partitions():
+                yield partition
+    
+    @staticmethod
+    async def get_schedule(start_date: str) -> List[Tuple[int, str, str, str, int, str, str]]:
+        """
+        Активные записи начиная с даты DD.MM.YYYY одним запросом по индексу
+        ix_bookings_iso_date_status: (id, дата, время, услуга, длительность,
+        имя, телефон), по порядку
+        """
+        iso_date = _iso_date_sql(Booking.booking_date)
+        async with engine.connect() as conn:
+            result = await conn.execute(
+                select(
+                    Booking.id, Booking.booking_date, Booking.booking_time, Booking.service_name,
+                    Booking.service_duration, Booking.user_name, Booking.user_phone
+                ).where(
+                    iso_date >= to_iso_date(start_date),
                     Booking.status == "active"
-                ).order_by(Booking.booking_date, Booking.booking_time)
+                ).order_by(iso_date, Booking.booking_time)
             )
-            return list(result.scalars().all())
+            return [tuple(row) for row in result.all()]
+    
+    @staticmethod
+    async def get_all_active() -> List[BookingView]:
+        """Получить все активные записи"""
+        return await _read_views(
+            select(*BOOKING_VIEW_COLUMNS).where(
+                Booking.status == "active"
+            ).order_by(Booking.booking_date, Booking.booking_time)
+        )
 
 
 # CRUD операции для выходных дней
@@ -252,6 +1144,35 @@ class BarberDayOffDAO:
             await session.refresh(day_off)
             return day_off
     
+    @staticmethod
+    async def create_many(
+        dates: List[str],
+        reason: Optional[str] = None,
+        outbox: Optional[OutboxFactory] = None
+    ) -> Tuple[List[str], List[Booking]]:
+        """
+        Добавить несколько выходных одним INSERT и отменить записи на эти даты.
+        Возвращает новые даты (уже существующие пропускаются) и отмененные записи.
+        Уведомления по отмененным записям попадают в outbox той же транзакции.
+        """
+        if not dates:
+            return [], []
+        async with async_session_maker() as session:
+            stmt = _insert(BarberDayOff).values([
+                {"date": date, "reason": reason, "created_at": datetime.utcnow()} for date in dates
+            ])
+            result = await session.execute(
+                stmt.on_conflict_do_nothing(index_elements=[BarberDayOff.date]).returning(BarberDayOff.date)
+            )
+            added = list(result.scalars().all())
+            cancelled = await _cancel_on_dates(session, dates)
+            queued = _enqueue(session, cancelled, outbox)
+            await session.commit()
+            _notify_booking_change(booking.booking_date for booking in cancelled)
+            user_cache.remove_bookings(cancelled)
+            _notify_outbox(queued)
+            return added, cancelled
+    
     @staticmethod
     async def get_by_date(date: str) -> Optional[BarberDayOff]:
         """Получить выходной по дате"""
@@ -294,4 +1215,462 @@ class BarberDayOffDAO:
                 .order_by(BarberDayOff.date)
                 .limit(limit)
             )
-            return list(result.scalars().all())
\ No newline at end of file
+            return list(result.scalars().all())
+
+
+# Лист ожидания занятых слотов
+class WaitlistDAO:
+    @staticmethod
+    async def add(
+        telegram_id: int,
+        name: str,
+        phone: str,
+        username: Optional[str],
+        slot_date: str,
+        slot_time: str
+    ) -> bool:
+        """Встать в лист ожидания слота. False, если клиент уже ждет этот слот"""
+        async with async_session_maker() as session:
+            result = await session.execute(
+                _insert(WaitlistEntry).values(
+                    user_telegram_id=telegram_id,
+                    user_name=name,
+                    user_phone=phone,
+                    user_username=username,
+                    slot_date=slot_date,
+                    slot_time=slot_time,
+                    created_at=datetime.utcnow()
+                ).on_conflict_do_nothing(
+                    index_elements=[WaitlistEntry.user_telegram_id, WaitlistEntry.slot_date, WaitlistEntry.slot_time]
+                ).returning(WaitlistEntry.id)
+            )
+            added = result.scalar_one_or_none() is not None
+            await session.commit()
+            return added
+    
+    @staticmethod
+    async def get_hold(entry_id: int) -> Optional[WaitlistEntry]:
+        """Действующее закрепление слота по id записи листа ожидания"""
+        async with async_session_maker() as session:
+            result = await session.execute(
+                select(WaitlistEntry).where(
+                    WaitlistEntry.id == entry_id,
+                    WaitlistEntry.hold_until > datetime.utcnow()
+                )
+            )
+            return result.scalar_one_or_none()
+    
+    @staticmethod
+    async def held_by(slot_date: str, slot_time: str) -> Optional[int]:
+        """telegram_id клиента, за которым сейчас закреплен слот"""
+        async with async_session_maker() as session:
+            return await session.scalar(
+                select(WaitlistEntry.user_telegram_id).where(
+                    WaitlistEntry.slot_date == slot_date,
+                    WaitlistEntry.slot_time == slot_time,
+                    WaitlistEntry.hold_until > datetime.utcnow()
+                )
+            )
+    
+    @staticmethod
+    async def get_waiting_dates() -> List[str]:
+        """Даты, на которые есть ожидающие клиенты"""
+        async with async_session_maker() as session:
+            result = await session.execute(select(WaitlistEntry.slot_date).distinct())
+            return list(result.scalars().all())
+    
+    @staticmethod
+    async def hold_free_slots(dates: List[str]) -> List[WaitlistEntry]:
+        """Закрепить свободные слоты на даты за первыми ожидающими (после снятия выходного)"""
+        async with async_session_maker() as session:
+            held = await _hold_free_slots(session, dates)
+            await session.commit()
+        _notify_booking_change(entry.slot_date for entry in held)
+        _notify_holds(held)
+        return held
+    
+    @staticmethod
+    async def release(entry_id: int, expired_only: bool = False) -> bool:
+        """
+        Убрать клиента из листа ожидания (отказ или истекшее закрепление) и
+        в той же транзакции передать слот следующему ожидающему
+        """
+        async with async_session_maker() as session:
+            conditions = [WaitlistEntry.id == entry_id]
+            if expired_only:
+                conditions.append(WaitlistEntry.hold_until <= datetime.utcnow())
+            result = await session.execute(
+                delete(WaitlistEntry).where(*conditions).returning(WaitlistEntry.slot_date)
+            )
+            slot_date = result.scalar_one_or_none()
+            if slot_date is None:
+                return False
+            held = await _hold_free_slots(session, [slot_date])
+            await session.commit()
+        _notify_booking_change([slot_date])
+        _notify_holds(held)
+        return True
+    
+    @staticmethod
+    async def get_expired_dates() -> List[str]:
+        """Даты с истекшими закреплениями (например, после перезапуска бота)"""
+        async with async_session_maker() as session:
+            result = await session.execute(
+                select(WaitlistEntry.slot_date).where(
+                    WaitlistEntry.hold_until <= datetime.utcnow()
+                ).distinct()
+            )
+            return list(result.scalars().all())
+
+
+# Очередь исходящих уведомлений
+class OutboxDAO:
+    @staticmethod
+    async def get_due(limit: int = 50) -> List[OutboxMessage]:
+        """Неотправленные уведомления, время попытки которых наступило"""
+        async with async_session_maker() as session:
+            result = await session.execute(
+                select(OutboxMessage).where(
+                    OutboxMessage.status == "pending",
+                    OutboxMessage.next_attempt_at <= datetime.utcnow()
+                ).order_by(OutboxMessage.id).limit(limit)
+            )
+            return list(result.scalars().all())
+    
+    @staticmethod
+    async def get_pending(chat_id: int) -> List[OutboxMessage]:
+        """
+        Все неотправленные уведомления о записях в чат, в том числе ожидающие
+        окна задержки (кроме отложенных после неудачной попытки)
+        """
+        async with async_session_maker() as session:
+            result = await session.execute(
+                select(OutboxMessage).where(
+                    OutboxMessage.chat_id == chat_id,
+                    OutboxMessage.booking_id.is_not(None),
+                    OutboxMessage.status == "pending",
+                    OutboxMessage.attempts == 0
+                ).order_by(OutboxMessage.id)
+            )
+            return list(result.scalars().all())
+    
+    @staticmethod
+    async def add(chat_id: int, text: str) -> None:
+        """Поставить уведомление в очередь отдельной транзакцией, без задержки"""
+        now = datetime.utcnow()
+        async with async_session_maker() as session:
+            session.add(OutboxMessage(chat_id=chat_id, text=text, created_at=now, next_attempt_at=now))
+            await session.commit()
+        _notify_outbox(1)
+    
+    @staticmethod
+    async def mark_sent(ids: List[int]) -> None:
+        """Отметить уведомления доставленными одним UPDATE"""
+        if not ids:
+            return
+        async with async_session_maker() as session:
+            await session.execute(
+                update(OutboxMessage)
+                .where(OutboxMessage.id.in_(ids))
+                .values(status="sent", sent_at=datetime.utcnow(), last_error=None)
+            )
+            await session.commit()
+    
+    @staticmethod
+    async def mark_failed(ids: List[int], error: str, retry_in: Optional[float]) -> None:
+        """Неудачная попытка: повторить через retry_in секунд или (None) больше не пытаться"""
+        values = {"attempts": OutboxMessage.attempts + 1, "last_error": error[:500]}
+        if retry_in is None:
+            values["status"] = "failed"
+        else:
+            values["next_attempt_at"] = datetime.utcnow() + timedelta(seconds=retry_in)
+        async with async_session_maker() as session:
+            await session.execute(
+                update(OutboxMessage).where(OutboxMessage.id.in_(ids)).values(**values)
+            )
+            await session.commit()
+    
+    @staticmethod
+    async def get_counts() -> Dict[str, int]:
+        """Количество уведомлений по статусам"""
+        async with async_session_maker() as session:
+            result = await session.execute(
+                select(OutboxMessage.status, func.count()).group_by(OutboxMessage.status)
+            )
+            return {status: count for status, count in result.all()}
+
+
+def normalize_phone(value: str) -> str:
+    """Только цифры телефона"""
+    return "".join(char for char in value if char.isdigit())
+
+
+# Поиск клиентов и записей для барбера
+class SearchDAO:
+    # Минимальная длина запроса: триграммный индекс ищет фрагменты от 3 символов
+    MIN_QUERY_LENGTH = 3
+    
+    @staticmethod
+    def _is_phone(query: str) -> bool:
+        return all(char.isdigit() or char in "+ ()-." for char in query)
+    
+    @staticmethod
+    async def _fts_ids(session: AsyncSession, fts: str, query: str, limit: int) -> List[int]:
+        if SearchDAO._is_phone(query):
+            match = f'phone : "{normalize_phone(query)}"'
+        else:
+            match = '"' + query.replace('"', '""') + '"'
+        result = await session.execute(
+            text(f"SELECT rowid FROM {fts} WHERE {fts} MATCH :match ORDER BY rowid DESC LIMIT :limit"),
+            {"match": match, "limit": limit}
+        )
+        return list(result.scalars().all())
+    
+    @staticmethod
+    async def search(query: str, limit: int = 20) -> Tuple[List[User], List[Booking]]:
+        """
+        Клиенты и записи по фрагменту имени, username или телефона. В SQLite
+        ищет по индексу FTS5, в остальных БД - через LIKE
+        """
+        query = query.strip().lstrip("@")
+        if SearchDAO._is_phone(query):
+            query_length = len(normalize_phone(query))
+        else:
+            query_length = len(query)
+        if query_length < SearchDAO.MIN_QUERY_LENGTH:
+            return [], []
+        
+        async with async_session_maker() as session:
+            if engine.dialect.name == "sqlite":
+                user_ids = await SearchDAO._fts_ids(session, "users_fts", query, limit)
+                booking_ids = await SearchDAO._fts_ids(session, "bookings_fts", query, limit)
+                user_filter = User.id.in_(user_ids)
+                booking_filter = Booking.id.in_(booking_ids)
+            elif SearchDAO._is_phone(query):
+                # Телефоны хранятся с форматированием - сравниваем только цифры, как в FTS
+                pattern = f"%{normalize_phone(query)}%"
+                user_filter = literal_column(_phone_digits_sql("users.phone")).like(pattern)
+                booking_filter = literal_column(_phone_digits_sql("bookings.user_phone")).like(pattern)
+            else:
+                pattern = f"%{query}%"
+                user_filter = User.full_name.ilike(pattern) | User.username.ilike(pattern)
+                booking_filter = Booking.user_name.ilike(pattern) | Booking.user_username.ilike(pattern)
+            
+            users = list((await session.scalars(
+                select(User).where(user_filter).order_by(User.id.desc()).limit(limit)
+            )).all())
+            # Записи найденных клиентов, даже если в записи другое имя или телефон
+            telegram_ids = [user.telegram_id for user in users]
+            bookings = list((await session.scalars(
+                select(Booking)
+                .where(booking_filter | Booking.user_telegram_id.in_(telegram_ids))
+                .order_by(Booking.id.desc())
+                .limit(limit)
+            )).all())
+            return users, bookings
+
+
+# CRUD операции для правил выходных
+class BarberDayOffRuleDAO:
+    @staticmethod
+    async def create(
+        kind: str,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        weekday: Optional[int] = None,
+        reason: Optional[str] = None,
+        cancel_dates: Optional[List[str]] = None,
+        outbox: Optional[OutboxFactory] = None
+    ) -> Tuple[BarberDayOffRule, List[Booking]]:
+        """
+        Добавить правило и в той же транзакции отменить записи на затронутые
+        даты и поставить уведомления по ним в outbox
+        """
+        async with async_session_maker() as session:
+            rule = BarberDayOffRule(
+                kind=kind,
+                start_date=start_date,
+                end_date=end_date,
+                weekday=weekday,
+                reason=reason
+            )
+            session.add(rule)
+            cancelled = await _cancel_on_dates(session, cancel_dates or [])
+            queued = _enqueue(session, cancelled, outbox)
+            await session.commit()
+            _notify_booking_change(booking.booking_date for booking in cancelled)
+            user_cache.remove_bookings(cancelled)
+            _notify_outbox(queued)
+            await session.refresh(rule)
+            return rule, cancelled
+    
+    @staticmethod
+    async def get_all() -> List[BarberDayOffRule]:
+        """Получить все правила выходных"""
+        async with async_session_maker() as session:
+            result = await session.execute(
+                select(BarberDayOffRule).order_by(BarberDayOffRule.kind, BarberDayOffRule.id)
+            )
+            return list(result.scalars().all())
+    
+    @staticmethod
+    async def delete(rule_id: int) -> bool:
+        """Удалить правило"""
+        async with async_session_maker() as session:
+            result = await session.execute(
+                delete(BarberDayOffRule).where(BarberDayOffRule.id == rule_id)
+            )
+            await session.commit()
+            return result.rowcount > 0
+
+
+# Сводная статистика по выручке и загрузке
+class StatsDAO:
+    @staticmethod
+    async def get_daily(start_date: str, end_date: str) -> List[DailyStats]:
+        """Получить сводку по дням и услугам за период (даты YYYY-MM-DD включительно)"""
+        async with async_session_maker() as session:
+            result = await session.execute(
+                select(DailyStats).where(
+                    DailyStats.stat_date >= start_date,
+                    DailyStats.stat_date <= end_date,
+                    DailyStats.bookings_count > 0
+                ).order_by(DailyStats.stat_date, DailyStats.service_type)
+            )
+            return list(result.scalars().all())
+    
+    @staticmethod
+    async def get_hourly(start_date: str, end_date: str) -> List[Tuple[int, int, int]]:
+        """Загрузка по часам за период: (час, записей, занято минут)"""
+        async with async_session_maker() as session:
+            result = await session.execute(
+                select(
+                    HourlyStats.hour,
+                    func.sum(HourlyStats.bookings_count),
+                    func.sum(HourlyStats.occupied_minutes)
+                ).where(
+                    HourlyStats.stat_date >= start_date,
+                    HourlyStats.stat_date <= end_date
+                ).group_by(HourlyStats.hour).order_by(HourlyStats.hour)
+            )
+            return [tuple(row) for row in result.all()]
+    
+    @staticmethod
+    async def rebuild(batch_size: int = 1000) -> int:
+        """
+        Пересчитать сводные таблицы по истории записей за один потоковый
+        проход, а счетчики клиентов - агрегирующими запросами в БД
+        """
+        daily, hourly = {}, {}
+        processed = 0
+        
+        async with async_session_maker() as session:
+            result = await session.stream(
+                select(
+                    Booking.booking_date,
+                    Booking.booking_time,
+                    Booking.service_type,
+                    Booking.service_price,
+                    Booking.service_duration
+                ).where(_counted()).execution_options(yield_per=batch_size)
+            )
+            async for partition in result.partitions():
+                _accumulate_stats(partition, 1, daily, hourly)
+                processed += len(partition)
+            
+            await session.execute(delete(DailyStats))
+            await session.execute(delete(HourlyStats))
+            await _upsert_stats(session, daily, hourly)
+            for statement in _client_stats_backfill():
+                await session.execute(statement)
+            await session.commit()
+        
+        return processed
+
+
+# CRUD операции для графика работы и услуг
+class ScheduleDAO:
+    @staticmethod
+    async def get_working_hours() -> List[WorkingHours]:
+        """Получить рабочие часы по всем дням недели"""
+        async with async_session_maker() as session:
+            result = await session.execute(select(WorkingHours).order_by(WorkingHours.weekday))
+            return list(result.scalars().all())
+    
+    @staticmethod
+    async def set_working_hours(
+        weekday: int,
+        start_time: str,
+        end_time: str,
+        slot_step: int = 30,
+        is_working: bool = True
+    ) -> None:
+        """Задать рабочие часы для дня недели"""
+        async with async_session_maker() as session:
+            stmt = _insert(WorkingHours).values(
+                weekday=weekday,
+                start_time=start_time,
+                end_time=end_time,
+                slot_step=slot_step,
+                is_working=is_working
+            )
+            await session.execute(stmt.on_conflict_do_update(
+                index_elements=[WorkingHours.weekday],
+                set_={
+                    "start_time": stmt.excluded.start_time,
+                    "end_time": stmt.excluded.end_time,
+                    "slot_step": stmt.excluded.slot_step,
+                    "is_working": stmt.excluded.is_working,
+                }
+            ))
+            await session.commit()
+    
+    @staticmethod
+    async def get_services() -> List[Service]:
+        """Получить все услуги"""
+        async with async_session_maker() as session:
+            result = await session.execute(select(Service).order_by(Service.sort_order, Service.code))
+            return list(result.scalars().all())
+    
+    @staticmethod
+    async def upsert_service(code: str, name: str, price: int, duration: int, emoji: str = "") -> None:
+        """Добавить или обновить услугу"""
+        async with async_session_maker() as session:
+            service = await session.get(Service, code)
+            if service:
+                service.name = name
+                service.price = price
+                service.duration = duration
+                service.emoji = emoji
+                service.is_active = True
+            else:
+                max_order = await session.scalar(select(func.max(Service.sort_order)))
+                session.add(Service(
+                    code=code,
+                    name=name,
+                    price=price,
+                    duration=duration,
+                    emoji=emoji,
+                    sort_order=(max_order or 0) + 1
+                ))
+            await session.commit()
+    
+    @staticmethod
+    async def set_service_active(code: str, is_active: bool) -> bool:
+        """Включить или скрыть услугу"""
+        async with async_session_maker() as session:
+            result = await session.execute(
+                update(Service).where(Service.code == code).values(is_active=is_active)
+            )
+            await session.commit()
+            return result.rowcount > 0
+    
+    @staticmethod
+    async def seed_defaults(working_hours: List[Dict], services: List[Dict]) -> None:
+        """Заполнить пустые таблицы графика и услуг значениями по умолчанию"""
+        async with async_session_maker() as session:
+            if not await session.scalar(select(func.count()).select_from(WorkingHours)):
+                session.add_all(WorkingHours(**row) for row in working_hours)
+            if not await session.scalar(select(func.count()).select_from(Service)):
+                session.add_all(Service(**row) for row in services)
+            await session.commit()
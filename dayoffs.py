@@ -0,0 +1,130 @@
+# dayoffs.py - Индекс выходных дней барбера в памяти
+from datetime import datetime, date as date_cls, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from config import DAYOFF_MEMO_SIZE
+from database import BarberDayOffDAO, BarberDayOffRuleDAO
+
+DATE_FORMAT = "%d.%m.%Y"
+
+WEEKDAY_NAMES = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
+WEEKDAY_EVERY = [
+    "Каждый понедельник", "Каждый вторник", "Каждую среду", "Каждый четверг",
+    "Каждую пятницу", "Каждую субботу", "Каждое воскресенье",
+]
+
+
+def parse_date(date_str: str) -> date_cls:
+    """DD.MM.YYYY -> date"""
+    return datetime.strptime(date_str, DATE_FORMAT).date()
+
+
+def describe_rule(rule) -> str:
+    """Текстовое описание правила выходных"""
+    if rule.kind == "weekly":
+        text = WEEKDAY_EVERY[rule.weekday]
+    else:
+        text = f"{rule.start_date} – {rule.end_date}"
+    if rule.reason:
+        text += f" ({rule.reason})"
+    return text
+
+
+class DayOffIndex:
+    """
+    Выходные дни: отдельные даты, периоды и еженедельные правила.
+
+    Правила хранятся компактно и разворачиваются лениво: результат проверки
+    даты запоминается, поэтому is_off() стоит O(1) после первого обращения.
+    Запоминаются последние memo_size дат, самые старые вытесняются.
+    После любого изменения выходных индекс нужно перезагрузить через load().
+    """
+
+    def __init__(self, memo_size: int = DAYOFF_MEMO_SIZE):
+        self.memo_size = memo_size
+        self._dates: Dict[str, Optional[str]] = {}
+        self._weekly: Dict[int, Optional[str]] = {}
+        self._ranges: List[Tuple[date_cls, date_cls, Optional[str]]] = []
+        self._memo: Dict[str, Tuple[bool, Optional[str]]] = {}
+        self.loaded = False
+
+    async def load(self) -> None:
+        """Загрузить выходные и правила из БД"""
+        days_off = await BarberDayOffDAO.get_all()
+        rules = await BarberDayOffRuleDAO.get_all()
+
+        dates = {day_off.date: day_off.reason for day_off in days_off}
+        weekly, ranges = {}, []
+        for rule in rules:
+            if rule.kind == "weekly":
+                weekly[rule.weekday] = rule.reason
+            elif rule.kind == "range":
+                ranges.append((parse_date(rule.start_date), parse_date(rule.end_date), rule.reason))
+
+        # Подменяем состояние целиком, чтобы читатели не видели его наполовину обновленным
+        self._dates, self._weekly, self._ranges, self._memo = dates, weekly, ranges, {}
+        self.loaded = True
+
+    async def ensure_loaded(self) -> None:
+        """Загрузить индекс при первом обращении"""
+        if not self.loaded:
+            await self.load()
+
+    def lookup(self, date_str: str) -> Tuple[bool, Optional[str]]:
+        """Проверить дату: (выходной ли, причина)"""
+        cached = self._memo.get(date_str)
+        if cached is not None:
+            return cached
+
+        if date_str in self._dates:
+            result = (True, self._dates[date_str])
+        else:
+            day = parse_date(date_str)
+            result = (False, None)
+            if day.weekday() in self._weekly:
+                result = (True, self._weekly[day.weekday()])
+            else:
+                for start, end, reason in self._ranges:
+                    if start <= day <= end:
+                        result = (True, reason)
+                        break
+
+        if len(self._memo) >= self.memo_size:
+            del self._memo[next(iter(self._memo))]
+        self._memo[date_str] = result
+        return result
+
+    def is_off(self, date_str: str) -> bool:
+        """Является ли дата выходным"""
+        return self.lookup(date_str)[0]
+
+    def is_weekly_off(self, weekday: int) -> bool:
+        """Есть ли еженедельное правило для дня недели"""
+        return weekday in self._weekly
+
+    def reason(self, date_str: str) -> Optional[str]:
+        """Причина выходного (если указана)"""
+        return self.lookup(date_str)[1]
+
+    @staticmethod
+    def expand_rule(
+        start: date_cls,
+        days: int,
+        weekday: Optional[int] = None,
+        range_start: Optional[date_cls] = None,
+        range_end: Optional[date_cls] = None
+    ) -> List[str]:
+        """Даты окна [start, start + days), которые попадают под правило"""
+        dates = []
+        for i in range(days):
+            day = start + timedelta(days=i)
+            if weekday is not None and day.weekday() != weekday:
+                continue
+            if range_start is not None and not (range_start <= day <= range_end):
+                continue
+            dates.append(day.strftime(DATE_FORMAT))
+        return dates
+
+
+# Общий индекс для всех обработчиков
+day_offs = DayOffIndex()
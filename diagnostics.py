@@ -0,0 +1,190 @@
+# diagnostics.py - Задержка event loop и семплирующий профилировщик
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from datetime import datetime
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+from config import WATCHDOG_INTERVAL, WATCHDOG_SLOW_THRESHOLD, PROFILE_SAMPLE_INTERVAL, PROFILE_TOP
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+FrameKey = Tuple[str, int, str]
+
+
+class LoopWatchdog:
+    """
+    Сторож event loop.
+
+    Задача в цикле событий каждые interval секунд отмечает пульс и измеряет,
+    насколько позже запланированного она проснулась (задержка планирования).
+    Отдельный поток следит за пульсом: если цикл не отвечает дольше
+    threshold, значит какой-то колбэк блокирует его (синхронный I/O, тяжелые
+    вычисления). Поток снимает стек потока цикла и записывает его в лог и в
+    историю медленных колбэков.
+    """
+
+    def __init__(self, interval: float = WATCHDOG_INTERVAL, threshold: float = WATCHDOG_SLOW_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.lags: Deque[float] = deque(maxlen=600)
+        self.slow: Deque[Tuple[datetime, float, str]] = deque(maxlen=20)
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    async def _measure(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            self._heartbeat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(loop.time() - started - self.interval, 0.0))
+
+    def _monitor(self) -> None:
+        reported = None
+        while not self._stop.wait(self.threshold / 2):
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat - self.interval
+            if stalled < self.threshold or reported == heartbeat:
+                continue
+            # Об одной блокировке сообщаем один раз
+            reported = heartbeat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+            self.slow.append((datetime.now(), stalled, stack))
+            logger.warning("Event loop заблокирован дольше %.0f мс", stalled * 1000, extra={"stack": stack})
+
+    def stats(self) -> Dict[str, float]:
+        """Задержка планирования за последние замеры, мс"""
+        if not self.lags:
+            return {"last": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+        ordered = sorted(self.lags)
+        return {
+            "last": self.lags[-1] * 1000,
+            "p50": ordered[len(ordered) // 2] * 1000,
+            "p95": ordered[int(len(ordered) * 0.95)] * 1000,
+            "max": ordered[-1] * 1000,
+        }
+
+    def start(self) -> None:
+        """Запустить замер в текущем цикле событий и поток наблюдения"""
+        self._loop_thread_id = threading.get_ident()
+        self._task = asyncio.get_running_loop().create_task(self._measure())
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._monitor, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        """Остановить сторож"""
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+def _sample(thread_id: int, duration: float, interval: float) -> Tuple[int, Counter, Counter]:
+    """Снимать стек потока thread_id каждые interval секунд в течение duration"""
+    own: Counter = Counter()
+    total: Counter = Counter()
+    samples = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None:
+            samples += 1
+            code = frame.f_code
+            own[(code.co_filename, frame.f_lineno, code.co_name)] += 1
+            seen = set()
+            while frame is not None:
+                code = frame.f_code
+                key = (code.co_filename, code.co_firstlineno, code.co_name)
+                if key not in seen:
+                    seen.add(key)
+                    total[key] += 1
+                frame = frame.f_back
+        time.sleep(interval)
+    return samples, own, total
+
+
+def _location(key: FrameKey) -> str:
+    filename, line, name = key
+    if filename.startswith(PROJECT_DIR):
+        filename = os.path.relpath(filename, PROJECT_DIR)
+    else:
+        # Для библиотек оставляем путь начиная с имени пакета
+        parts = filename.replace("\\", "/").split("/")
+        if "site-packages" in parts:
+            parts = parts[parts.index("site-packages") + 1:]
+        filename = "/".join(parts[-3:])
+    return f"{name}  ({filename}:{line})"
+
+
+def _top(counter: Counter, samples: int, top: int) -> str:
+    lines = []
+    for key, count in counter.most_common(top):
+        lines.append(f"{count / samples:6.1%} {count:7d}  {_location(key)}")
+    return "\n".join(lines)
+
+
+async def profile(
+    seconds: float,
+    watchdog: Optional[LoopWatchdog] = None,
+    queue: Optional[Callable[[], Dict[str, float]]] = None,
+    top: int = PROFILE_TOP
+) -> str:
+    """
+    Профиль потока event loop за seconds секунд: семплирование стека из
+    отдельного потока, цикл событий в это время продолжает работать.
+    Возвращает текстовый отчет с самыми частыми функциями и, если передан
+    queue (UserSerialMiddleware.stats), сводкой очереди обработчиков.
+    """
+    thread_id = threading.get_ident()
+    started = datetime.now()
+    samples, own, total = await asyncio.to_thread(_sample, thread_id, seconds, PROFILE_SAMPLE_INTERVAL)
+
+    lines = [
+        f"Профиль event loop: {started:%d.%m.%Y %H:%M:%S}, {seconds:g} с, {samples} семплов "
+        f"(каждые {PROFILE_SAMPLE_INTERVAL * 1000:g} мс)",
+        "Ожидание в select/epoll - простой цикла событий, а не нагрузка.",
+        "",
+    ]
+    if watchdog is not None:
+        lag = watchdog.stats()
+        lines.append(
+            f"Задержка event loop, мс: последняя {lag['last']:.1f}, p50 {lag['p50']:.1f}, "
+            f"p95 {lag['p95']:.1f}, макс {lag['max']:.1f}"
+        )
+        lines.append("")
+    if queue is not None:
+        stats = queue()
+        lines.append(
+            f"Очередь обработчиков (с прошлого отчета): в работе {stats['in_flight']}/{stats['concurrency']}, "
+            f"ждут {stats['queued']} (макс. {stats['max_queued']}), апдейтов {stats['updates']}, "
+            f"ожидание, мс: среднее {stats['avg_wait']:.1f}, макс {stats['max_wait']:.1f}"
+        )
+        lines.append("")
+    if samples:
+        lines += ["== Собственное время (функция на вершине стека) ==", _top(own, samples, top), ""]
+        lines += ["== Общее время (функция где-либо в стеке) ==", _top(total, samples, top), ""]
+    if watchdog is not None and watchdog.slow:
+        lines.append("== Последние блокировки event loop ==")
+        for moment, stalled, stack in reversed(watchdog.slow):
+            lines += [f"-- {moment:%d.%m.%Y %H:%M:%S}: дольше {stalled * 1000:.0f} мс", stack]
+    return "\n".join(lines)
+
+
+# Общий сторож, запускается в bot.main()
+watchdog = LoopWatchdog()
@@ -0,0 +1,78 @@
+# digest.py - Утренняя сводка расписания для барбера
+import asyncio
+import html
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from config import BARBER_DIGEST_TIME
+from database import BookingDAO, BookingView, OutboxDAO
+from dayoffs import day_offs
+
+logger = logging.getLogger(__name__)
+
+
+def digest_text(date_str: str, bookings: List[BookingView], day_off_reason: Optional[str] = None) -> str:
+    """Текст сводки: записи дня по времени и выручка"""
+    text = f"☀️ <b>Расписание на сегодня, {date_str}</b>\n\n"
+    if day_off_reason is not None:
+        text += f"🏖 Сегодня выходной{f' ({html.escape(day_off_reason)})' if day_off_reason else ''}\n\n"
+    if not bookings:
+        return text + "Записей на сегодня нет."
+    total = sum(booking.service_price for booking in bookings)
+    text += f"Записей: {len(bookings)} · 💰 {total}₽\n\n"
+    for booking in bookings:
+        text += (
+            f"🕐 <b>{booking.booking_time}</b> {html.escape(booking.service_name)}\n"
+            f"     👤 {html.escape(booking.user_name)}, {html.escape(booking.user_phone)}\n"
+        )
+    return text
+
+
+class MorningDigest:
+    """
+    Каждый день в BARBER_DIGEST_TIME (HH:MM, местное время) ставит в outbox
+    барбера расписание на сегодня. Записи дня читаются одним запросом.
+    Если бот запущен позже этого времени, сводка придет на следующий день.
+    """
+
+    def __init__(self, chat_id: int, at: str = BARBER_DIGEST_TIME):
+        self.chat_id = chat_id
+        self.at = datetime.strptime(at, "%H:%M").time()
+        self._task: Optional[asyncio.Task] = None
+
+    def next_run(self, now: Optional[datetime] = None) -> datetime:
+        """Ближайший момент отправки сводки"""
+        now = now or datetime.now()
+        moment = datetime.combine(now.date(), self.at)
+        return moment if moment > now else moment + timedelta(days=1)
+
+    async def send_once(self, now: Optional[datetime] = None) -> None:
+        """Поставить в outbox сводку на день now"""
+        date_str = (now or datetime.now()).strftime("%d.%m.%Y")
+        await day_offs.ensure_loaded()
+        is_off, reason = day_offs.lookup(date_str)
+        bookings = await BookingDAO.get_by_date(date_str)
+        await OutboxDAO.add(self.chat_id, digest_text(date_str, bookings, (reason or "") if is_off else None))
+
+    async def run(self) -> None:
+        while True:
+            moment = self.next_run()
+            await asyncio.sleep((moment - datetime.now()).total_seconds())
+            try:
+                await self.send_once(moment)
+            except Exception:
+                logger.exception("Ошибка отправки утренней сводки")
+
+    def start(self) -> None:
+        """Запустить отправку сводок фоновой задачей"""
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self) -> None:
+        """Остановить отправку сводок"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
@@ -0,0 +1,98 @@
+# export.py - Потоковая выгрузка записей в CSV/JSON
+import csv
+import gzip
+import io
+import json
+import tempfile
+from datetime import datetime
+from typing import AsyncGenerator, IO
+
+from aiogram.types import InputFile
+
+from database import Booking, BookingDAO
+
+# Колонки выгрузки в порядке вывода
+EXPORT_COLUMNS = [
+    Booking.id,
+    Booking.user_telegram_id,
+    Booking.user_name,
+    Booking.user_phone,
+    Booking.user_username,
+    Booking.booking_date,
+    Booking.booking_time,
+    Booking.service_type,
+    Booking.service_name,
+    Booking.service_price,
+    Booking.service_duration,
+    Booking.status,
+    Booking.created_at,
+    Booking.barber_comment,
+]
+
+# До этого размера файл держится в памяти, дальше сбрасывается на диск
+SPOOL_MAX_SIZE = 1024 * 1024
+
+
+class SpooledInputFile(InputFile):
+    """Файл для отправки в Telegram, читаемый кусками из временного файла"""
+
+    def __init__(self, file: IO[bytes], filename: str, chunk_size: int = 64 * 1024):
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.file = file
+
+    async def read(self, bot) -> AsyncGenerator[bytes, None]:
+        self.file.seek(0)
+        while chunk := self.file.read(self.chunk_size):
+            yield chunk
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ", timespec="seconds")
+    raise TypeError(f"Нельзя сериализовать {type(value).__name__}")
+
+
+async def export_bookings(fmt: str = "csv", compress: bool = False, batch_size: int = 1000) -> SpooledInputFile:
+    """
+    Выгрузить все записи в CSV или JSON.
+
+    Строки читаются с серверного курсора пачками и сразу кодируются во
+    временный файл, поэтому расход памяти не зависит от размера таблицы.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    raw = gzip.GzipFile(fileobj=spool, mode="wb") if compress else spool
+    text = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+    header = [column.key for column in EXPORT_COLUMNS]
+
+    try:
+        if fmt == "json":
+            text.write("[")
+            first = True
+            async for partition in BookingDAO.stream_rows(EXPORT_COLUMNS, batch_size):
+                for row in partition:
+                    text.write("\n" if first else ",\n")
+                    text.write(json.dumps(dict(zip(header, row)), ensure_ascii=False, default=_json_default))
+                    first = False
+            text.write("\n]\n")
+        else:
+            writer = csv.writer(text)
+            writer.writerow(header)
+            async for partition in BookingDAO.stream_rows(EXPORT_COLUMNS, batch_size):
+                writer.writerows(partition)
+
+        # Закрываем обертки, не закрывая сам временный файл
+        text.flush()
+        text.detach()
+        if compress:
+            raw.close()
+    except BaseException:
+        spool.close()
+        raise
+
+    filename = f"bookings_{datetime.now().strftime('%Y%m%d_%H%M')}.{fmt}"
+    if compress:
+        filename += ".gz"
+    return SpooledInputFile(spool, filename)
@@ -1,28 +1,146 @@
+import logging
 from datetime import datetime, timedelta
-from aiogram import Router, F, Bot
+from typing import Any, Callable, Optional
+from aiogram import Router, F
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
-from database import BarberDayOffDAO
+from dayoffs import day_offs
+from schedule import get_service
+import schedule
 from config import (
     BARBER_CHAT_ID,
-    SERVICES,
-    WORKING_HOURS,
     BARBERSHOP_INFO,
     BOOKING_DAYS_AHEAD,
-    TIME_BUTTONS_PER_ROW
+    WAITLIST_HOLD_MINUTES,
+    TIME_BUTTONS_PER_ROW,
+    REPEAT_HISTORY_SIZE
+)
+from database import UserDAO, BookingDAO, WaitlistDAO, OutboxFactory, to_iso_date
+from callbacks import (
+    CallbackTable,
+    DateCB,
+    MonthCB,
+    TimeCB,
+    BusyCB,
+    ServiceCB,
+    CancelBookingCB,
+    ConfirmCancelCB,
+    NearestCB,
+    RepeatCB,
+    WaitlistBookCB,
+    WaitlistDeclineCB,
+    day_to_date,
+    minute_to_time,
 )
-from database import UserDAO, BookingDAO
 from keyboards import (
+    NOOP,
     get_date_keyboard,
     get_time_keyboard,
     get_service_keyboard,
     get_my_bookings_keyboard,
-    get_cancel_confirm_keyboard
+    get_cancel_confirm_keyboard,
+    get_nearest_keyboard,
+    get_repeat_keyboard
 )
 
 router = Router()
+callbacks = CallbackTable()
+logger = logging.getLogger(__name__)
+
+
+async def is_slot_taken(date: str, time: str, telegram_id: int) -> bool:
+    """Слот занят записью или закреплен за другим клиентом из листа ожидания"""
+    if await BookingDAO.get_by_date_time(date, time):
+        return True
+    holder = await WaitlistDAO.held_by(date, time)
+    return holder is not None and holder != telegram_id
+
+
+def client_history_text(booking) -> str:
+    """История клиента из счетчиков, которые BookingDAO.create вернул вместе с записью"""
+    stats = booking.client_stats
+    if stats is None or stats.bookings_count <= 1:
+        text = "🆕 <b>Новый клиент</b>"
+        if stats is not None and stats.cancelled_count:
+            text += f" (отмен: {stats.cancelled_count})"
+        return text
+    text = (
+        f"📊 <b>История:</b> {stats.bookings_count}-я запись, "
+        f"{stats.total_spent}₽ всего, отмен: {stats.cancelled_count}"
+    )
+    # Прошлый визит известен, если эта запись самая поздняя у клиента
+    if stats.last_visit == to_iso_date(booking.booking_date) and stats.previous_visit:
+        year, month, day = stats.previous_visit.split("-")
+        text += f"\n🗓 <b>Прошлый визит:</b> {day}.{month}.{year}"
+    return text
+
+
+def barber_booking_text(booking, service_info) -> str:
+    """Уведомление барберу о новой записи"""
+    return f"""
+🔔 <b>НОВАЯ ЗАПИСЬ!</b>
+
+🆔 <b>Номер:</b> <code>{booking.id}</code>
+
+👤 <b>Клиент:</b> {booking.user_name}
+📞 <b>Телефон:</b> {booking.user_phone}
+🆔 <b>Telegram:</b> {booking.user_username or 'не указан'}
+📅 <b>Дата:</b> {booking.booking_date}
+🕐 <b>Время:</b> {booking.booking_time}
+💈 <b>Услуга:</b> {service_info.emoji} {service_info.name}
+⏱ <b>Длительность:</b> {service_info.duration} мин
+💰 <b>Стоимость:</b> {service_info.price}₽
+
+{client_history_text(booking)}
+    """
+
+
+def barber_cancel_text(booking) -> str:
+    """Уведомление барберу об отмене записи"""
+    return f"""
+❌ <b>ОТМЕНА ЗАПИСИ</b>
+
+🆔 <b>Номер:</b> <code>{booking.id}</code>
+👤 <b>Клиент:</b> {booking.user_name}
+📅 <b>Дата:</b> {booking.booking_date}
+🕐 <b>Время:</b> {booking.booking_time}
+💈 <b>Услуга:</b> {booking.service_name}
+    """
+
+
+def booked_text(booking, service_info) -> str:
+    """Короткое подтверждение записи, созданной одним нажатием"""
+    return (
+        f"✅ <b>Запись подтверждена!</b>\n\n"
+        f"🆔 <b>Номер записи:</b> <code>{booking.id}</code>\n"
+        f"📅 <b>Дата:</b> {booking.booking_date}\n"
+        f"🕐 <b>Время:</b> {booking.booking_time}\n"
+        f"💈 <b>Услуга:</b> {service_info.emoji} {service_info.name}\n\n"
+        f"📍 <b>Адрес:</b> {BARBERSHOP_INFO['address']}"
+    )
+
+
+async def get_repeat_offer(telegram_id: int) -> Optional[InlineKeyboardMarkup]:
+    """
+    Кнопка повтора последней записи: для клиента с историей и без
+    предстоящих записей (записи - из кэша, история - один запрос)
+    """
+    from availability import find_repeat_slot  # Импорт внутри функции, чтобы избежать циклического импорта
+    
+    today = datetime.now().strftime("%Y-%m-%d")
+    if any(to_iso_date(booking.booking_date) >= today for booking in await BookingDAO.get_user_bookings(telegram_id)):
+        return None
+    slot = await find_repeat_slot(await BookingDAO.get_history(telegram_id, REPEAT_HISTORY_SIZE))
+    return get_repeat_keyboard(*slot) if slot else None
+
+
+def to_barber(make_text: Callable[[Any], str]) -> OutboxFactory:
+    """Уведомление барберу через outbox (в той же транзакции, что и запись)"""
+    def factory(booking):
+        return [(int(BARBER_CHAT_ID), make_text(booking))] if BARBER_CHAT_ID else []
+    return factory
 
 
 # Состояния FSM
@@ -49,11 +167,17 @@ async def cmd_start(message: Message):
 
 📋 <b>Доступные команды:</b>
 /book - Записаться на стрижку
+/nearest - Ближайшее свободное время
 /my_bookings - Мои записи
 /cancel - Отменить процесс записи
     """
     
-    await message.answer(welcome_text, parse_mode='HTML')
+    # Постоянному клиенту - запись на привычное время одним нажатием
+    keyboard = await get_repeat_offer(user.id)
+    if keyboard:
+        welcome_text += "\n🔁 <b>Повторить прошлую запись?</b>"
+    
+    await message.answer(welcome_text, reply_markup=keyboard, parse_mode='HTML')
 
 
 @router.message(Command("book"))
@@ -93,7 +217,7 @@ async def cmd_book(message: Message, state: FSMContext):
         await state.set_state(BookingStates.waiting_for_name)
 
 
-@router.callback_query(F.data == "use_saved_data")
+@callbacks.route("use_saved_data")
 async def use_saved_data(callback: CallbackQuery, state: FSMContext):
     """Использовать сохраненные данные"""
     user = await UserDAO.get_by_telegram_id(callback.from_user.id)
@@ -103,7 +227,7 @@ async def use_saved_data(callback: CallbackQuery, state: FSMContext):
         phone=user.phone
     )
     
-    keyboard = get_date_keyboard()
+    keyboard = await get_date_keyboard()
     
     await callback.message.edit_text(
         f"Отлично! 👍\n\n<b>📅 Шаг 2/5: Выберите дату</b>",
@@ -115,7 +239,7 @@ async def use_saved_data(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
-@router.callback_query(F.data == "enter_new_data")
+@callbacks.route("enter_new_data")
 async def enter_new_data(callback: CallbackQuery, state: FSMContext):
     """Ввести новые данные"""
     await callback.message.edit_text(
@@ -158,15 +282,16 @@ async def process_phone(message: Message, state: FSMContext):
 
 
 
-@router.callback_query(BookingStates.selecting_date, F.data.startswith("date_"))
-async def process_date(callback: CallbackQuery, state: FSMContext):
+@callbacks.route(DateCB, state=BookingStates.selecting_date)
+async def process_date(callback: CallbackQuery, callback_data: DateCB, state: FSMContext):
     """Обработка выбора даты"""
-    date = callback.data.replace("date_", "")
+    date = day_to_date(callback_data.day)
     
-    # Проверяем, не является ли день выходным
-    day_off = await BarberDayOffDAO.get_by_date(date)
-    if day_off:
-        reason_text = f" ({day_off.reason})" if day_off.reason else ""
+    # Проверяем, не является ли день выходным (O(1) по индексу в памяти)
+    await day_offs.ensure_loaded()
+    is_off, reason = day_offs.lookup(date)
+    if is_off:
+        reason_text = f" ({reason})" if reason else ""
         await callback.answer(
             f"❌ {date} - выходной день барбера{reason_text}! Выберите другую дату.", 
             show_alert=True
@@ -181,7 +306,7 @@ async def process_date(callback: CallbackQuery, state: FSMContext):
     await callback.message.edit_text(
         f"📅 <b>Дата:</b> {date}\n\n"
         f"<b>🕐 Шаг 4/5: Выберите время</b>\n\n"
-        f"<i>🔴 - Время занято</i>",
+        f"<i>🔴 - Время занято (нажмите, чтобы встать в лист ожидания)</i>",
         reply_markup=keyboard,
         parse_mode='HTML'
     )
@@ -190,17 +315,47 @@ async def process_date(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
-@router.callback_query(BookingStates.selecting_time, F.data.startswith("time_"))
-async def process_time(callback: CallbackQuery, state: FSMContext):
+@callbacks.route("date_full")
+async def process_full_date(callback: CallbackQuery):
+    """Нажатие на полностью занятый день"""
+    await callback.answer("🔴 На этот день свободного времени нет. Выберите другую дату.", show_alert=True)
+
+
+@callbacks.route("date_off")
+async def process_off_date(callback: CallbackQuery):
+    """Нажатие на выходной день в календаре"""
+    await callback.answer("✖ В этот день барбер не работает. Выберите другую дату.", show_alert=True)
+
+
+@callbacks.route(NOOP)
+async def process_calendar_noop(callback: CallbackQuery):
+    """Нажатие на пустую клетку или заголовок календаря"""
+    await callback.answer()
+
+
+@callbacks.route(MonthCB, state=BookingStates.selecting_date)
+async def process_month(callback: CallbackQuery, callback_data: MonthCB):
+    """Листание календаря выбора даты: меняется только клавиатура"""
+    keyboard = await get_date_keyboard(callback_data.month)
+    await callback.message.edit_reply_markup(reply_markup=keyboard)
+    await callback.answer()
+
+
+@callbacks.route(TimeCB, state=BookingStates.selecting_time)
+async def process_time(callback: CallbackQuery, callback_data: TimeCB, state: FSMContext):
     """Обработка выбора времени"""
-    time = callback.data.replace("time_", "")
+    time = minute_to_time(callback_data.minute)
     await state.update_data(time=time)
     
     data = await state.get_data()
     
+    # Проверяем, что слот есть в текущем графике (график мог измениться)
+    if not schedule.current().is_slot(data['date'], time):
+        await callback.answer("❌ Это время недоступно. Выберите другое.", show_alert=True)
+        return
+    
     # Проверяем, что время еще свободно
-    existing_booking = await BookingDAO.get_by_date_time(data['date'], time)
-    if existing_booking:
+    if await is_slot_taken(data['date'], time, callback.from_user.id):
         await callback.answer("❌ Это время уже занято! Выберите другое.", show_alert=True)
         return
     
@@ -218,17 +373,103 @@ async def process_time(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
-@router.callback_query(BookingStates.selecting_service, F.data.startswith("service_"))
-async def confirm_booking(callback: CallbackQuery, state: FSMContext, bot: Bot):
+@callbacks.route(BusyCB, state=BookingStates.selecting_time)
+async def join_waitlist(callback: CallbackQuery, callback_data: BusyCB, state: FSMContext):
+    """Нажатие на занятое время: встать в лист ожидания"""
+    time = minute_to_time(callback_data.minute)
+    data = await state.get_data()
+    
+    if not await is_slot_taken(data['date'], time, callback.from_user.id):
+        await callback.answer("✅ Это время уже свободно! Откройте выбор даты заново через /book", show_alert=True)
+        return
+    
+    added = await WaitlistDAO.add(
+        telegram_id=callback.from_user.id,
+        name=data['name'],
+        phone=data['phone'],
+        username=data.get('username'),
+        slot_date=data['date'],
+        slot_time=time
+    )
+    
+    if added:
+        await callback.answer(
+            f"🔔 Вы в листе ожидания на {data['date']} {time}. Если время освободится, "
+            f"я пришлю сообщение и закреплю его за вами на {WAITLIST_HOLD_MINUTES} мин.",
+            show_alert=True
+        )
+    else:
+        await callback.answer("🔔 Вы уже в листе ожидания на это время", show_alert=True)
+
+
+@callbacks.route(WaitlistBookCB, idempotent=True)
+async def book_from_waitlist(callback: CallbackQuery, callback_data: WaitlistBookCB):
+    """Запись в одно нажатие на слот, закрепленный из листа ожидания"""
+    entry = await WaitlistDAO.get_hold(callback_data.entry_id)
+    if entry is None or entry.user_telegram_id != callback.from_user.id:
+        await callback.message.edit_text("⌛ <b>Предложение истекло.</b>\n\nДля записи используйте /book", parse_mode='HTML')
+        await callback.answer()
+        return
+    
+    service_info = get_service(callback_data.service)
+    if service_info is None:
+        await callback.answer("❌ Эта услуга больше недоступна. Выберите другую.", show_alert=True)
+        return
+    
+    await UserDAO.create_or_update(
+        telegram_id=entry.user_telegram_id,
+        username=entry.user_username,
+        full_name=entry.user_name,
+        phone=entry.user_phone
+    )
+    
+    # Запись удаляет клиента из листа ожидания в той же транзакции
+    booking = await BookingDAO.create(
+        user_telegram_id=entry.user_telegram_id,
+        user_name=entry.user_name,
+        user_phone=entry.user_phone,
+        user_username=entry.user_username,
+        booking_date=entry.slot_date,
+        booking_time=entry.slot_time,
+        service_type=callback_data.service,
+        service_name=service_info.name,
+        service_price=service_info.price,
+        service_duration=service_info.duration,
+        outbox=to_barber(lambda booking: barber_booking_text(booking, service_info))
+    )
+    if booking is None:
+        await callback.message.edit_text("❌ <b>Это время уже недоступно.</b>\n\nДля записи используйте /book", parse_mode='HTML')
+        await callback.answer()
+        return
+    await callback.answer("✅ Запись создана!")
+    
+    await callback.message.edit_text(booked_text(booking, service_info), parse_mode='HTML')
+
+
+@callbacks.route(WaitlistDeclineCB, idempotent=True)
+async def decline_waitlist(callback: CallbackQuery, callback_data: WaitlistDeclineCB):
+    """Отказ от освободившегося слота: он переходит следующему в очереди"""
+    entry = await WaitlistDAO.get_hold(callback_data.entry_id)
+    if entry is not None and entry.user_telegram_id == callback.from_user.id:
+        await WaitlistDAO.release(entry.id)
+    
+    await callback.message.edit_text("👌 Хорошо, время передано следующему клиенту.")
+    await callback.answer()
+
+
+@callbacks.route(ServiceCB, state=BookingStates.selecting_service, idempotent=True)
+async def confirm_booking(callback: CallbackQuery, callback_data: ServiceCB, state: FSMContext):
     """Подтверждение и сохранение записи"""
-    service_id = callback.data.replace("service_", "")
-    service_info = SERVICES[service_id]
+    service_id = callback_data.service
+    service_info = get_service(service_id)
+    if service_info is None:
+        await callback.answer("❌ Эта услуга больше недоступна. Выберите другую.", show_alert=True)
+        return
     
     data = await state.get_data()
     
     # Еще раз проверяем доступность времени
-    existing_booking = await BookingDAO.get_by_date_time(data['date'], data['time'])
-    if existing_booking:
+    if await is_slot_taken(data['date'], data['time'], callback.from_user.id):
         await callback.answer("❌ Это время уже занято! Начните запись заново /book", show_alert=True)
         await state.clear()
         return
@@ -250,10 +491,19 @@ async def confirm_booking(callback: CallbackQuery, state: FSMContext, bot: Bot):
         booking_date=data['date'],
         booking_time=data['time'],
         service_type=service_id,
-        service_name=service_info['name'],
-        service_price=service_info['price'],
-        service_duration=service_info['duration']
+        service_name=service_info.name,
+        service_price=service_info.price,
+        service_duration=service_info.duration,
+        outbox=to_barber(lambda booking: barber_booking_text(booking, service_info))
     )
+    if booking is None:
+        # Слот заняли или закрыли выходным между проверкой выше и записью
+        await callback.answer("❌ Это время уже занято! Начните запись заново /book", show_alert=True)
+        await state.clear()
+        return
+    
+    # Запись и уведомление барберу сохранены - отвечаем сразу, барберу отправит воркер outbox
+    await callback.answer("✅ Запись создана!")
     
     # Формируем сообщение для клиента
     client_message = f"""
@@ -266,9 +516,9 @@ async def confirm_booking(callback: CallbackQuery, state: FSMContext, bot: Bot):
 🆔 <b>Telegram:</b> {data.get('username', 'не указан')}
 📅 <b>Дата:</b> {data['date']}
 🕐 <b>Время:</b> {data['time']}
-💈 <b>Услуга:</b> {service_info['emoji']} {service_info['name']}
-⏱ <b>Длительность:</b> {service_info['duration']} мин
-💰 <b>Стоимость:</b> {service_info['price']}₽
+💈 <b>Услуга:</b> {service_info.emoji} {service_info.name}
+⏱ <b>Длительность:</b> {service_info.duration} мин
+💰 <b>Стоимость:</b> {service_info.price}₽
 
 📍 <b>Адрес:</b> {BARBERSHOP_INFO['address']}
 ☎️ <b>Контакт барбера:</b> {BARBERSHOP_INFO['phone']}
@@ -279,35 +529,127 @@ async def confirm_booking(callback: CallbackQuery, state: FSMContext, bot: Bot):
 <b>До встречи! 💈✨</b>
     """
     
+    await state.clear()
     await callback.message.edit_text(client_message, parse_mode='HTML')
+
+
+@router.message(Command("nearest"))
+async def cmd_nearest(message: Message):
+    """Ближайшие свободные слоты"""
+    keyboard = await get_nearest_keyboard()
     
-    # Отправляем уведомление барберу
-    barber_message = f"""
-🔔 <b>НОВАЯ ЗАПИСЬ!</b>
+    if keyboard is None:
+        await message.answer("😔 <b>Свободного времени в ближайшие дни нет.</b>", parse_mode='HTML')
+        return
+    
+    await message.answer(
+        "⚡ <b>Ближайшее свободное время:</b>\n\n<i>Нажмите на слот, чтобы записаться</i>",
+        reply_markup=keyboard,
+        parse_mode='HTML'
+    )
 
-🆔 <b>Номер:</b> <code>{booking.id}</code>
 
-👤 <b>Клиент:</b> {data['name']}
-📞 <b>Телефон:</b> {data['phone']}
-🆔 <b>Telegram:</b> {data.get('username', 'не указан')}
-📅 <b>Дата:</b> {data['date']}
-🕐 <b>Время:</b> {data['time']}
-💈 <b>Услуга:</b> {service_info['emoji']} {service_info['name']}
-⏱ <b>Длительность:</b> {service_info['duration']} мин
-💰 <b>Стоимость:</b> {service_info['price']}₽
-    """
+@callbacks.route("nearest")
+async def nearest_from_dates(callback: CallbackQuery):
+    """Ближайшие свободные слоты из выбора даты"""
+    keyboard = await get_nearest_keyboard()
+    
+    if keyboard is None:
+        await callback.answer("😔 Свободного времени в ближайшие дни нет", show_alert=True)
+        return
     
-    try:
-        await bot.send_message(
-            chat_id=BARBER_CHAT_ID,
-            text=barber_message,
+    await callback.message.edit_text(
+        "⚡ <b>Ближайшее свободное время:</b>\n\n<i>Нажмите на слот, чтобы записаться</i>",
+        reply_markup=keyboard,
+        parse_mode='HTML'
+    )
+    await callback.answer()
+
+
+@callbacks.route(NearestCB)
+async def select_nearest(callback: CallbackQuery, callback_data: NearestCB, state: FSMContext):
+    """Запись на выбранный ближайший слот: сразу к выбору услуги"""
+    date = day_to_date(callback_data.day)
+    time = minute_to_time(callback_data.minute)
+    data = await state.get_data()
+    
+    # Имя и телефон берем из текущего процесса записи или из сохраненного профиля
+    if not data.get('name') or not data.get('phone'):
+        user = await UserDAO.get_by_telegram_id(callback.from_user.id)
+        if not user:
+            await callback.answer("📝 Сначала укажите имя и телефон через /book", show_alert=True)
+            return
+        data.update(name=user.full_name, phone=user.phone)
+    
+    await day_offs.ensure_loaded()
+    if day_offs.is_off(date) or not schedule.current().is_slot(date, time) \
+            or await is_slot_taken(date, time, callback.from_user.id):
+        await callback.answer("❌ Это время уже занято! Выберите другое.", show_alert=True)
+        return
+    
+    await state.update_data(
+        telegram_id=callback.from_user.id,
+        username=f"@{callback.from_user.username}" if callback.from_user.username else "не указан",
+        name=data['name'],
+        phone=data['phone'],
+        date=date,
+        time=time
+    )
+    
+    await callback.message.edit_text(
+        f"📅 <b>Дата:</b> {date}\n"
+        f"🕐 <b>Время:</b> {time}\n\n"
+        f"<b>💈 Выберите услугу</b>",
+        reply_markup=get_service_keyboard(),
+        parse_mode='HTML'
+    )
+    
+    await state.set_state(BookingStates.selecting_service)
+    await callback.answer()
+
+
+@callbacks.route(RepeatCB, idempotent=True)
+async def repeat_booking(callback: CallbackQuery, callback_data: RepeatCB):
+    """Повтор прошлой записи: запись на предложенный слот в одном апдейте"""
+    date = day_to_date(callback_data.day)
+    time = minute_to_time(callback_data.minute)
+    service_info = get_service(callback_data.service)
+    user = await UserDAO.get_by_telegram_id(callback.from_user.id)
+    if service_info is None or user is None:
+        await callback.answer("❌ Повтор недоступен. Запишитесь через /book", show_alert=True)
+        return
+    
+    booking = None
+    await day_offs.ensure_loaded()
+    if not day_offs.is_off(date) and schedule.current().is_slot(date, time) \
+            and not await is_slot_taken(date, time, callback.from_user.id):
+        booking = await BookingDAO.create(
+            user_telegram_id=user.telegram_id,
+            user_name=user.full_name,
+            user_phone=user.phone,
+            user_username=f"@{callback.from_user.username}" if callback.from_user.username else "не указан",
+            booking_date=date,
+            booking_time=time,
+            service_type=callback_data.service,
+            service_name=service_info.name,
+            service_price=service_info.price,
+            service_duration=service_info.duration,
+            outbox=to_barber(lambda booking: barber_booking_text(booking, service_info))
+        )
+    
+    if booking is None:
+        # Слот успели занять - предлагаем следующий подходящий
+        keyboard = await get_repeat_offer(callback.from_user.id)
+        await callback.answer("❌ Это время уже занято!", show_alert=True)
+        await callback.message.edit_text(
+            "🔁 <b>Предлагаю другое время:</b>" if keyboard else "😔 Подходящего времени нет. Используйте /book",
+            reply_markup=keyboard,
             parse_mode='HTML'
         )
-    except Exception as e:
-        print(f"Ошибка отправки уведомления барберу: {e}")
+        return
     
-    await state.clear()
     await callback.answer("✅ Запись создана!")
+    await callback.message.edit_text(booked_text(booking, service_info), parse_mode='HTML')
 
 
 @router.message(Command("my_bookings"))
@@ -316,9 +658,12 @@ async def cmd_my_bookings(message: Message):
     bookings = await BookingDAO.get_user_bookings(message.from_user.id)
     
     if not bookings:
+        keyboard = await get_repeat_offer(message.from_user.id)
         await message.answer(
             "📅 <b>У вас пока нет активных записей.</b>\n\n"
-            "Используйте /book чтобы записаться.",
+            + ("🔁 Повторить прошлую запись одним нажатием или " if keyboard else "")
+            + "Используйте /book чтобы записаться.",
+            reply_markup=keyboard,
             parse_mode='HTML'
         )
         return
@@ -338,10 +683,10 @@ async def cmd_my_bookings(message: Message):
     await message.answer(text, reply_markup=keyboard, parse_mode='HTML')
 
 
-@router.callback_query(F.data.startswith("cancel_booking_"))
-async def cancel_booking_confirm(callback: CallbackQuery):
+@callbacks.route(CancelBookingCB)
+async def cancel_booking_confirm(callback: CallbackQuery, callback_data: CancelBookingCB):
     """Подтверждение отмены записи"""
-    booking_id = int(callback.data.replace("cancel_booking_", ""))
+    booking_id = callback_data.booking_id
     booking = await BookingDAO.get_by_id(booking_id)
     
     if not booking:
@@ -363,53 +708,33 @@ async def cancel_booking_confirm(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("confirm_cancel_"))
-async def confirm_cancel_booking(callback: CallbackQuery, bot: Bot):
+@callbacks.route(ConfirmCancelCB, idempotent=True)
+async def confirm_cancel_booking(callback: CallbackQuery, callback_data: ConfirmCancelCB):
     """Подтверждение отмены"""
-    booking_id = int(callback.data.replace("confirm_cancel_", ""))
+    booking_id = callback_data.booking_id
     booking = await BookingDAO.get_by_id(booking_id)
     
     if not booking:
         await callback.answer("❌ Запись не найдена", show_alert=True)
         return
     
-    # Отменяем запись
-    success = await BookingDAO.cancel(booking_id)
+    # Отменяем запись, уведомление барберу - в той же транзакции через outbox
+    success = await BookingDAO.cancel(booking_id, outbox=to_barber(barber_cancel_text))
     
     if success:
+        await callback.answer("✅ Запись отменена")
+        
         # Уведомляем клиента
         await callback.message.edit_text(
             f"✅ <b>Запись #{booking_id} успешно отменена.</b>\n\n"
             f"Для новой записи используйте /book",
             parse_mode='HTML'
         )
-        
-        # Уведомляем барбера
-        barber_message = f"""
-❌ <b>ОТМЕНА ЗАПИСИ</b>
-
-🆔 <b>Номер:</b> <code>{booking.id}</code>
-👤 <b>Клиент:</b> {booking.user_name}
-📅 <b>Дата:</b> {booking.booking_date}
-🕐 <b>Время:</b> {booking.booking_time}
-💈 <b>Услуга:</b> {booking.service_name}
-        """
-        
-        try:
-            await bot.send_message(
-                chat_id=BARBER_CHAT_ID,
-                text=barber_message,
-                parse_mode='HTML'
-            )
-        except Exception as e:
-            print(f"Ошибка отправки уведомления барберу: {e}")
-        
-        await callback.answer("✅ Запись отменена")
     else:
         await callback.answer("❌ Ошибка отмены записи", show_alert=True)
 
 
-@router.callback_query(F.data == "back_to_bookings")
+@callbacks.route("back_to_bookings")
 async def back_to_bookings(callback: CallbackQuery):
     """Вернуться к списку записей"""
     bookings = await BookingDAO.get_user_bookings(callback.from_user.id)
@@ -443,4 +768,8 @@ async def cmd_cancel(message: Message, state: FSMContext):
     await message.answer(
         "❌ <b>Процесс записи отменен.</b>\n\nДля новой записи используйте /book",
         parse_mode='HTML'
-    )
\ No newline at end of file
+    )
+
+
+# Один обработчик callback-запросов с компактными данными для всего роутера
+callbacks.attach(router)
@@ -0,0 +1,55 @@
+# http_session.py - HTTP-сессия для Bot API: пул соединений, keep-alive и быстрый JSON
+import json
+from typing import Any
+
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from config import TELEGRAM_API_URL, API_POOL_SIZE, API_KEEPALIVE, API_TIMEOUT
+
+try:
+    import orjson
+except ImportError:  # orjson не обязателен: без него используется стандартный json
+    orjson = None
+
+
+if orjson is not None:
+    def json_dumps(obj: Any) -> str:
+        """Сериализация в JSON через orjson"""
+        return orjson.dumps(obj).decode()
+
+    json_loads = orjson.loads
+else:
+    def json_dumps(obj: Any) -> str:
+        """Сериализация в JSON (стандартный json, компактные разделители)"""
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+    json_loads = json.loads
+
+
+class TunedAiohttpSession(AiohttpSession):
+    """
+    AiohttpSession с настроенным пулом соединений: все запросы идут на один
+    хост Bot API, поэтому лимит на хост совпадает с общим, а соединения
+    держатся открытыми между запросами дольше стандартных 15 секунд.
+    """
+
+    def __init__(self, limit: int = API_POOL_SIZE, keepalive_timeout: float = API_KEEPALIVE, **kwargs: Any):
+        super().__init__(limit=limit, **kwargs)
+        self._connector_init.update(
+            limit_per_host=limit,
+            keepalive_timeout=keepalive_timeout,
+        )
+
+
+def create_session() -> TunedAiohttpSession:
+    """Сессия Bot API по настройкам из config.py"""
+    kwargs = {}
+    if TELEGRAM_API_URL:
+        kwargs["api"] = TelegramAPIServer.from_base(TELEGRAM_API_URL)
+    return TunedAiohttpSession(
+        json_loads=json_loads,
+        json_dumps=json_dumps,
+        timeout=API_TIMEOUT,
+        **kwargs
+    )
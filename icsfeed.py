@@ -0,0 +1,168 @@
+# icsfeed.py - Расписание барбера в формате iCalendar (.ics) по HTTP
+import hmac
+import logging
+import time as time_module
+from datetime import datetime, date as date_cls, time as time_cls, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterable, List, Optional, Tuple
+
+from aiohttp import web
+
+from config import BARBERSHOP_INFO, ICS_FEED_HOST, ICS_FEED_PORT, ICS_FEED_TOKEN, ICS_FEED_PAST_DAYS
+from database import BookingDAO, booking_change_listeners
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduleVersion:
+    """
+    Версия расписания: растет после каждого коммита, изменившего записи
+    (создание, отмена, отмена записей из-за выходного). Из нее строятся
+    ETag и Last-Modified фида, поэтому проверка «изменилось ли что-то»
+    не обращается к БД.
+    """
+
+    def __init__(self):
+        # Счетчик живет в памяти: метка запуска не дает ETag совпасть после перезапуска
+        self.boot = f"{int(time_module.time()):x}"
+        self.version = 0
+        self.changed_at = datetime.now(timezone.utc).replace(microsecond=0)
+
+    def bump(self, dates: Optional[Iterable[str]] = None) -> None:
+        self.version += 1
+        self.changed_at = datetime.now(timezone.utc).replace(microsecond=0)
+
+
+schedule_version = ScheduleVersion()
+booking_change_listeners.append(schedule_version.bump)
+
+
+def _escape(value: str) -> str:
+    """Экранирование TEXT по RFC 5545"""
+    return (
+        value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+        .replace("\r\n", "\\n").replace("\n", "\\n")
+    )
+
+
+def _fold(line: str) -> str:
+    """Перенос строк длиннее 75 октетов (продолжение начинается с пробела)"""
+    data = line.encode()
+    if len(data) <= 75:
+        return line
+    parts, start, limit = [], 0, 75
+    while start < len(data):
+        end = min(start + limit, len(data))
+        # Не разрезаем многобайтовый символ UTF-8
+        while end < len(data) and data[end] & 0xC0 == 0x80:
+            end -= 1
+        parts.append(data[start:end].decode())
+        start, limit = end, 74
+    return "\r\n ".join(parts)
+
+
+def build_ics(rows: List[Tuple[int, str, str, str, int, str, str]], stamp: datetime) -> bytes:
+    """Календарь из строк BookingDAO.get_schedule. Время - местное, без часового пояса"""
+    dtstamp = stamp.strftime("%Y%m%dT%H%M%SZ")
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//barbershop-bot//schedule//RU",
+        "CALSCALE:GREGORIAN",
+        f"X-WR-CALNAME:{_escape(BARBERSHOP_INFO['name'])}",
+    ]
+    for booking_id, booking_date, booking_time, service_name, duration, user_name, user_phone in rows:
+        start = datetime.strptime(f"{booking_date} {booking_time}", "%d.%m.%Y %H:%M")
+        end = start + timedelta(minutes=duration)
+        description = f"Телефон: {user_phone}\nЗапись №{booking_id}"
+        lines += [
+            "BEGIN:VEVENT",
+            f"UID:booking-{booking_id}@barbershop-bot",
+            f"DTSTAMP:{dtstamp}",
+            f"DTSTART:{start:%Y%m%dT%H%M%S}",
+            f"DTEND:{end:%Y%m%dT%H%M%S}",
+            f"SUMMARY:{_escape(f'{service_name}: {user_name}')}",
+            f"DESCRIPTION:{_escape(description)}",
+            "END:VEVENT",
+        ]
+    lines.append("END:VCALENDAR")
+    return ("\r\n".join(_fold(line) for line in lines) + "\r\n").encode()
+
+
+class IcsFeed:
+    """
+    HTTP-фид GET /schedule.ics?token=...: активные записи начиная с
+    ICS_FEED_PAST_DAYS дней назад.
+
+    ETag и Last-Modified берутся из schedule_version и текущей даты (окно
+    фида сдвигается в полночь). Календари, которые опрашивают фид каждые несколько минут,
+    получают 304 без запроса к БД; тело для текущей версии собирается один
+    раз и отдается из памяти, пока расписание не изменится.
+    """
+
+    def __init__(self, token: str = ICS_FEED_TOKEN, version: ScheduleVersion = schedule_version):
+        self.token = token
+        self.version = version
+        self._body: Optional[Tuple[str, bytes]] = None
+        self._runner: Optional[web.AppRunner] = None
+
+    def _validators(self, today: date_cls) -> Tuple[str, datetime]:
+        etag = f'"{self.version.boot}-{self.version.version}-{today:%Y%m%d}"'
+        # Окно фида сдвигается в полночь - содержимое меняется и без новых записей
+        midnight = datetime.combine(today, time_cls.min).astimezone(timezone.utc)
+        return etag, max(self.version.changed_at, midnight)
+
+    @staticmethod
+    def _not_modified(request: web.Request, etag: str, last_modified: datetime) -> bool:
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match is not None:
+            # If-None-Match важнее If-Modified-Since (RFC 9110)
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            return "*" in tags or etag in tags
+        if_modified_since = request.headers.get("If-Modified-Since")
+        if if_modified_since is not None:
+            try:
+                return last_modified <= parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    async def handle(self, request: web.Request) -> web.Response:
+        # Байты, а не str: compare_digest не принимает строки с не-ASCII символами
+        if not hmac.compare_digest(request.query.get("token", "").encode(), self.token.encode()):
+            raise web.HTTPNotFound()
+
+        today = datetime.now().date()
+        etag, last_modified = self._validators(today)
+        headers = {
+            "ETag": etag,
+            "Last-Modified": format_datetime(last_modified, usegmt=True),
+            "Cache-Control": "private, no-cache",
+        }
+        if self._not_modified(request, etag, last_modified):
+            return web.Response(status=304, headers=headers)
+
+        if self._body is None or self._body[0] != etag:
+            # Версия взята до запроса: изменение во время запроса даст новый ETag
+            start = today - timedelta(days=ICS_FEED_PAST_DAYS)
+            rows = await BookingDAO.get_schedule(start.strftime("%d.%m.%Y"))
+            self._body = (etag, build_ics(rows, self.version.changed_at))
+            logger.debug("ICS-фид собран: %d записей", len(rows))
+        return web.Response(body=self._body[1], content_type="text/calendar", charset="utf-8", headers=headers)
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/schedule.ics", self.handle)
+        return app
+
+    async def start(self, host: str = ICS_FEED_HOST, port: int = ICS_FEED_PORT) -> None:
+        """Запустить HTTP-сервер фида в текущем event loop"""
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info("ICS-фид: http://%s:%d/schedule.ics", host, port)
+
+    async def stop(self) -> None:
+        """Остановить HTTP-сервер фида"""
+        if self._runner is not None:
+            await self._runner.cleanup()
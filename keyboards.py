@@ -1,40 +1,168 @@
-from datetime import datetime, timedelta
-from typing import List
+import calendar
+from datetime import datetime, date as date_cls, timedelta
+from functools import lru_cache
+from typing import Callable, List, Optional, Type
+from aiogram.filters.callback_data import CallbackData
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
-from config import SERVICES, WORKING_HOURS, BOOKING_DAYS_AHEAD, TIME_BUTTONS_PER_ROW
-from database import BookingDAO, Booking
+from config import BOOKING_DAYS_AHEAD, DAYOFF_DAYS_AHEAD, TIME_BUTTONS_PER_ROW, NEAREST_SLOTS_COUNT
+from database import BookingView
+from dayoffs import day_offs, describe_rule
+import schedule
+from callbacks import (
+    DateCB,
+    MonthCB,
+    TimeCB,
+    BusyCB,
+    ServiceCB,
+    CancelBookingCB,
+    ConfirmCancelCB,
+    DayOffSelectCB,
+    DayOffMonthCB,
+    DayOffRemoveCB,
+    RuleRemoveCB,
+    NearestCB,
+    RepeatCB,
+    WaitlistBookCB,
+    WaitlistDeclineCB,
+    date_to_day,
+    date_to_month,
+    month_to_date,
+    time_to_minute,
+)
 
 
-async def get_date_keyboard() -> InlineKeyboardMarkup:
-    """Клавиатура выбора даты (исключая выходные дни)"""
-    from database import BarberDayOffDAO  # Импорт внутри функции, чтобы избежать циклического импорта
+MONTH_NAMES = [
+    "Январь", "Февраль", "Март", "Апрель", "Май", "Июнь",
+    "Июль", "Август", "Сентябрь", "Октябрь", "Ноябрь", "Декабрь"
+]
+WEEKDAY_SHORT = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+
+# Ячейка календаря без действия (пустая клетка, заголовок, недоступная листалка)
+NOOP = "cal_noop"
+
+# Ячейка дня: (дата, DD.MM.YYYY, свободных слотов или None для выходного) -> кнопка
+DayButton = Callable[[date_cls, str, Optional[int]], InlineKeyboardButton]
+
+
+async def get_month_calendar(
+    month: Optional[int],
+    first: date_cls,
+    last: date_cls,
+    page: Type[CallbackData],
+    day_button: DayButton
+) -> InlineKeyboardMarkup:
+    """
+    Календарь месяца: 7 колонок, листание по месяцам в пределах first..last.
+    Размер клавиатуры не зависит от горизонта - не больше 6 недель на странице.
+    Выходные берутся из индекса в памяти, занятость дней месяца - одним
+    запросом (или из кэша занятости). Дни вне first..last - пустые клетки.
+    """
+    from availability import free_slot_counts  # Импорт внутри функции, чтобы избежать циклического импорта
     
-    keyboard = []
-    today = datetime.now()
+    first_month, last_month = date_to_month(first), date_to_month(last)
+    month = min(max(month if month is not None else first_month, first_month), last_month)
+    start = month_to_date(month)
     
-    # Получаем все выходные дни
-    days_off = await BarberDayOffDAO.get_all()
-    days_off_dates = [day_off.date for day_off in days_off]
+    await day_offs.ensure_loaded()
+    slots = schedule.current().slots
     
-    for i in range(BOOKING_DAYS_AHEAD):
-        date = today + timedelta(days=i)
-        date_str = date.strftime("%d.%m.%Y")
-        
-        # Пропускаем выходные дни
-        if date_str in days_off_dates:
+    states = {}
+    working = []
+    for day in range(1, calendar.monthrange(start.year, start.month)[1] + 1):
+        date = start.replace(day=day)
+        if not first <= date <= last:
             continue
-        
-        day_name = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"][date.weekday()]
-        
-        if i == 0:
-            button_text = f"🔥 Сегодня ({date_str})"
-        elif i == 1:
-            button_text = f"⚡ Завтра ({date_str})"
+        date_str = date.strftime("%d.%m.%Y")
+        if day_offs.is_off(date_str) or not slots[date.weekday()]:
+            states[day] = (date, date_str, None)
         else:
-            button_text = f"{day_name} {date_str}"
-        
-        keyboard.append([InlineKeyboardButton(text=button_text, callback_data=f"date_{date_str}")])
+            working.append((day, date, date_str))
+    
+    # Свободные слоты по рабочим дням месяца одним запросом
+    free_counts = await free_slot_counts([date_str for _, _, date_str in working])
+    for day, date, date_str in working:
+        states[day] = (date, date_str, free_counts[date_str])
+    
+    blank = InlineKeyboardButton(text=" ", callback_data=NOOP)
+    keyboard = [
+        [InlineKeyboardButton(text=f"{MONTH_NAMES[start.month - 1]} {start.year}", callback_data=NOOP)],
+        [InlineKeyboardButton(text=name, callback_data=NOOP) for name in WEEKDAY_SHORT],
+    ]
+    for week in calendar.monthcalendar(start.year, start.month):
+        # Недели целиком вне first..last не показываем
+        if any(day in states for day in week):
+            keyboard.append([day_button(*states[day]) if day in states else blank for day in week])
+    
+    keyboard.append([
+        InlineKeyboardButton(text="◀️", callback_data=page(month=month - 1).pack()) if month > first_month else blank,
+        InlineKeyboardButton(text="▶️", callback_data=page(month=month + 1).pack()) if month < last_month else blank,
+    ])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+def _booking_day_button(date: date_cls, date_str: str, free: Optional[int]) -> InlineKeyboardButton:
+    if free is None:
+        return InlineKeyboardButton(text="✖", callback_data="date_off")
+    if not free:
+        return InlineKeyboardButton(text="🔴", callback_data="date_full")
+    return InlineKeyboardButton(text=f"{date.day}·{free}", callback_data=DateCB(day=date_to_day(date_str)).pack())
+
+
+async def get_date_keyboard(month: Optional[int] = None) -> InlineKeyboardMarkup:
+    """
+    Календарь выбора даты на горизонт записи: свободный день - «число·свободных
+    слотов», 🔴 - мест нет, ✖ - выходной или нерабочий по графику день
+    """
+    today = datetime.now().date()
+    keyboard = await get_month_calendar(
+        month, today, today + timedelta(days=BOOKING_DAYS_AHEAD - 1), MonthCB, _booking_day_button
+    )
+    keyboard.inline_keyboard.append(
+        [InlineKeyboardButton(text="⚡ Ближайшее свободное время", callback_data="nearest")]
+    )
+    return keyboard
+
+
+def _dayoff_day_button(date: date_cls, date_str: str, free: Optional[int]) -> InlineKeyboardButton:
+    if free is None:
+        return InlineKeyboardButton(text="✖", callback_data="dayoff_already")
+    # На занятый день выходной тоже можно поставить - записи будут отменены
+    text = str(date.day) if free else "🔴"
+    return InlineKeyboardButton(text=text, callback_data=DayOffSelectCB(day=date_to_day(date_str)).pack())
+
+
+async def get_dayoff_calendar(month: Optional[int] = None) -> InlineKeyboardMarkup:
+    """
+    Календарь выбора даты выходного: с завтрашнего дня на DAYOFF_DAYS_AHEAD
+    дней; 🔴 - все время занято, ✖ - уже выходной
+    """
+    tomorrow = datetime.now().date() + timedelta(days=1)
+    keyboard = await get_month_calendar(
+        month, tomorrow, tomorrow + timedelta(days=DAYOFF_DAYS_AHEAD - 1), DayOffMonthCB, _dayoff_day_button
+    )
+    keyboard.inline_keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="admin_back")])
+    return keyboard
+
+
+async def get_nearest_keyboard(limit: int = NEAREST_SLOTS_COUNT) -> Optional[InlineKeyboardMarkup]:
+    """Клавиатура ближайших свободных слотов (None, если свободных нет)"""
+    from availability import find_nearest  # Импорт внутри функции, чтобы избежать циклического импорта
+    
+    slots = await find_nearest(limit)
+    if not slots:
+        return None
+    
+    day_names = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+    keyboard = []
+    for date_str, time in slots:
+        date = datetime.strptime(date_str, "%d.%m.%Y")
+        keyboard.append([
+            InlineKeyboardButton(
+                text=f"{day_names[date.weekday()]} {date.strftime('%d.%m')} в {time}",
+                callback_data=NearestCB(day=date_to_day(date_str), minute=time_to_minute(time)).pack()
+            )
+        ])
     
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
@@ -44,18 +172,20 @@ async def get_time_keyboard(date: str) -> InlineKeyboardMarkup:
     keyboard = []
     row = []
     
-    for i, time in enumerate(WORKING_HOURS):
-        # Проверяем, занято ли время
-        existing_booking = await BookingDAO.get_by_date_time(date, time)
-        
-        if existing_booking:
+    from availability import load_occupancy  # Импорт внутри функции, чтобы избежать циклического импорта
+    
+    # Занятость слотов на дату (из кэша или одним запросом)
+    busy = (await load_occupancy([date]))[date]
+    
+    for i, time in enumerate(schedule.current().slots_for(date)):
+        if busy >> i & 1:
             # Занятое время - красная кнопка
             button_text = f"🔴 {time}"
-            callback_data = f"busy_{time}"
+            callback_data = BusyCB(minute=time_to_minute(time)).pack()
         else:
             # Свободное время
             button_text = time
-            callback_data = f"time_{time}"
+            callback_data = TimeCB(minute=time_to_minute(time)).pack()
         
         row.append(InlineKeyboardButton(text=button_text, callback_data=callback_data))
         
@@ -69,26 +199,66 @@ async def get_time_keyboard(date: str) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+_service_keyboard = (None, None)
+
+
 def get_service_keyboard() -> InlineKeyboardMarkup:
-    """Клавиатура выбора услуги"""
+    """Клавиатура выбора услуги (собирается один раз на каждую версию графика)"""
+    global _service_keyboard
+    current = schedule.current()
+    if _service_keyboard[0] is current:
+        return _service_keyboard[1]
+    
     keyboard = []
     
-    for service_id, service_info in SERVICES.items():
+    for service_id, service_info in current.services.items():
         button_text = (
-            f"{service_info['emoji']} {service_info['name']}\n"
-            f"💰 {service_info['price']}₽ | ⏱ {service_info['duration']} мин"
+            f"{service_info.emoji} {service_info.name}\n"
+            f"💰 {service_info.price}₽ | ⏱ {service_info.duration} мин"
         )
         keyboard.append([
             InlineKeyboardButton(
                 text=button_text,
-                callback_data=f"service_{service_id}"
+                callback_data=ServiceCB(service=service_id).pack()
             )
         ])
     
+    _service_keyboard = (current, InlineKeyboardMarkup(inline_keyboard=keyboard))
+    return _service_keyboard[1]
+
+
+def get_repeat_keyboard(date_str: str, time: str, service_id: str) -> Optional[InlineKeyboardMarkup]:
+    """Кнопка повтора записи: одно нажатие - запись на предложенный слот (None, если услуги больше нет)"""
+    service_info = schedule.get_service(service_id)
+    if service_info is None:
+        return None
+    
+    day_names = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+    date = datetime.strptime(date_str, "%d.%m.%Y")
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(
+            text=f"🔁 {service_info.emoji} {service_info.name}: {day_names[date.weekday()]} {date.strftime('%d.%m')} в {time}",
+            callback_data=RepeatCB(day=date_to_day(date_str), minute=time_to_minute(time), service=service_id).pack()
+        )
+    ]])
+
+
+def get_waitlist_offer_keyboard(entry_id: int) -> InlineKeyboardMarkup:
+    """Предложение освободившегося слота: запись в одно нажатие на услугу"""
+    keyboard = [
+        [InlineKeyboardButton(
+            text=f"{service_info.emoji} {service_info.name} · {service_info.price}₽",
+            callback_data=WaitlistBookCB(entry_id=entry_id, service=service_id).pack()
+        )]
+        for service_id, service_info in schedule.current().services.items()
+    ]
+    keyboard.append([
+        InlineKeyboardButton(text="❌ Не нужно", callback_data=WaitlistDeclineCB(entry_id=entry_id).pack())
+    ])
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
-def get_my_bookings_keyboard(bookings: List[Booking]) -> InlineKeyboardMarkup:
+def get_my_bookings_keyboard(bookings: List[BookingView]) -> InlineKeyboardMarkup:
     """Клавиатура со списком записей пользователя"""
     keyboard = []
     
@@ -97,7 +267,7 @@ def get_my_bookings_keyboard(bookings: List[Booking]) -> InlineKeyboardMarkup:
         keyboard.append([
             InlineKeyboardButton(
                 text=button_text,
-                callback_data=f"cancel_booking_{booking.id}"
+                callback_data=CancelBookingCB(booking_id=booking.id).pack()
             )
         ])
     
@@ -110,7 +280,7 @@ def get_cancel_confirm_keyboard(booking_id: int) -> InlineKeyboardMarkup:
         [
             InlineKeyboardButton(
                 text="✅ Да, отменить",
-                callback_data=f"confirm_cancel_{booking_id}"
+                callback_data=ConfirmCancelCB(booking_id=booking_id).pack()
             )
         ],
         [
@@ -123,8 +293,9 @@ def get_cancel_confirm_keyboard(booking_id: int) -> InlineKeyboardMarkup:
     
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
+@lru_cache(maxsize=1)
 def get_admin_keyboard() -> InlineKeyboardMarkup:
-    """Клавиатура администратора (барбера)"""
+    """Клавиатура администратора (барбера), статическая"""
     keyboard = [
         [
             InlineKeyboardButton(text="📅 Добавить выходной", callback_data="admin_add_dayoff"),
@@ -133,6 +304,13 @@ def get_admin_keyboard() -> InlineKeyboardMarkup:
         [
             InlineKeyboardButton(text="📋 Посмотреть выходные", callback_data="admin_view_dayoffs"),
             InlineKeyboardButton(text="👥 Активные записи", callback_data="admin_view_bookings")
+        ],
+        [
+            InlineKeyboardButton(text="🔁 Еженедельный выходной", callback_data="admin_weekly_dayoff"),
+            InlineKeyboardButton(text="📊 Отчет за неделю", callback_data="admin_report")
+        ],
+        [
+            InlineKeyboardButton(text="🕐 График и услуги", callback_data="admin_schedule")
         ]
     ]
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
@@ -140,9 +318,18 @@ def get_admin_keyboard() -> InlineKeyboardMarkup:
 
 async def get_dayoff_dates_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура с выходными днями для удаления"""
-    from database import BarberDayOffDAO  # Импорт внутри функции
+    from database import BarberDayOffDAO, BarberDayOffRuleDAO  # Импорт внутри функции
     
     keyboard = []
+    
+    for rule in await BarberDayOffRuleDAO.get_all():
+        keyboard.append([
+            InlineKeyboardButton(
+                text=f"❌ 🔁 {describe_rule(rule)}"[:64],
+                callback_data=RuleRemoveCB(rule_id=rule.id).pack()
+            )
+        ])
+    
     days_off = await BarberDayOffDAO.get_upcoming(20)
     
     for day_off in days_off:
@@ -153,7 +340,7 @@ async def get_dayoff_dates_keyboard() -> InlineKeyboardMarkup:
         keyboard.append([
             InlineKeyboardButton(
                 text=button_text,
-                callback_data=f"remove_dayoff_{day_off.date}"
+                callback_data=DayOffRemoveCB(day=date_to_day(day_off.date)).pack()
             )
         ])
     
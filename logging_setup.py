@@ -0,0 +1,80 @@
+# logging_setup.py - Неблокирующее структурированное логирование
+import json
+import logging
+import queue
+import sys
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+# Контекст текущего апдейта: update_id, user_id, handler
+log_context: ContextVar[Optional[Dict[str, Any]]] = ContextVar("log_context", default=None)
+
+# Поля контекста, которые попадают в каждую запись
+CONTEXT_FIELDS = ("update_id", "user_id", "handler", "queue_depth", "wait_ms", "duration_ms")
+
+# Стандартные атрибуты LogRecord, которые не нужно дублировать в JSON
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class ContextFilter(logging.Filter):
+    """Добавляет в запись поля контекста апдейта (выполняется в потоке, где пишется лог)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = log_context.get()
+        if context:
+            for field in CONTEXT_FIELDS:
+                if field in context and not hasattr(record, field):
+                    setattr(record, field, context[field])
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exc_info"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def setup_logging(level: str = "INFO", log_file: Optional[str] = None) -> QueueListener:
+    """
+    Настроить логирование через очередь: обработчики цикла событий только
+    кладут запись в очередь, а вывод в stdout/файл идет в фоновом потоке.
+    Возвращает запущенный QueueListener, его нужно остановить при выходе.
+    """
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    formatter = JsonFormatter()
+
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level)
+
+    # Вместо "Update id=... is handled" aiogram пишем свою запись с контекстом
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
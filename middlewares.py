@@ -0,0 +1,272 @@
+# middlewares.py - Middleware диспетчера
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.methods import AnswerCallbackQuery
+from aiogram.types import CallbackQuery, TelegramObject, Update
+
+from callbacks import IDEMPOTENT_PREFIXES
+from config import CALLBACK_DEDUP_TTL, CALLBACK_DEDUP_SIZE
+from logging_setup import log_context
+
+logger = logging.getLogger("bot.updates")
+
+
+class UpdateLoggingMiddleware(BaseMiddleware):
+    """Внешний middleware апдейтов: контекст для логов и длительность обработки"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        context = {"update_id": event.update_id, "user_id": user.id if user else None}
+        token = log_context.set(context)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            logger.exception("Ошибка обработки апдейта")
+            raise
+        finally:
+            context["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            logger.info("Апдейт обработан")
+            log_context.reset(token)
+
+
+class HandlerNameMiddleware(BaseMiddleware):
+    """Внутренний middleware событий: имя выбранного обработчика в контекст логов"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        context = log_context.get()
+        if context is not None:
+            route = data.get("callback_route")
+            if route is not None:
+                context["handler"] = route[0].__name__
+            elif "handler" in data:
+                context["handler"] = data["handler"].callback.__name__
+        return await handler(event, data)
+
+
+class UserSerialMiddleware(BaseMiddleware):
+    """
+    Внешний middleware апдейтов: апдейты одного пользователя обрабатываются
+    строго по очереди (двойное нажатие не запустит обработчик дважды
+    параллельно), разные пользователи - параллельно, но не больше
+    concurrency обработчиков одновременно.
+
+    Место в общем лимите занимается только после очереди пользователя:
+    апдейты, ждущие предыдущих апдейтов того же пользователя, места не
+    держат, и серия нажатий одного пользователя не задерживает остальных.
+    Глубина очереди пользователя и время ожидания пишутся в лог апдейта,
+    сводка за период - в отчет /profile (middleware передает себя
+    обработчикам как user_serial).
+    """
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._pending: Dict[int, int] = {}
+        self._slots = asyncio.Semaphore(concurrency)
+        self.in_flight = 0
+        self.max_queued = 0
+        self.max_wait = 0.0
+        self._waited = 0
+        self._wait_total = 0.0
+
+    @property
+    def queued(self) -> int:
+        """Апдейты, ожидающие предыдущих апдейтов того же пользователя или свободного места"""
+        return sum(self._pending.values()) - self.in_flight
+
+    def stats(self) -> Dict[str, float]:
+        """Очередь обработчиков с прошлого вызова: счетчики за период сбрасываются"""
+        stats = {
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "updates": self._waited,
+            "avg_wait": self._wait_total / self._waited * 1000 if self._waited else 0.0,
+            "max_wait": self.max_wait * 1000,
+        }
+        self.max_queued = self.queued
+        self.max_wait = self._wait_total = 0.0
+        self._waited = 0
+        return stats
+
+    def _record_wait(self, wait: float) -> None:
+        self.max_wait = max(self.max_wait, wait)
+        self._wait_total += wait
+        self._waited += 1
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        data["user_serial"] = self
+        user = data.get("event_from_user")
+        if user is None:
+            async with self._slots:
+                return await handler(event, data)
+
+        lock = self._locks.get(user.id)
+        if lock is None:
+            lock = self._locks[user.id] = asyncio.Lock()
+        depth = self._pending.get(user.id, 0)
+        self._pending[user.id] = depth + 1
+        self.max_queued = max(self.max_queued, self.queued)
+        started = time.perf_counter()
+        try:
+            async with lock, self._slots:
+                wait = time.perf_counter() - started
+                self._record_wait(wait)
+                context = log_context.get()
+                if context is not None:
+                    context["queue_depth"] = depth
+                    context["wait_ms"] = round(wait * 1000, 2)
+                # FSM-состояние прочитано до ожидания: предыдущий апдейт мог его сменить
+                fsm = data.get("state")
+                if depth and fsm is not None:
+                    data["raw_state"] = await fsm.get_state()
+                self.in_flight += 1
+                try:
+                    return await handler(event, data)
+                finally:
+                    self.in_flight -= 1
+        finally:
+            # Очередь пользователя больше не нужна - освобождаем память
+            self._pending[user.id] -= 1
+            if not self._pending[user.id]:
+                del self._pending[user.id]
+                del self._locks[user.id]
+
+
+# Ответ на callback-запрос: (текст, show_alert)
+CallbackAnswer = Tuple[Optional[str], Optional[bool]]
+CallbackKey = Tuple[int, int, str]
+
+# Куда записать ответ текущего обрабатываемого callback-запроса
+_answer_sink: ContextVar[Optional[Dict[str, Any]]] = ContextVar("callback_answer_sink", default=None)
+
+
+class CallbackAnswerRecorder:
+    """
+    Middleware сессии бота: запоминает ответ answerCallbackQuery обработчика,
+    который выполняет CallbackIdempotencyMiddleware, чтобы повторить этот
+    ответ на повторное нажатие. Регистрируется через bot.session.middleware
+    """
+
+    async def __call__(self, make_request, bot, method):
+        sink = _answer_sink.get()
+        if sink is not None and isinstance(method, AnswerCallbackQuery) and method.callback_query_id == sink["id"]:
+            sink["answer"] = (method.text, method.show_alert)
+        return await make_request(bot, method)
+
+
+class CallbackIdempotencyMiddleware(BaseMiddleware):
+    """
+    Внешний middleware callback-запросов: действие с побочным эффектом
+    (префикс из callbacks.IDEMPOTENT_PREFIXES) выполняется один раз на
+    кнопку. Ключ - (чат, message_id, callback_data).
+
+    Повтор, пришедший во время обработки первого нажатия, ждет его
+    результата; повтор после - сразу получает тот же ответ из кэша. Кэш
+    ограничен по времени (CALLBACK_DEDUP_TTL) и размеру (CALLBACK_DEDUP_SIZE).
+    Если обработчик упал, ключ не запоминается и повтор выполняется заново.
+
+    Внешний, а не внутренний: обработчики, привязанные к состоянию FSM,
+    после первого нажатия уже не подходят, и повтор иначе остался бы без ответа.
+    """
+
+    def __init__(self, ttl: float = CALLBACK_DEDUP_TTL, max_size: int = CALLBACK_DEDUP_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._done: "OrderedDict[CallbackKey, Tuple[float, CallbackAnswer]]" = OrderedDict()
+        self._in_flight: Dict[CallbackKey, asyncio.Future] = {}
+        self.duplicates = 0
+
+    @staticmethod
+    def _key(event: CallbackQuery) -> Optional[CallbackKey]:
+        if event.message is None or not event.data:
+            return None
+        if event.data.partition(":")[0] not in IDEMPOTENT_PREFIXES:
+            return None
+        return event.message.chat.id, event.message.message_id, event.data
+
+    def _cached(self, key: CallbackKey) -> Optional[CallbackAnswer]:
+        now = time.monotonic()
+        # Записи упорядочены по времени - устаревшие в начале
+        while self._done:
+            oldest, (stored, _) = next(iter(self._done.items()))
+            if now - stored < self.ttl:
+                break
+            del self._done[oldest]
+        entry = self._done.get(key)
+        return entry[1] if entry is not None else None
+
+    def _remember(self, key: CallbackKey, answer: CallbackAnswer) -> None:
+        self._done[key] = (time.monotonic(), answer)
+        if len(self._done) > self.max_size:
+            self._done.popitem(last=False)
+
+    async def _repeat(self, event: CallbackQuery, answer: CallbackAnswer) -> None:
+        self.duplicates += 1
+        context = log_context.get()
+        if context is not None:
+            context["duplicate"] = True
+        text, show_alert = answer
+        await event.answer(text, show_alert=show_alert)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: CallbackQuery,
+        data: Dict[str, Any]
+    ) -> Any:
+        key = self._key(event)
+        if key is None:
+            return await handler(event, data)
+
+        answer = self._cached(key)
+        if answer is not None:
+            return await self._repeat(event, answer)
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            answer = await asyncio.shield(pending)
+            if answer is not None:
+                return await self._repeat(event, answer)
+            # Первое нажатие упало - выполняем повтор как обычно
+            return await handler(event, data)
+
+        # Результат первого нажатия для повторов: ответ или None при ошибке
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        sink = {"id": event.id, "answer": None}
+        token = _answer_sink.set(sink)
+        try:
+            result = await handler(event, data)
+            # Обработчик мог не отвечать на callback - повтор просто гасит часики
+            answer = sink["answer"] or (None, None)
+            self._remember(key, answer)
+            future.set_result(answer)
+            return result
+        finally:
+            _answer_sink.reset(token)
+            del self._in_flight[key]
+            if not future.done():
+                future.set_result(None)
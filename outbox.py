@@ -0,0 +1,163 @@
+# outbox.py - Фоновая отправка уведомлений из таблицы outbox
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional, Set
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+
+from config import OUTBOX_BATCH_SIZE, OUTBOX_MAX_ATTEMPTS, OUTBOX_POLL_INTERVAL
+from database import OutboxDAO, OutboxMessage, outbox_listeners, outbox_delays
+
+logger = logging.getLogger(__name__)
+
+# Максимальная пауза между повторами при сетевых ошибках, секунд
+MAX_RETRY_DELAY = 300
+
+# Лимит длины сообщения Telegram и разделитель уведомлений в общем сообщении
+MESSAGE_LIMIT = 4096
+SEPARATOR = "\n\n➖➖➖➖➖\n\n"
+
+
+def cancel_out(messages: List[OutboxMessage]) -> Set[int]:
+    """
+    id уведомлений, которые не нужно отправлять: запись создана и отменена
+    в пределах одного окна - барберу не о чем сообщать
+    """
+    statuses = defaultdict(set)
+    for message in messages:
+        if message.booking_id is not None:
+            statuses[message.booking_id].add(message.booking_status)
+    cancelled = {booking_id for booking_id, seen in statuses.items() if {"active", "cancelled"} <= seen}
+    return {message.id for message in messages if message.booking_id in cancelled}
+
+
+def merge(messages: List[OutboxMessage]) -> List[List[OutboxMessage]]:
+    """Разбить уведомления на сообщения не длиннее MESSAGE_LIMIT (по порядку)"""
+    chunks: List[List[OutboxMessage]] = []
+    length = 0
+    for message in messages:
+        added = len(message.text) + len(SEPARATOR)
+        if (
+            chunks and length + added <= MESSAGE_LIMIT - 64
+            and chunks[-1][0].parse_mode == message.parse_mode
+        ):
+            chunks[-1].append(message)
+            length += added
+        else:
+            chunks.append([message])
+            length = len(message.text)
+    return chunks
+
+
+def merged_text(messages: List[OutboxMessage]) -> str:
+    if len(messages) == 1:
+        return messages[0].text
+    return f"🔔 <b>Событий: {len(messages)}</b>\n\n" + SEPARATOR.join(message.text.strip() for message in messages)
+
+
+class OutboxWorker:
+    """
+    Воркер outbox: забирает неотправленные уведомления пачками, отправляет
+    и отмечает доставленными. Просыпается сразу после коммита с новыми
+    уведомлениями, а для повторов - раз в OUTBOX_POLL_INTERVAL секунд.
+
+    Уведомления о записях в чаты из coalesce ({chat_id: окно в секундах})
+    ждут окно и уходят одним сообщением вместе со всеми накопленными в этот
+    чат; запись, созданная и отмененная в одном окне, не попадает в сообщение
+    совсем. Сообщения не о записи (утренняя сводка) уходят сразу и отдельно.
+
+    Ошибки Telegram: 429 - повтор через retry_after; бот заблокирован или
+    неверный запрос - уведомление помечается failed; остальное (сеть) -
+    повтор с экспоненциальной паузой, не больше OUTBOX_MAX_ATTEMPTS попыток.
+    """
+
+    def __init__(self, bot: Bot, batch_size: int = OUTBOX_BATCH_SIZE, coalesce: Optional[Dict[int, float]] = None):
+        self.bot = bot
+        self.batch_size = batch_size
+        self.coalesce = coalesce or {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        outbox_listeners.append(self._wakeup.set)
+        outbox_delays.update(self.coalesce)
+
+    async def _send(self, messages: List[OutboxMessage]) -> bool:
+        """Отправить уведомления одним сообщением; при ошибке отметить попытку у всех"""
+        first = messages[0]
+        ids = [message.id for message in messages]
+        try:
+            await self.bot.send_message(chat_id=first.chat_id, text=merged_text(messages), parse_mode=first.parse_mode)
+            return True
+        except TelegramRetryAfter as e:
+            await OutboxDAO.mark_failed(ids, str(e), e.retry_after)
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            logger.warning("Уведомления %s не доставлены: %s", ids, e)
+            await OutboxDAO.mark_failed(ids, str(e), None)
+        except Exception as e:
+            attempt = max(message.attempts for message in messages) + 1
+            retry_in = min(2 ** attempt, MAX_RETRY_DELAY) if attempt < OUTBOX_MAX_ATTEMPTS else None
+            logger.exception("Ошибка отправки уведомлений %s (попытка %d)", ids, attempt)
+            await OutboxDAO.mark_failed(ids, f"{type(e).__name__}: {e}", retry_in)
+        return False
+
+    async def _send_coalesced(self, chat_id: int, due: List[OutboxMessage]) -> List[int]:
+        """Все накопленные уведомления в чат - одним сообщением. Возвращает обработанные id"""
+        messages = {message.id: message for message in await OutboxDAO.get_pending(chat_id)}
+        messages.update((message.id, message) for message in due)
+        messages = sorted(messages.values(), key=lambda message: message.id)
+
+        skipped = cancel_out(messages)
+        if skipped:
+            logger.info("Уведомления %s сокращены: запись создана и отменена в одном окне", sorted(skipped))
+        done = list(skipped)
+        for chunk in merge([message for message in messages if message.id not in skipped]):
+            if await self._send(chunk):
+                done += [message.id for message in chunk]
+        return done
+
+    async def drain_once(self) -> int:
+        """Отправить одну пачку. Возвращает количество взятых уведомлений"""
+        messages = await OutboxDAO.get_due(self.batch_size)
+        sent = []
+        coalesced = defaultdict(list)
+        for message in messages:
+            if message.chat_id in self.coalesce and message.booking_id is not None:
+                coalesced[message.chat_id].append(message)
+            elif await self._send([message]):
+                sent.append(message.id)
+        for chat_id, due in coalesced.items():
+            sent += await self._send_coalesced(chat_id, due)
+        await OutboxDAO.mark_sent(sent)
+        return len(messages)
+
+    async def run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                taken = await self.drain_once()
+            except Exception:
+                logger.exception("Ошибка обработки outbox")
+                taken = 0
+            if taken >= self.batch_size:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        """Запустить воркер фоновой задачей"""
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self) -> None:
+        """Остановить воркер"""
+        outbox_listeners.remove(self._wakeup.set)
+        for chat_id in self.coalesce:
+            outbox_delays.pop(chat_id, None)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
@@ -0,0 +1,126 @@
+# schedule.py - График работы и услуги, скомпилированные в неизменяемые таблицы слотов
+from datetime import datetime
+from types import MappingProxyType, SimpleNamespace
+from typing import Mapping, NamedTuple, Optional, Tuple
+
+from config import SERVICES, WORKING_HOURS
+from database import ScheduleDAO
+
+
+class ServiceInfo(NamedTuple):
+    code: str
+    name: str
+    price: int
+    duration: int
+    emoji: str
+
+
+class Schedule(NamedTuple):
+    """
+    Скомпилированный график: по дню недели (0 - понедельник) кортеж слотов
+    HH:MM и их индексы, плюс активные услуги в порядке показа.
+    Объект неизменяемый; при изменении настроек собирается новый и
+    подменяется одной операцией присваивания.
+    """
+    slots: Tuple[Tuple[str, ...], ...]
+    slot_index: Tuple[Mapping[str, int], ...]
+    services: Mapping[str, ServiceInfo]
+
+    def slots_for(self, date_str: str) -> Tuple[str, ...]:
+        """Слоты на дату DD.MM.YYYY"""
+        return self.slots[datetime.strptime(date_str, "%d.%m.%Y").weekday()]
+
+    def is_slot(self, date_str: str, time: str) -> bool:
+        """Есть ли такой слот в графике на дату"""
+        return time in self.slot_index[datetime.strptime(date_str, "%d.%m.%Y").weekday()]
+
+
+def _minutes(time: str) -> int:
+    hours, minutes = time.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def build_slots(start_time: str, end_time: str, slot_step: int) -> Tuple[str, ...]:
+    """Слоты с шагом slot_step от start_time до end_time включительно"""
+    start, end = _minutes(start_time), _minutes(end_time)
+    return tuple(f"{m // 60:02d}:{m % 60:02d}" for m in range(start, end + 1, max(slot_step, 5)))
+
+
+def compile_schedule(working_hours, services) -> Schedule:
+    """Собрать неизменяемый график из строк БД"""
+    by_weekday = {row.weekday: row for row in working_hours}
+    slots = []
+    for weekday in range(7):
+        row = by_weekday.get(weekday)
+        if row is None or not row.is_working:
+            slots.append(())
+        else:
+            slots.append(build_slots(row.start_time, row.end_time, row.slot_step))
+
+    return Schedule(
+        slots=tuple(slots),
+        slot_index=tuple(MappingProxyType({time: i for i, time in enumerate(day)}) for day in slots),
+        services=MappingProxyType({
+            service.code: ServiceInfo(service.code, service.name, service.price, service.duration, service.emoji)
+            for service in services
+            if service.is_active
+        }),
+    )
+
+
+def default_rows():
+    """Значения по умолчанию из config.py для первого запуска"""
+    step = _minutes(WORKING_HOURS[1]) - _minutes(WORKING_HOURS[0]) if len(WORKING_HOURS) > 1 else 30
+    working_hours = [
+        {
+            "weekday": weekday,
+            "start_time": WORKING_HOURS[0],
+            "end_time": WORKING_HOURS[-1],
+            "slot_step": step,
+            "is_working": True,
+        }
+        for weekday in range(7)
+    ]
+    services = [
+        {"code": code, "sort_order": i, "is_active": True, **info}
+        for i, (code, info) in enumerate(SERVICES.items())
+    ]
+    return working_hours, services
+
+
+def _compile_defaults() -> Schedule:
+    working_hours, services = default_rows()
+    return compile_schedule(
+        [SimpleNamespace(**row) for row in working_hours],
+        [SimpleNamespace(**row) for row in services],
+    )
+
+
+# Текущий график. До загрузки из БД совпадает с config.py
+_current: Schedule = _compile_defaults()
+
+
+def current() -> Schedule:
+    """Текущий скомпилированный график"""
+    return _current
+
+
+async def reload() -> Schedule:
+    """Перечитать график из БД и атомарно подменить текущий"""
+    global _current
+    compiled = compile_schedule(await ScheduleDAO.get_working_hours(), await ScheduleDAO.get_services())
+    _current = compiled
+    return compiled
+
+
+async def init(seed: bool = True) -> Schedule:
+    """Заполнить график значениями из config.py при первом запуске и загрузить его"""
+    if seed:
+        working_hours, services = default_rows()
+        await ScheduleDAO.seed_defaults(working_hours, services)
+    return await reload()
+
+
+def get_service(code: str) -> Optional[ServiceInfo]:
+    """Активная услуга по коду"""
+    return _current.services.get(code)
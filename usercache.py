@@ -0,0 +1,159 @@
+# usercache.py - LRU-кэш профилей и активных записей пользователей
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+from config import USER_CACHE_SIZE, USER_CACHE_TTL
+
+# Значение еще не загружено (None - загружено, но пользователя нет)
+MISSING = object()
+
+
+class _Entry:
+    __slots__ = ("user", "bookings", "touched")
+
+    def __init__(self):
+        self.user: Any = MISSING
+        self.bookings: Any = MISSING
+        self.touched = 0.0
+
+
+class UserCache:
+    """
+    Профили и списки активных записей по telegram_id.
+
+    Кэш сквозной записи: DAO обновляют его сразу после коммита, поэтому
+    повторная навигация по /book и /my_bookings не ходит в БД. Размер
+    ограничен (вытесняется давно не использованный пользователь), запись
+    без обращений дольше ttl секунд считается устаревшей.
+    """
+
+    def __init__(self, max_size: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._booking_owner: Dict[int, int] = {}
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+
+    def version(self) -> int:
+        """
+        Версия кэша на момент начала чтения из БД. Если за время запроса
+        кэш изменился, прочитанное значение может быть устаревшим и не сохраняется.
+        """
+        return self._version
+
+    def _expire(self, now: float) -> None:
+        # Порядок OrderedDict совпадает с порядком обращений: старые - в начале
+        while self._entries:
+            telegram_id, entry = next(iter(self._entries.items()))
+            if now - entry.touched <= self.ttl and len(self._entries) <= self.max_size:
+                break
+            self._drop(telegram_id)
+
+    def _drop(self, telegram_id: int) -> None:
+        entry = self._entries.pop(telegram_id, None)
+        if entry is not None and entry.bookings is not MISSING:
+            for booking in entry.bookings:
+                self._booking_owner.pop(booking.id, None)
+
+    def _entry(self, telegram_id: int, create: bool = False) -> Optional[_Entry]:
+        now = time.monotonic()
+        self._expire(now)
+        entry = self._entries.get(telegram_id)
+        if entry is None:
+            if not create:
+                return None
+            entry = self._entries[telegram_id] = _Entry()
+        self._entries.move_to_end(telegram_id)
+        entry.touched = now
+        return entry
+
+    def _count(self, value: Any) -> Any:
+        if value is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    # Профили
+
+    def get_user(self, telegram_id: int) -> Any:
+        """Профиль из кэша, None если пользователя нет, MISSING если не загружен"""
+        entry = self._entry(telegram_id)
+        return self._count(entry.user if entry else MISSING)
+
+    def put_user(self, telegram_id: int, user: Any, version: Optional[int] = None) -> None:
+        """Сохранить профиль (после чтения - только если кэш не менялся)"""
+        if version is not None and version != self._version:
+            return
+        self._entry(telegram_id, create=True).user = user
+        self._expire(time.monotonic())
+
+    def set_user(self, telegram_id: int, user: Any) -> None:
+        """Записать профиль после изменения в БД"""
+        self._version += 1
+        self.put_user(telegram_id, user)
+
+    # Активные записи
+
+    def get_bookings(self, telegram_id: int) -> Any:
+        """Активные записи пользователя или MISSING"""
+        entry = self._entry(telegram_id)
+        return self._count(entry.bookings if entry else MISSING)
+
+    def put_bookings(self, telegram_id: int, bookings: List[Any], version: Optional[int] = None) -> None:
+        """Сохранить список активных записей, прочитанный из БД"""
+        if version is not None and version != self._version:
+            return
+        entry = self._entry(telegram_id, create=True)
+        entry.bookings = list(bookings)
+        for booking in entry.bookings:
+            self._booking_owner[booking.id] = telegram_id
+        self._expire(time.monotonic())
+
+    def get_booking(self, booking_id: int) -> Any:
+        """Активная запись по id, если список ее владельца в кэше"""
+        telegram_id = self._booking_owner.get(booking_id)
+        if telegram_id is None:
+            return self._count(MISSING)
+        entry = self._entry(telegram_id)
+        if entry is None or entry.bookings is MISSING:
+            return self._count(MISSING)
+        for booking in entry.bookings:
+            if booking.id == booking_id:
+                return self._count(booking)
+        return self._count(MISSING)
+
+    def add_booking(self, booking: Any) -> None:
+        """Новая активная запись (список обновляется, только если он уже загружен)"""
+        self._version += 1
+        entry = self._entries.get(booking.user_telegram_id)
+        if entry is None or entry.bookings is MISSING:
+            return
+        entry.bookings = sorted(
+            entry.bookings + [booking],
+            key=lambda item: (item.booking_date, item.booking_time)
+        )
+        self._booking_owner[booking.id] = booking.user_telegram_id
+
+    def remove_bookings(self, bookings: Iterable[Any]) -> None:
+        """Убрать отмененные записи из списков активных"""
+        self._version += 1
+        for booking in bookings:
+            self._booking_owner.pop(booking.id, None)
+            entry = self._entries.get(booking.user_telegram_id)
+            if entry is None or entry.bookings is MISSING:
+                continue
+            entry.bookings = [item for item in entry.bookings if item.id != booking.id]
+
+    def clear(self) -> None:
+        """Сбросить кэш целиком"""
+        self._version += 1
+        self._entries.clear()
+        self._booking_owner.clear()
+
+
+# Общий кэш для всех DAO
+user_cache = UserCache()
@@ -0,0 +1,68 @@
+# waitlist.py - Предложения освободившихся слотов клиентам из листа ожидания
+import asyncio
+import logging
+from datetime import datetime
+from typing import List, Optional, Set
+
+from aiogram import Bot
+
+from config import WAITLIST_HOLD_MINUTES
+from database import WaitlistDAO, WaitlistEntry, slot_hold_listeners
+from dayoffs import day_offs
+from keyboards import get_waitlist_offer_keyboard
+
+logger = logging.getLogger(__name__)
+
+_bot: Optional[Bot] = None
+# Ссылки на фоновые задачи, чтобы их не собрал сборщик мусора
+_tasks: Set[asyncio.Task] = set()
+
+
+def _on_holds(entries: List[WaitlistEntry]) -> None:
+    """Слоты закреплены в БД: отправить предложения и запустить таймеры закрепления"""
+    for entry in entries:
+        task = asyncio.get_running_loop().create_task(_offer(entry))
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+
+
+slot_hold_listeners.append(_on_holds)
+
+
+async def _offer(entry: WaitlistEntry) -> None:
+    if _bot is None:
+        logger.warning("Бот для листа ожидания не задан, предложение %s не отправлено", entry.id)
+    else:
+        try:
+            await _bot.send_message(
+                chat_id=entry.user_telegram_id,
+                text=(
+                    f"🔔 <b>Освободилось время!</b>\n\n"
+                    f"📅 <b>Дата:</b> {entry.slot_date}\n"
+                    f"🕐 <b>Время:</b> {entry.slot_time}\n\n"
+                    f"Слот закреплен за вами на {WAITLIST_HOLD_MINUTES} мин. "
+                    f"Выберите услугу, чтобы записаться:"
+                ),
+                reply_markup=get_waitlist_offer_keyboard(entry.id),
+                parse_mode='HTML'
+            )
+        except Exception:
+            logger.exception("Ошибка отправки предложения из листа ожидания")
+            # Клиент недоступен - слот сразу переходит следующему
+            await WaitlistDAO.release(entry.id)
+            return
+
+    # По истечении закрепления слот переходит следующему в очереди
+    delay = (entry.hold_until - datetime.utcnow()).total_seconds()
+    await asyncio.sleep(max(delay, 0))
+    await WaitlistDAO.release(entry.id, expired_only=True)
+
+
+async def setup(bot: Bot) -> None:
+    """Задать бота для предложений и передать дальше слоты, закрепление которых истекло, пока бот был остановлен"""
+    global _bot
+    _bot = bot
+    await day_offs.ensure_loaded()
+    expired_dates = [date for date in await WaitlistDAO.get_expired_dates() if not day_offs.is_off(date)]
+    if expired_dates:
+        await WaitlistDAO.hold_free_slots(expired_dates)